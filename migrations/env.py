@@ -51,6 +51,21 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Omite los objetos condicionados con ddl_if a otro dialecto.
+
+    Los índices parciales de PostgreSQL (idx_*_vigente_*, idx_*_pendiente_*)
+    no existen en SQLite; sin esto autogenerate los propone como nuevos.
+    """
+    ddl_if = getattr(object, '_ddl_if', None)
+    if ddl_if is not None and ddl_if.dialect is not None:
+        dialecto = context.get_context().dialect.name
+        permitidos = (ddl_if.dialect,) if isinstance(ddl_if.dialect, str) else ddl_if.dialect
+        if dialecto not in permitidos:
+            return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +80,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +109,8 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
@@ -0,0 +1,59 @@
+"""fichaje abierto unico por usuario e idempotencia del reloj
+
+Revision ID: 3f1c9a7d2e41
+Revises: ae8bd2a26bb2
+Create Date: 2026-10-19 09:12:04.318275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2e41'
+down_revision = 'ae8bd2a26bb2'
+branch_labels = None
+depends_on = None
+
+FICHAJE_ABIERTO = "hora_salida IS NULL AND es_actual AND tipo_accion <> 'eliminacion'"
+
+
+def upgrade():
+    # Antes de crear el índice único: si algún usuario tiene varios fichajes
+    # abiertos (carreras del toggle anterior), se deja abierto solo el más
+    # reciente y el resto se cierra como incidencia, igual que el cierre nocturno.
+    op.execute(sa.text(f"""
+        UPDATE fichajes
+        SET hora_salida = '23:59:59',
+            motivo_rectificacion = 'CIERRE AUTOMÁTICO (FICHAJE ABIERTO DUPLICADO) - PENDIENTE DE REVISAR'
+        WHERE {FICHAJE_ABIERTO}
+          AND id NOT IN (
+              SELECT MAX(id) FROM fichajes WHERE {FICHAJE_ABIERTO} GROUP BY usuario_id
+          )
+    """))
+
+    with op.batch_alter_table('fichajes', schema=None) as batch_op:
+        batch_op.create_index('uq_fichaje_abierto_usuario', ['usuario_id'], unique=True,
+                              postgresql_where=sa.text(FICHAJE_ABIERTO),
+                              sqlite_where=sa.text(FICHAJE_ABIERTO))
+
+    op.create_table('idempotencia_fichajes',
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('clave', sa.String(length=64), nullable=False),
+    sa.Column('respuesta', sa.JSON(), nullable=False),
+    sa.Column('fecha_creacion', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('usuario_id', 'clave')
+    )
+    with op.batch_alter_table('idempotencia_fichajes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotencia_fichajes_fecha_creacion'), ['fecha_creacion'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('idempotencia_fichajes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotencia_fichajes_fecha_creacion'))
+
+    op.drop_table('idempotencia_fichajes')
+
+    with op.batch_alter_table('fichajes', schema=None) as batch_op:
+        batch_op.drop_index('uq_fichaje_abierto_usuario')
@@ -0,0 +1,40 @@
+"""eventos de terminales de fichaje (api punches)
+
+Revision ID: 8b4e2c61f0a9
+Revises: 3f1c9a7d2e41
+Create Date: 2026-10-19 11:40:27.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e2c61f0a9'
+down_revision = '3f1c9a7d2e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('eventos_terminal',
+    sa.Column('dispositivo', sa.String(length=64), nullable=False),
+    sa.Column('evento_id', sa.String(length=64), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('momento', sa.DateTime(), nullable=False),
+    sa.Column('sentido', sa.String(length=3), nullable=False),
+    sa.Column('resultado', sa.String(length=20), nullable=False),
+    sa.Column('grupo_id', sa.String(length=36), nullable=True),
+    sa.Column('fecha_recepcion', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('dispositivo', 'evento_id')
+    )
+    with op.batch_alter_table('eventos_terminal', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_eventos_terminal_grupo_id'), ['grupo_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('eventos_terminal', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_eventos_terminal_grupo_id'))
+
+    op.drop_table('eventos_terminal')
@@ -0,0 +1,57 @@
+"""tabla de cierre de la jerarquia de aprobacion
+
+Revision ID: a7d3e9f2c5b8
+Revises: f6c2d8e1a3b7
+Create Date: 2026-10-19 20:14:37.905218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e9f2c5b8'
+down_revision = 'f6c2d8e1a3b7'
+branch_labels = None
+depends_on = None
+
+# Mismo tope que src/hierarchy.py (corta ciclos en 'aprobadores')
+MAX_PROFUNDIDAD = 32
+
+
+def upgrade():
+    op.create_table('jerarquia_aprobacion',
+    sa.Column('ancestro_id', sa.Integer(), nullable=False),
+    sa.Column('descendiente_id', sa.Integer(), nullable=False),
+    sa.Column('profundidad', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestro_id'], ['usuarios.id'], ),
+    sa.ForeignKeyConstraint(['descendiente_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('ancestro_id', 'descendiente_id')
+    )
+    with op.batch_alter_table('jerarquia_aprobacion', schema=None) as batch_op:
+        batch_op.create_index('idx_jerarquia_ancestro', ['ancestro_id', 'profundidad', 'descendiente_id'], unique=False)
+        batch_op.create_index('idx_jerarquia_descendiente', ['descendiente_id'], unique=False)
+
+    # Relleno inicial desde las relaciones existentes (WITH RECURSIVE: SQLite y PostgreSQL)
+    op.execute(f"""
+        INSERT INTO jerarquia_aprobacion (ancestro_id, descendiente_id, profundidad)
+        WITH RECURSIVE cadena(ancestro_id, descendiente_id, profundidad) AS (
+            SELECT aprobador_id, usuario_id, 1 FROM aprobadores
+            UNION
+            SELECT a.aprobador_id, c.descendiente_id, c.profundidad + 1
+            FROM aprobadores a JOIN cadena c ON a.usuario_id = c.ancestro_id
+            WHERE c.profundidad < {MAX_PROFUNDIDAD}
+        )
+        SELECT ancestro_id, descendiente_id, MIN(profundidad)
+        FROM cadena
+        WHERE ancestro_id <> descendiente_id
+        GROUP BY ancestro_id, descendiente_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('jerarquia_aprobacion', schema=None) as batch_op:
+        batch_op.drop_index('idx_jerarquia_descendiente')
+        batch_op.drop_index('idx_jerarquia_ancestro')
+
+    op.drop_table('jerarquia_aprobacion')
@@ -0,0 +1,30 @@
+"""limite de ausencias simultaneas por equipo
+
+Revision ID: b8e4f1a6d2c9
+Revises: a7d3e9f2c5b8
+Create Date: 2026-10-19 21:02:11.418530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4f1a6d2c9'
+down_revision = 'a7d3e9f2c5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('limites_ausencias_equipo',
+    sa.Column('aprobador_id', sa.Integer(), nullable=False),
+    sa.Column('max_ausentes', sa.Integer(), nullable=False),
+    sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['aprobador_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('aprobador_id')
+    )
+
+
+def downgrade():
+    op.drop_table('limites_ausencias_equipo')
@@ -0,0 +1,33 @@
+"""sugerencias de horario precalculadas por usuario
+
+Revision ID: c27d5e8a4b13
+Revises: 8b4e2c61f0a9
+Create Date: 2026-10-19 13:05:51.447120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27d5e8a4b13'
+down_revision = '8b4e2c61f0a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Se rellena sola: al abrir el formulario (por usuario) o con el job nocturno /
+    # 'flask recalcular-sugerencias'
+    op.create_table('sugerencias_fichaje',
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('referencia', sa.Date(), nullable=False),
+    sa.Column('turnos', sa.JSON(), nullable=False),
+    sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('usuario_id')
+    )
+
+
+def downgrade():
+    op.drop_table('sugerencias_fichaje')
@@ -0,0 +1,34 @@
+"""checkpoint del cierre de anio por lotes
+
+Revision ID: c9f5a2b7e3d1
+Revises: b8e4f1a6d2c9
+Create Date: 2026-10-19 21:40:52.117304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9f5a2b7e3d1'
+down_revision = 'b8e4f1a6d2c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cierres_anio',
+    sa.Column('anio_origen', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('max_carryover', sa.Integer(), nullable=False),
+    sa.Column('ultimo_usuario_id', sa.Integer(), nullable=False),
+    sa.Column('creados', sa.Integer(), nullable=False),
+    sa.Column('actualizados', sa.Integer(), nullable=False),
+    sa.Column('saltados', sa.Integer(), nullable=False),
+    sa.Column('fecha_inicio', sa.DateTime(), nullable=False),
+    sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('anio_origen')
+    )
+
+
+def downgrade():
+    op.drop_table('cierres_anio')
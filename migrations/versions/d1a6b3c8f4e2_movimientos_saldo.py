@@ -0,0 +1,50 @@
+"""libro de movimientos de saldo
+
+Revision ID: d1a6b3c8f4e2
+Revises: c9f5a2b7e3d1
+Create Date: 2026-10-19 22:31:08.640192
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1a6b3c8f4e2'
+down_revision = 'c9f5a2b7e3d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('movimientos_saldo',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('anio', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('delta_totales', sa.Integer(), nullable=False),
+    sa.Column('delta_disfrutados', sa.Integer(), nullable=False),
+    sa.Column('solicitud_id', sa.Integer(), nullable=True),
+    sa.Column('motivo', sa.String(length=255), nullable=True),
+    sa.Column('fecha', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['solicitud_id'], ['solicitudes_vacaciones.id'], ),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('movimientos_saldo', schema=None) as batch_op:
+        batch_op.create_index('idx_movimiento_saldo_usuario_anio', ['usuario_id', 'anio', 'fecha'], unique=False)
+
+    # Apertura con los saldos actuales: el libro parte de lo que ya hay
+    op.execute("""
+        INSERT INTO movimientos_saldo (usuario_id, anio, tipo, delta_totales, delta_disfrutados, motivo, fecha)
+        SELECT usuario_id, anio, 'apertura', COALESCE(dias_totales, 0), COALESCE(dias_disfrutados, 0),
+               'Saldo previo al libro de movimientos', CURRENT_TIMESTAMP
+        FROM saldos_vacaciones
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('movimientos_saldo', schema=None) as batch_op:
+        batch_op.drop_index('idx_movimiento_saldo_usuario_anio')
+
+    op.drop_table('movimientos_saldo')
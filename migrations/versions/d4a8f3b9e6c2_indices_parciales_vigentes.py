@@ -0,0 +1,63 @@
+"""indices parciales y de cobertura sobre filas vigentes (PostgreSQL)
+
+Revision ID: d4a8f3b9e6c2
+Revises: c27d5e8a4b13
+Create Date: 2026-10-19 15:40:27.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8f3b9e6c2'
+down_revision = 'c27d5e8a4b13'
+branch_labels = None
+depends_on = None
+
+FICHAJE_VIGENTE = "es_actual AND tipo_accion <> 'eliminacion'"
+SOLICITUD_VIGENTE = "es_actual AND estado IN ('pendiente', 'aprobada')"
+SOLICITUD_PENDIENTE = "es_actual AND estado = 'pendiente'"
+
+# (nombre, tabla, columnas, INCLUDE, predicado)
+INDICES = [
+    ('idx_fichaje_vigente_usuario_fecha', 'fichajes', ['usuario_id', 'fecha', 'hora_entrada'],
+     ['hora_salida', 'pausa'], FICHAJE_VIGENTE),
+    ('idx_fichaje_vigente_fecha', 'fichajes', ['fecha'],
+     ['usuario_id', 'hora_entrada', 'hora_salida', 'pausa'], FICHAJE_VIGENTE),
+    ('idx_vacaciones_vigente_usuario', 'solicitudes_vacaciones', ['usuario_id', 'fecha_inicio', 'fecha_fin'],
+     None, SOLICITUD_VIGENTE),
+    ('idx_vacaciones_pendiente_usuario', 'solicitudes_vacaciones', ['usuario_id', 'fecha_solicitud'],
+     None, SOLICITUD_PENDIENTE),
+    ('idx_bajas_vigente_usuario', 'solicitudes_bajas', ['usuario_id', 'fecha_inicio', 'fecha_fin'],
+     None, SOLICITUD_VIGENTE),
+    ('idx_bajas_pendiente_usuario', 'solicitudes_bajas', ['usuario_id', 'fecha_solicitud'],
+     None, SOLICITUD_PENDIENTE),
+]
+
+
+def upgrade():
+    # Solo PostgreSQL: SQLite no aprovecha índices parciales con parámetros enlazados
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # CONCURRENTLY no bloquea escrituras en tablas grandes, pero no puede ir
+    # dentro de una transacción
+    with op.get_context().autocommit_block():
+        for nombre, tabla, columnas, incluir, predicado in INDICES:
+            op.create_index(nombre, tabla, columnas, unique=False, if_not_exists=True,
+                            postgresql_include=incluir or [],
+                            postgresql_where=sa.text(predicado),
+                            postgresql_concurrently=True)
+        for tabla in ('fichajes', 'solicitudes_vacaciones', 'solicitudes_bajas'):
+            op.execute(f'ANALYZE {tabla}')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        for nombre, tabla, *_ in reversed(INDICES):
+            op.drop_index(nombre, table_name=tabla, if_exists=True,
+                          postgresql_concurrently=True)
@@ -0,0 +1,141 @@
+"""archivo de versiones de fichajes y particionado opcional por fecha
+
+Revision ID: e5b1c7a2d9f4
+Revises: d4a8f3b9e6c2
+Create Date: 2026-10-19 17:22:48.130562
+
+El particionado solo se aplica en PostgreSQL y si FICHAJES_PARTICIONES vale
+'mensual' o 'anual' al ejecutar la migración. Restricciones de una tabla
+particionada:
+  - La clave primaria pasa a ser (id, fecha); 'id' sigue siendo único por la
+    secuencia.
+  - El índice único de fichaje abierto pasa a ser (usuario_id, fecha): un
+    fichaje abierto por usuario y día (el cierre nocturno cierra los de días
+    anteriores).
+
+"""
+import os
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1c7a2d9f4'
+down_revision = 'd4a8f3b9e6c2'
+branch_labels = None
+depends_on = None
+
+FICHAJE_ABIERTO = "hora_salida IS NULL AND es_actual AND tipo_accion <> 'eliminacion'"
+FICHAJE_VIGENTE = "es_actual AND tipo_accion <> 'eliminacion'"
+
+# Índices de 'fichajes' que hay que recrear al cambiar de tabla
+INDICES = [
+    "CREATE INDEX idx_fichaje_usuario_fecha ON fichajes (usuario_id, es_actual, fecha)",
+    "CREATE INDEX idx_fichaje_grupo ON fichajes (grupo_id)",
+    "CREATE INDEX idx_fichaje_fecha ON fichajes (fecha)",
+    "CREATE INDEX idx_fichaje_vigente_usuario_fecha ON fichajes (usuario_id, fecha, hora_entrada) "
+    f"INCLUDE (hora_salida, pausa) WHERE {FICHAJE_VIGENTE}",
+    "CREATE INDEX idx_fichaje_vigente_fecha ON fichajes (fecha) "
+    f"INCLUDE (usuario_id, hora_entrada, hora_salida, pausa) WHERE {FICHAJE_VIGENTE}",
+]
+
+
+def _particionar(granularidad):
+    op.execute("ALTER TABLE fichajes RENAME TO fichajes_sin_particionar")
+    op.execute("CREATE TABLE fichajes (LIKE fichajes_sin_particionar INCLUDING DEFAULTS) "
+               "PARTITION BY RANGE (fecha)")
+
+    conexion = op.get_bind()
+    primera = conexion.execute(sa.text("SELECT MIN(fecha) FROM fichajes_sin_particionar")).scalar()
+    hoy = date.today()
+    inicio = date((primera or hoy).year, 1 if granularidad == 'anual' else (primera or hoy).month, 1)
+    # Hasta tres meses por delante; el job mensual crea las siguientes
+    mes = hoy.month - 1 + 3
+    hasta = date(hoy.year + mes // 12, mes % 12 + 1, 1)
+    while inicio <= hasta:
+        if granularidad == 'anual':
+            fin = date(inicio.year + 1, 1, 1)
+            nombre = f'fichajes_p{inicio.year}'
+        else:
+            fin = date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+            nombre = f'fichajes_p{inicio.year}_{inicio.month:02d}'
+        op.execute(f"CREATE TABLE {nombre} PARTITION OF fichajes "
+                   f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fin.isoformat()}')")
+        inicio = fin
+    # Red de seguridad para fechas fuera de rango (no debería recibir filas)
+    op.execute("CREATE TABLE fichajes_pdefault PARTITION OF fichajes DEFAULT")
+
+    op.execute("INSERT INTO fichajes SELECT * FROM fichajes_sin_particionar")
+    op.execute("ALTER SEQUENCE fichajes_id_seq OWNED BY fichajes.id")
+    op.execute("DROP TABLE fichajes_sin_particionar")
+
+    op.execute("ALTER TABLE fichajes ADD CONSTRAINT fichajes_pkey PRIMARY KEY (id, fecha)")
+    op.create_foreign_key(None, 'fichajes', 'usuarios', ['usuario_id'], ['id'])
+    op.create_foreign_key(None, 'fichajes', 'usuarios', ['editor_id'], ['id'])
+    for sentencia in INDICES:
+        op.execute(sentencia)
+    op.execute("CREATE UNIQUE INDEX uq_fichaje_abierto_usuario ON fichajes (usuario_id, fecha) "
+               f"WHERE {FICHAJE_ABIERTO}")
+    op.execute("ANALYZE fichajes")
+
+
+def _desparticionar():
+    op.execute("ALTER TABLE fichajes RENAME TO fichajes_particionado")
+    op.execute("CREATE TABLE fichajes (LIKE fichajes_particionado INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO fichajes SELECT * FROM fichajes_particionado")
+    op.execute("ALTER SEQUENCE fichajes_id_seq OWNED BY fichajes.id")
+    op.execute("DROP TABLE fichajes_particionado CASCADE")
+
+    op.execute("ALTER TABLE fichajes ADD CONSTRAINT fichajes_pkey PRIMARY KEY (id)")
+    op.create_foreign_key(None, 'fichajes', 'usuarios', ['usuario_id'], ['id'])
+    op.create_foreign_key(None, 'fichajes', 'usuarios', ['editor_id'], ['id'])
+    for sentencia in INDICES:
+        op.execute(sentencia)
+    op.execute("CREATE UNIQUE INDEX uq_fichaje_abierto_usuario ON fichajes (usuario_id) "
+               f"WHERE {FICHAJE_ABIERTO}")
+
+
+def _esta_particionado(conexion):
+    return conexion.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'fichajes'::regclass)"
+    )).scalar()
+
+
+def upgrade():
+    op.create_table('fichajes_archivo',
+    sa.Column('grupo_id', sa.String(length=36), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('fecha_max', sa.Date(), nullable=False),
+    sa.Column('creacion_desde', sa.DateTime(), nullable=True),
+    sa.Column('creacion_hasta', sa.DateTime(), nullable=True),
+    sa.Column('num_versiones', sa.Integer(), nullable=False),
+    sa.Column('versiones', sa.LargeBinary(), nullable=False),
+    sa.Column('fecha_archivo', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('grupo_id')
+    )
+    with op.batch_alter_table('fichajes_archivo', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_fichajes_archivo_usuario_id'), ['usuario_id'], unique=False)
+
+    conexion = op.get_bind()
+    if conexion.dialect.name != 'postgresql':
+        return
+    # Ya va comprimido con zlib: que TOAST no intente recomprimirlo
+    op.execute("ALTER TABLE fichajes_archivo ALTER COLUMN versiones SET STORAGE EXTERNAL")
+
+    granularidad = os.environ.get('FICHAJES_PARTICIONES', '').strip().lower()
+    if granularidad in ('mensual', 'anual') and not _esta_particionado(conexion):
+        _particionar(granularidad)
+
+
+def downgrade():
+    conexion = op.get_bind()
+    if conexion.dialect.name == 'postgresql' and _esta_particionado(conexion):
+        _desparticionar()
+
+    with op.batch_alter_table('fichajes_archivo', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_fichajes_archivo_usuario_id'))
+
+    op.drop_table('fichajes_archivo')
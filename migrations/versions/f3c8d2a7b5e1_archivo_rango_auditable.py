@@ -0,0 +1,38 @@
+"""rango de versiones auditables en el archivo de fichajes
+
+Revision ID: f3c8d2a7b5e1
+Revises: d1a6b3c8f4e2
+Create Date: 2026-10-20 09:12:37.418266
+
+Las filas ya archivadas toman el rango de todas sus versiones
+(creacion_desde/creacion_hasta): es un superconjunto, así que la auditoría
+no pierde nada; el siguiente archivado del grupo lo deja exacto.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d2a7b5e1'
+down_revision = 'd1a6b3c8f4e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fichajes_archivo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('auditable_desde', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('auditable_hasta', sa.DateTime(), nullable=True))
+        batch_op.create_index('idx_fichajes_archivo_auditable', ['auditable_hasta', 'auditable_desde'],
+                              unique=False)
+
+    op.execute("UPDATE fichajes_archivo SET auditable_desde = creacion_desde, "
+               "auditable_hasta = creacion_hasta")
+
+
+def downgrade():
+    with op.batch_alter_table('fichajes_archivo', schema=None) as batch_op:
+        batch_op.drop_index('idx_fichajes_archivo_auditable')
+        batch_op.drop_column('auditable_hasta')
+        batch_op.drop_column('auditable_desde')
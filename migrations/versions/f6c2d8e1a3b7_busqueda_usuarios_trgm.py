@@ -0,0 +1,49 @@
+"""indice trigram sin acentos para la busqueda de usuarios (PostgreSQL)
+
+Revision ID: f6c2d8e1a3b7
+Revises: e5b1c7a2d9f4
+Create Date: 2026-10-19 18:51:03.662419
+
+Requiere permiso para crear las extensiones pg_trgm y unaccent (o que ya
+estén instaladas en la base de datos).
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c2d8e1a3b7'
+down_revision = 'e5b1c7a2d9f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite usa el índice en memoria de src/user_search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    # unaccent() es STABLE (depende del diccionario por defecto): un índice
+    # necesita una función IMMUTABLE con el diccionario fijado
+    op.execute("""
+        CREATE OR REPLACE FUNCTION tempus_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """)
+
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuario_busqueda_trgm ON usuarios
+            USING gin (tempus_unaccent(lower(nombre || ' ' || email)) gin_trgm_ops)
+        """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_usuario_busqueda_trgm")
+    op.execute("DROP FUNCTION IF EXISTS tempus_unaccent(text)")
@@ -11,6 +11,7 @@ Usage:
     python scripts/bcdr_export.py
     python scripts/bcdr_export.py --output /destination/path
     python scripts/bcdr_export.py --host localhost --port 5432 --db fichador_db --user fichador_user --password fichador_pass
+    python scripts/bcdr_export.py --replica-host db-replica   # reads from the replica when healthy
 
 Requirements:
     pip install psycopg2-binary openpyxl
@@ -141,8 +142,42 @@ def auto_width(ws):
 
 # ─── DB Connection ───────────────────────────────────────────────────────────
 
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def connect_replica(args, params):
+    """
+    Try the read replica first so the export does not load the primary.
+    Returns None if it is unreachable or lagging more than --max-lag seconds.
+    """
+    replica_params = dict(params, host=args.replica_host, port=args.replica_port or args.port)
+    print(f"Connecting to replica {replica_params['host']}:{replica_params['port']}/{params['dbname']}...")
+    try:
+        conn = psycopg2.connect(**replica_params, cursor_factory=psycopg2.extras.DictCursor)
+    except psycopg2.Error as e:
+        print(f"  Replica unavailable ({e}), falling back to primary.")
+        return None
+
+    with conn.cursor() as cur:
+        cur.execute(REPLICA_LAG_SQL)
+        lag = float(cur.fetchone()[0] or 0)
+    if lag > args.max_lag:
+        print(f"  Replica is {lag:.0f}s behind (max {args.max_lag}s), falling back to primary.")
+        conn.close()
+        return None
+
+    print(f"  Connection established (replica, lag {lag:.0f}s).")
+    return conn
+
+
 def connect_db(args):
-    """Connect to PostgreSQL with the given parameters."""
+    """Connect to PostgreSQL with the given parameters (replica first, if configured)."""
     params = {
         "host": args.host,
         "port": args.port,
@@ -150,6 +185,11 @@ def connect_db(args):
         "user": args.user,
         "password": args.password,
     }
+    if args.replica_host:
+        conn = connect_replica(args, params)
+        if conn is not None:
+            return conn
+
     print(f"Connecting to PostgreSQL {params['host']}:{params['port']}/{params['dbname']}...")
     try:
         conn = psycopg2.connect(**params, cursor_factory=psycopg2.extras.DictCursor)
@@ -476,6 +516,7 @@ Examples:
   python scripts/bcdr_export.py
   python scripts/bcdr_export.py --host 192.168.1.100 --port 5432
   python scripts/bcdr_export.py --output /backups/tempus
+  python scripts/bcdr_export.py --replica-host db-replica --max-lag 60
         """,
     )
     parser.add_argument("--host", default=os.getenv("POSTGRES_HOST", "localhost"),
@@ -488,6 +529,12 @@ Examples:
                         help="DB user (default: $POSTGRES_USER or fichador_user)")
     parser.add_argument("--password", default=os.getenv("POSTGRES_PASSWORD", "fichador_pass"),
                         help="DB password (default: $POSTGRES_PASSWORD or fichador_pass)")
+    parser.add_argument("--replica-host", default=os.getenv("POSTGRES_REPLICA_HOST"),
+                        help="Read replica host, used when healthy (default: $POSTGRES_REPLICA_HOST)")
+    parser.add_argument("--replica-port", default=os.getenv("POSTGRES_REPLICA_PORT"),
+                        help="Read replica port (default: same as --port)")
+    parser.add_argument("--max-lag", type=float, default=float(os.getenv("REPLICA_MAX_LAG", "300")),
+                        help="Max replica lag in seconds before using the primary (default: 300)")
     parser.add_argument("--output", "-o", default=None,
                         help="Output directory (default: bcdr_export_YYYYMMDD_HHMM/)")
     parser.add_argument("--all", action="store_true", default=False,
@@ -94,6 +94,26 @@ app.config['HIDE_TIMELINE'] = os.environ.get('HIDE_TIMELINE', 'False').lower() =
 app.config['DEFAULT_ADMIN_EMAIL'] = os.environ.get('DEFAULT_ADMIN_EMAIL', 'admin@example.com')
 app.config['DEFAULT_ADMIN_INITIAL_PASSWORD'] = os.environ.get('DEFAULT_ADMIN_INITIAL_PASSWORD', 'admin123')
 app.config['TIMEZONE'] = os.environ.get('TIMEZONE', 'Europe/Madrid')
+# Segundos que un usuario autenticado permanece en el cache del proceso (0 = sin cache)
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', '60'))
+# Segundos de vida del índice en memoria de búsqueda de usuarios (solo sin PostgreSQL)
+app.config['USER_SEARCH_INDEX_TTL'] = int(os.environ.get('USER_SEARCH_INDEX_TTL', '300'))
+# Segundos que cada worker mantiene en memoria los contadores de solicitudes pendientes (0 = sin cache)
+app.config['PENDING_COUNTERS_TTL'] = int(os.environ.get('PENDING_COUNTERS_TTL', '30'))
+# Niveles de la jerarquía de aprobación con derecho a aprobar (1 = solo aprobadores directos)
+app.config['APPROVAL_HIERARCHY_DEPTH'] = int(os.environ.get('APPROVAL_HIERARCHY_DEPTH', '1'))
+# Bus de eventos del reloj (SSE): 'postgres' (LISTEN/NOTIFY entre workers) o 'local'.
+# Vacío = 'postgres' si la BBDD es PostgreSQL
+app.config['CLOCK_EVENTS_BUS'] = os.environ.get('CLOCK_EVENTS_BUS', '')
+# Terminales de fichaje (API /api/v1/punches): 'terminal1:token1,terminal2:token2'
+app.config['PUNCH_API_TOKENS'] = os.environ.get('PUNCH_API_TOKENS', '')
+app.config['PUNCH_API_MAX_BATCH'] = int(os.environ.get('PUNCH_API_MAX_BATCH', '5000'))
+# Historial de fichajes: años en caliente antes de archivar versiones sustituidas
+# (registro de jornada: 4 años) y particionado de la tabla ('mensual', 'anual' o vacío)
+app.config['FICHAJES_RETENCION_ANIOS'] = int(os.environ.get('FICHAJES_RETENCION_ANIOS', '4'))
+app.config['FICHAJES_PARTICIONES'] = os.environ.get('FICHAJES_PARTICIONES', '').strip().lower()
+# Reconciliación nocturna de saldos: corregir los descuadres además de informar
+app.config['SALDOS_RECONCILIACION_AUTOFIX'] = os.environ.get('SALDOS_RECONCILIACION_AUTOFIX', 'False').lower() == 'true'
 
 # Configuración Scheduler
 app.config['SCHEDULER_API_ENABLED'] = True
@@ -108,6 +128,18 @@ google_bp = make_google_blueprint(
 )
 app.register_blueprint(google_bp, url_prefix="/login")
 
+# Almacenamiento del rate limit. Con varios workers de gunicorn y varias réplicas
+# en helm, "memory://" multiplica el límite efectivo (contadores por proceso), así
+# que en producción debe apuntar a un backend compartido, p.ej. redis://redis:6379/0
+# (requiere el paquete 'redis'). Si el backend compartido cae, se usan contadores
+# en memoria del proceso hasta que vuelva.
+app.config['RATELIMIT_STORAGE_URI'] = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+# Ventana deslizante aproximada con dos contadores por clave: coste constante por
+# petición y memoria acotada (a diferencia de 'moving-window', que guarda cada hit)
+app.config['RATELIMIT_STRATEGY'] = os.environ.get('RATELIMIT_STRATEGY', 'sliding-window-counter')
+app.config['RATELIMIT_KEY_PREFIX'] = os.environ.get('RATELIMIT_KEY_PREFIX', 'tempus')
+app.config['RATELIMIT_IN_MEMORY_FALLBACK_ENABLED'] = True
+
 # Límite global (doblado: la app es de uso interno y los valores anteriores
 # saltaban demasiado)
 # 10/s para proteger contra ataques de fuerza bruta
@@ -117,9 +149,13 @@ limiter = Limiter(
     key_func=get_remote_address,
     app=app,
     default_limits=["10 per second", "60 per minute", "10000 per day"],
-    storage_uri="memory://"
 )
 
+@limiter.request_filter
+def rate_limit_exento():
+    # Los estáticos no cuentan: evita un round-trip al backend compartido por asset
+    return request.endpoint == 'static'
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
     ip_origen = get_remote_address() 
@@ -140,7 +176,38 @@ def ratelimit_handler(e):
 # ==========================================
 
 # 1. Base de Datos
+# Con workers gevent, psycopg2 debe ceder el control mientras espera a Postgres
+# (si no, una query lenta congela todos los greenlets del worker)
+from src.database import (gevent_activo, instalar_driver_cooperativo, opciones_engine,
+                          rol_proceso, registrar_metricas_pool)
+_driver_cooperativo = gevent_activo() and instalar_driver_cooperativo()
+if _driver_cooperativo:
+    app.logger.info("Worker gevent detectado: psycopg2 en modo cooperativo")
+# Pool y timeouts desde el entorno (DB_POOL_*, DB_STATEMENT_TIMEOUT_<ROL>)
+app.config['TEMPUS_ROLE'] = rol_proceso()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_engine(
+    app.config['SQLALCHEMY_DATABASE_URI'],
+    cooperativo=_driver_cooperativo,
+    rol=app.config['TEMPUS_ROLE'],
+)
+# Réplica de lectura opcional para informes y exportaciones (@usar_replica)
+app.config['SQLALCHEMY_REPLICA_URI'] = os.environ.get('SQLALCHEMY_REPLICA_URI')
+app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', '30'))
+app.config['REPLICA_HEALTH_TTL'] = float(os.environ.get('REPLICA_HEALTH_TTL', '10'))
+if app.config['SQLALCHEMY_REPLICA_URI']:
+    app.config['SQLALCHEMY_BINDS'] = {
+        'replica': {
+            'url': app.config['SQLALCHEMY_REPLICA_URI'],
+            **opciones_engine(app.config['SQLALCHEMY_REPLICA_URI'],
+                              cooperativo=_driver_cooperativo,
+                              rol=app.config['TEMPUS_ROLE']),
+        }
+    }
 db.init_app(app)
+with app.app_context():
+    registrar_metricas_pool(db.engine)
+    if 'replica' in db.engines:
+        registrar_metricas_pool(db.engines['replica'], 'replica')
 
 # 2. Migraciones (CORREGIDO)
 migrate = Migrate(app, db)
@@ -163,18 +230,33 @@ scheduler.init_app(app)
 scheduler.start()
 
 # Definir la tarea de cierre automático (03:00 AM)
-from src.tasks import cerrar_fichajes_abiertos # Importar aquí para evitar circularidad
+from src.tasks import cerrar_fichajes_abiertos, purgar_claves_idempotencia, recalcular_sugerencias_fichaje, preparar_particiones_fichajes, reconciliar_saldos # Importar aquí para evitar circularidad
 
 @scheduler.task('cron', id='cierre_diario', hour=3, minute=0)
 def job_cierre_diario():
     print("⏰ [CRON] Ejecutando tarea de cierre automático...")
     cerrar_fichajes_abiertos(app)
+    purgar_claves_idempotencia(app)
+
+@scheduler.task('cron', id='sugerencias_diarias', hour=3, minute=30)
+def job_sugerencias_diarias():
+    recalcular_sugerencias_fichaje(app)
+
+@scheduler.task('cron', id='reconciliacion_saldos', hour=4, minute=0)
+def job_reconciliacion_saldos():
+    reconciliar_saldos(app)
+
+@scheduler.task('cron', id='particiones_mensuales', day=1, hour=2, minute=0)
+def job_particiones_mensuales():
+    preparar_particiones_fichajes(app)
 
 # ==========================================
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    # Cache por proceso: sin round-trips a BBDD en el caso habitual
+    from src.user_cache import obtener_usuario
+    return obtener_usuario(int(user_id))
 
 # DEFINICIÓN DE DECORADORES
 def admin_required(f):
@@ -226,17 +308,24 @@ def init_db():
         app.db_initialized = True
 
 # REGISTRO DE BLUEPRINTS
-from src.routes import auth_bp, main_bp, fichajes_bp, ausencias_bp, admin_bp
+from src.routes import auth_bp, main_bp, fichajes_bp, ausencias_bp, admin_bp, api_bp
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(main_bp)
 app.register_blueprint(fichajes_bp)
 app.register_blueprint(ausencias_bp)
 app.register_blueprint(admin_bp)
+# API de terminales: autenticación por token, sin sesión ni CSRF
+csrf.exempt(api_bp)
+app.register_blueprint(api_bp)
 
-from src.cli import cerrar_anio_command, import_users_command, init_admin_command, recalcular_command, cambiar_saldo_command
+from src.cli import cerrar_anio_command, import_users_command, init_admin_command, recalcular_command, cambiar_saldo_command, recalcular_sugerencias_command, archivar_fichajes_command, reconstruir_jerarquia_command, reconciliar_saldos_command
 app.cli.add_command(cerrar_anio_command)
 app.cli.add_command(import_users_command)
 app.cli.add_command(init_admin_command)
 app.cli.add_command(recalcular_command)
-app.cli.add_command(cambiar_saldo_command)
\ No newline at end of file
+app.cli.add_command(cambiar_saldo_command)
+app.cli.add_command(recalcular_sugerencias_command)
+app.cli.add_command(archivar_fichajes_command)
+app.cli.add_command(reconstruir_jerarquia_command)
+app.cli.add_command(reconciliar_saldos_command)
\ No newline at end of file
@@ -0,0 +1,335 @@
+"""
+Bandeja de aprobación: solicitudes pendientes de los empleados a cargo.
+
+La vista antigua cargaba 'current_user.usuarios_a_cargo' (lazy), después las
+solicitudes, y la plantilla disparaba una query por fila para 'usuario',
+'tipo_ausencia' y 'dias_adelanto' (que consulta SaldoVacaciones). Aquí:
+
+    - Una query por tipo de solicitud, filtrando con una subconsulta sobre la
+      jerarquía de aprobación (src/hierarchy.py) y con las relaciones que
+      pinta la plantilla ya cargadas.
+    - Una única query de saldos para todos los (usuario, año) de la página,
+      con la que se precalcula 'dias_adelanto' de cada solicitud.
+
+Las respuestas (aprobar/rechazar) pasan por RespuestasSolicitudes, tanto las
+individuales como las de la acción en lote: versiones anteriores y saldos
+existentes se cargan de una vez, los días se apuntan en el libro de
+movimientos (src/balances.py), todo se confirma en una transacción y Calendar y los
+emails se envían después del commit, agrupados. Antes de aprobar unas
+vacaciones se comprueba el límite de ausencias simultáneas de los equipos
+del empleado (exceso_capacidad), con sus límites bloqueados hasta el commit.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import joinedload
+
+from src.models import db, SaldoVacaciones, SolicitudVacaciones, SolicitudBaja
+from src.hierarchy import ids_a_cargo
+from src.availability import bloquear_limites, dias_sobre_capacidad, describir_excesos
+from src.balances import registrar_movimiento
+
+ACCIONES = ('aprobar', 'rechazar')
+
+
+def exceso_capacidad(solicitud):
+    """
+    Mensaje de error si aprobar estas vacaciones deja algún equipo por encima
+    de su límite de ausencias; None si cabe. Las cancelaciones liberan días
+    y no se comprueban.
+
+    Bloquea los límites de los equipos del empleado (bloquear_limites) para
+    que otra aprobación concurrente no pase la misma comprobación: hay que
+    llamarla dentro de la transacción que aprueba.
+    """
+    if solicitud.tipo_accion == 'cancelacion':
+        return None
+    bloquear_limites([solicitud.usuario_id])
+    excesos = dias_sobre_capacidad(solicitud.usuario_id, solicitud.fecha_inicio, solicitud.fecha_fin)
+    return describir_excesos(excesos) if excesos else None
+
+
+def precalcular_dias_adelanto(solicitudes):
+    """
+    Fija 'dias_adelanto' en cada SolicitudVacaciones con una sola query de
+    saldos (en lugar de una por solicitud).
+    """
+    claves = {(s.usuario_id, s.fecha_solicitud.year) for s in solicitudes}
+    if not claves:
+        return solicitudes
+
+    disponibles = {
+        (usuario_id, anio): totales - disfrutados
+        for usuario_id, anio, totales, disfrutados in db.session.query(
+            SaldoVacaciones.usuario_id, SaldoVacaciones.anio,
+            SaldoVacaciones.dias_totales, SaldoVacaciones.dias_disfrutados
+        ).filter(tuple_(SaldoVacaciones.usuario_id, SaldoVacaciones.anio).in_(claves))
+    }
+
+    for solicitud in solicitudes:
+        # Sin saldo del año: asignación completa (como dias_vacaciones_disponibles)
+        disponible = disponibles.get((solicitud.usuario_id, solicitud.fecha_solicitud.year),
+                                     solicitud.usuario.dias_vacaciones)
+        solicitud._dias_adelanto = solicitud.adelanto_sobre(disponible)
+    return solicitudes
+
+
+def bandeja_pendientes(aprobador_id):
+    """
+    Solicitudes pendientes de los empleados a cargo del aprobador.
+
+    Returns:
+        tuple: (vacaciones, bajas), ordenadas por fecha de solicitud.
+    """
+    a_cargo = ids_a_cargo(aprobador_id)
+
+    vacaciones = SolicitudVacaciones.query.options(
+        joinedload(SolicitudVacaciones.usuario)
+    ).filter(
+        SolicitudVacaciones.usuario_id.in_(a_cargo),
+        SolicitudVacaciones.estado == 'pendiente',
+        SolicitudVacaciones.es_actual == True
+    ).order_by(SolicitudVacaciones.fecha_solicitud, SolicitudVacaciones.id).all()
+
+    bajas = SolicitudBaja.query.options(
+        joinedload(SolicitudBaja.usuario),
+        joinedload(SolicitudBaja.tipo_ausencia)
+    ).filter(
+        SolicitudBaja.usuario_id.in_(a_cargo),
+        SolicitudBaja.estado == 'pendiente',
+        SolicitudBaja.es_actual == True
+    ).order_by(SolicitudBaja.fecha_solicitud, SolicitudBaja.id).all()
+
+    precalcular_dias_adelanto(vacaciones)
+    return vacaciones, bajas
+
+
+# ==========================================
+# RESPUESTAS (individuales y en lote)
+# ==========================================
+
+class RespuestasSolicitudes:
+    """
+    Aplica aprobaciones/rechazos sobre un conjunto de solicitudes.
+
+    Uso:
+        respuestas = RespuestasSolicitudes(aprobador_id, vacaciones=[...], bajas=[...])
+        mensaje, categoria = respuestas.responder_vacaciones(solicitud, 'aprobar')
+        db.session.commit()
+        respuestas.ejecutar_efectos()
+
+    Qué saldos (usuario, año) existen ya y las versiones vigentes que
+    sustituyen las modificaciones/cancelaciones se leen en el constructor con
+    una query cada uno. Los días consumidos o devueltos se apuntan como
+    movimientos, que suman sobre el saldo sin leerlo. Las llamadas a Calendar y los emails no se hacen
+    hasta ejecutar_efectos(), ya con la transacción confirmada.
+    """
+
+    def __init__(self, aprobador_id, vacaciones=(), bajas=()):
+        self.aprobador_id = aprobador_id
+        self.saldos_existentes = set()
+        self.anteriores = {}
+        self.crear_eventos = []     # (solicitud, tipo)
+        self.eliminar_eventos = []  # google_event_id
+        self.respondidas = []
+
+        claves = {(s.usuario_id, s.fecha_solicitud.year) for s in vacaciones
+                  if s.tipo_accion in ('creacion', 'modificacion', 'cancelacion')}
+        if claves:
+            self.saldos_existentes = {(usuario_id, anio) for usuario_id, anio in db.session.execute(
+                select(SaldoVacaciones.usuario_id, SaldoVacaciones.anio).where(
+                    tuple_(SaldoVacaciones.usuario_id, SaldoVacaciones.anio).in_(claves)))}
+
+        cambios = [s for s in vacaciones if s.tipo_accion in ('modificacion', 'cancelacion')]
+        if cambios:
+            for anterior in SolicitudVacaciones.query.filter(
+                SolicitudVacaciones.grupo_id.in_({s.grupo_id for s in cambios}),
+                SolicitudVacaciones.es_actual == True,
+                SolicitudVacaciones.id.notin_([s.id for s in cambios])
+            ).order_by(SolicitudVacaciones.id):
+                self.anteriores.setdefault(anterior.grupo_id, anterior)
+
+    def _movimiento(self, solicitud, tipo, dias, solicitud_id):
+        clave = (solicitud.usuario_id, solicitud.fecha_solicitud.year)
+        # Sin saldo del año todavía: se abre con la base contractual
+        dias_base = None if clave in self.saldos_existentes else solicitud.usuario.dias_vacaciones
+        registrar_movimiento(solicitud.usuario_id, clave[1], tipo, delta_disfrutados=dias,
+                             solicitud_id=solicitud_id, dias_base=dias_base)
+        self.saldos_existentes.add(clave)
+
+    def _registrar_respuesta(self, solicitud):
+        # Registrar auditoría de la respuesta
+        solicitud.aprobador_id = self.aprobador_id
+        solicitud.fecha_respuesta = datetime.utcnow()
+        self.respondidas.append(solicitud)
+
+    def responder_vacaciones(self, solicitud, accion):
+        """
+        Aprueba o rechaza una solicitud de vacaciones (sin commit).
+
+        Returns:
+            tuple: (mensaje, categoría de flash)
+        """
+        if accion == 'aprobar':
+            # --- CASO A: CREACIÓN (Primera vez) ---
+            if solicitud.tipo_accion == 'creacion':
+                self._movimiento(solicitud, 'solicitud', solicitud.dias_solicitados, solicitud.id)
+                solicitud.estado = 'aprobada'
+                self.crear_eventos.append((solicitud, 'vacaciones'))
+                mensaje = ('Solicitud de vacaciones aprobada. Días descontados.', 'success')
+
+            # --- CASO B: MODIFICACIÓN O CANCELACIÓN (Versionado) ---
+            else:
+                # 1. Consolidar V1 (la versión actual anterior, ahora obsoleta)
+                v1 = self.anteriores.get(solicitud.grupo_id)
+                dias_reintegro = 0
+                if v1:
+                    v1.es_actual = False
+                    dias_reintegro = v1.dias_solicitados
+                    # Eliminar evento viejo del Calendar
+                    if v1.google_event_id:
+                        self.eliminar_eventos.append(v1.google_event_id)
+
+                # 2. Activar V2 (esta solicitud)
+                solicitud.estado = 'aprobada'
+                solicitud.es_actual = True
+
+                # 3. Ajuste de saldo: se devuelve V1 y se consume V2 (cancelar: nada)
+                coste_nuevo = 0
+                if solicitud.tipo_accion == 'modificacion':
+                    coste_nuevo = solicitud.dias_solicitados
+                    self.crear_eventos.append((solicitud, 'vacaciones'))
+
+                if dias_reintegro:
+                    self._movimiento(solicitud, 'reversion', -dias_reintegro, v1.id)
+                if coste_nuevo:
+                    self._movimiento(solicitud, 'solicitud', coste_nuevo, solicitud.id)
+                mensaje = (f"Solicitud aprobada. Saldo ajustado (Devueltos: {dias_reintegro}, "
+                           f"Nuevos: {coste_nuevo}).", 'success')
+
+        else:
+            solicitud.estado = 'rechazada'
+            # Si rechazamos una MODIFICACIÓN/CANCELACIÓN (v2), esa versión muere y
+            # la original (v1) sigue siendo la válida y 'actual'. No tocamos saldo.
+            # Una CREACIÓN rechazada sigue es_actual=True para verla en el historial.
+            if solicitud.tipo_accion in ('modificacion', 'cancelacion'):
+                solicitud.es_actual = False
+            mensaje = (f'Solicitud de vacaciones de {solicitud.usuario.nombre} rechazada.', 'info')
+
+        self._registrar_respuesta(solicitud)
+        return mensaje
+
+    def responder_baja(self, solicitud, accion):
+        """
+        Aprueba o rechaza una baja/permiso (sin commit).
+
+        Returns:
+            tuple: (mensaje, categoría de flash)
+        """
+        if accion == 'aprobar':
+            solicitud.estado = 'aprobada'
+            self.crear_eventos.append((solicitud, 'baja'))
+            mensaje = (f'Baja/Permiso de {solicitud.usuario.nombre} aprobada.', 'success')
+        else:
+            solicitud.estado = 'rechazada'
+            mensaje = (f'Baja/Permiso de {solicitud.usuario.nombre} rechazada.', 'info')
+
+        self._registrar_respuesta(solicitud)
+        return mensaje
+
+    def ejecutar_efectos(self):
+        """
+        Tras el commit: sincroniza Calendar (un batch para todo el lote) y
+        encola los emails de respuesta como un único envío.
+        """
+        from src.google_calendar import sincronizar_eventos_lote
+        from src.email_service import enviar_emails_respuesta
+
+        creados = sincronizar_eventos_lote(
+            crear=[(i, solicitud, tipo) for i, (solicitud, tipo) in enumerate(self.crear_eventos)],
+            eliminar=self.eliminar_eventos
+        )
+        if creados:
+            for i, event_id in creados.items():
+                self.crear_eventos[i][0].google_event_id = event_id
+            db.session.commit()
+
+        try:
+            enviar_emails_respuesta(self.respondidas)
+        except Exception as e:
+            print(f"Error enviando email notificación: {e}")
+
+
+def responder_lote(aprobador, accion, ids_vacaciones=(), ids_bajas=()):
+    """
+    Aprueba o rechaza una selección de solicitudes pendientes en una sola
+    transacción. Las que no existen, ya están respondidas o son de empleados
+    que no están a cargo del aprobador (salvo admin) se omiten.
+
+    Returns:
+        list: un dict por solicitud pedida con tipo, id, ok, estado y mensaje.
+    """
+    ids_vacaciones = list(dict.fromkeys(ids_vacaciones))
+    ids_bajas = list(dict.fromkeys(ids_bajas))
+
+    vacaciones = {s.id: s for s in SolicitudVacaciones.query.options(
+        joinedload(SolicitudVacaciones.usuario)
+    ).filter(SolicitudVacaciones.id.in_(ids_vacaciones))} if ids_vacaciones else {}
+    bajas = {s.id: s for s in SolicitudBaja.query.options(
+        joinedload(SolicitudBaja.usuario)
+    ).filter(SolicitudBaja.id.in_(ids_bajas))} if ids_bajas else {}
+
+    a_cargo = None
+    if aprobador.rol != 'admin':
+        a_cargo = set(db.session.scalars(ids_a_cargo(aprobador.id)))
+
+    def _validar(solicitud):
+        if solicitud is None:
+            return 'Solicitud no encontrada.'
+        if a_cargo is not None and solicitud.usuario_id not in a_cargo:
+            return 'No tienes permiso para gestionar solicitudes de este usuario.'
+        if solicitud.estado != 'pendiente':
+            return f'La solicitud ya está {solicitud.estado}.'
+        return None
+
+    seleccion = []
+    resultados = []
+    for tipo, ids, cargadas in (('vacaciones', ids_vacaciones, vacaciones), ('baja', ids_bajas, bajas)):
+        for id_ in ids:
+            solicitud = cargadas.get(id_)
+            error = _validar(solicitud)
+            resultado = {'tipo': tipo, 'id': id_, 'ok': error is None,
+                         'estado': solicitud.estado if solicitud else None, 'mensaje': error}
+            resultados.append(resultado)
+            if error is None:
+                seleccion.append((tipo, solicitud, resultado))
+
+    respuestas = RespuestasSolicitudes(
+        aprobador.id,
+        vacaciones=[s for tipo, s, _ in seleccion if tipo == 'vacaciones'],
+        bajas=[s for tipo, s, _ in seleccion if tipo == 'baja']
+    )
+    if accion == 'aprobar':
+        # Todos los equipos del lote de una vez y en orden: si exceso_capacidad
+        # los fuera bloqueando por solicitud, dos lotes cruzados se interbloquearían
+        bloquear_limites(s.usuario_id for tipo, s, _ in seleccion if tipo == 'vacaciones')
+    aplicadas = 0
+    for tipo, solicitud, resultado in seleccion:
+        # La query de capacidad hace autoflush: ya cuenta las aprobadas antes en este lote
+        if tipo == 'vacaciones' and accion == 'aprobar':
+            error = exceso_capacidad(solicitud)
+            if error:
+                resultado.update(ok=False, mensaje=error)
+                continue
+        if tipo == 'vacaciones':
+            mensaje, _ = respuestas.responder_vacaciones(solicitud, accion)
+        else:
+            mensaje, _ = respuestas.responder_baja(solicitud, accion)
+        resultado['estado'] = solicitud.estado
+        resultado['mensaje'] = mensaje
+        aplicadas += 1
+
+    if aplicadas:
+        db.session.commit()
+        respuestas.ejecutar_efectos()
+    return resultados
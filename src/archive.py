@@ -0,0 +1,331 @@
+"""
+Historial frío de fichajes.
+
+La tabla 'fichajes' crece con cada fichaje y con cada rectificación (una
+versión nueva por cambio). Dos mecanismos la mantienen acotada:
+
+1. Particionado por fecha (solo PostgreSQL, opcional): la migración
+   e5b1c7a2d9f4 convierte 'fichajes' en tabla particionada por RANGE(fecha)
+   si FICHAJES_PARTICIONES = 'mensual' | 'anual'. Los informes por rango de
+   fechas solo leen las particiones afectadas. crear_particiones_fichajes()
+   (job mensual) crea las particiones de los próximos meses, con la
+   granularidad de las que ya existen.
+
+2. Archivo de versiones sustituidas: 'flask archivar-fichajes' mueve las
+   versiones con es_actual == False y fecha anterior al plazo de retención
+   (FICHAJES_RETENCION_ANIOS, 4 años por defecto: art. 34.9 ET) a
+   'fichajes_archivo', una fila por grupo_id con las versiones en JSON
+   comprimido. La versión vigente nunca se archiva.
+
+La auditoría y el detalle de cambios leen de ambas tablas con
+version_fichaje() y versiones_archivadas_auditoria(). Cada fila del archivo
+guarda el rango de fecha_creacion de sus versiones auditables, así que la
+auditoría elige en SQL qué grupos descomprimir y solo lo hace con un rango
+de fechas.
+"""
+import json
+import re
+import zlib
+from datetime import date, datetime, time
+
+from flask import current_app
+from sqlalchemy import text
+
+from src.models import db, Fichaje, FichajeArchivado, Usuario
+
+# Columnas de Fichaje que se conservan en el archivo
+COLUMNAS = ('id', 'grupo_id', 'version', 'es_actual', 'tipo_accion', 'motivo_rectificacion',
+            'usuario_id', 'editor_id', 'fecha', 'hora_entrada', 'hora_salida',
+            'fecha_creacion', 'pausa')
+
+
+# ==========================================
+# SERIALIZACIÓN
+# ==========================================
+
+def _a_json(valor):
+    if isinstance(valor, (date, datetime, time)):
+        return valor.isoformat()
+    return valor
+
+
+def _desde_json(columna, valor):
+    if valor is None:
+        return None
+    if columna == 'fecha':
+        return date.fromisoformat(valor)
+    if columna in ('hora_entrada', 'hora_salida'):
+        return time.fromisoformat(valor)
+    if columna == 'fecha_creacion':
+        return datetime.fromisoformat(valor)
+    return valor
+
+
+def _comprimir(versiones):
+    filas = [[_a_json(v[c]) for c in COLUMNAS] for v in versiones]
+    return zlib.compress(json.dumps(filas, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def _descomprimir(datos):
+    filas = json.loads(zlib.decompress(datos).decode('utf-8'))
+    return [{c: _desde_json(c, valor) for c, valor in zip(COLUMNAS, fila)} for fila in filas]
+
+
+class VersionArchivada:
+    """
+    Versión de un fichaje leída del archivo. Expone los mismos atributos que
+    Fichaje (incluidos 'usuario' y 'editor') para reutilizar las vistas, pero
+    no es una entidad de la sesión: es de solo lectura.
+    """
+    archivado = True
+
+    def __init__(self, datos, usuarios=None):
+        for columna in COLUMNAS:
+            setattr(self, columna, datos.get(columna))
+        usuarios = usuarios or {}
+        self.usuario = usuarios.get(self.usuario_id)
+        self.editor = usuarios.get(self.editor_id)
+
+    def __repr__(self):
+        return f'<VersionArchivada {self.grupo_id} v{self.version}>'
+
+
+def _es_auditable(datos):
+    """Lo que muestra la auditoría: modificaciones, eliminaciones o creaciones por otro usuario."""
+    return (datos['version'] > 1 or datos['tipo_accion'] == 'eliminacion'
+            or (datos['editor_id'] is not None and datos['editor_id'] != datos['usuario_id']))
+
+
+# ==========================================
+# ARCHIVO DE VERSIONES SUSTITUIDAS
+# ==========================================
+
+def limite_retencion(anios=None, hoy=None):
+    """Primer día que sigue en caliente: lo anterior es archivable."""
+    if anios is None:
+        anios = current_app.config['FICHAJES_RETENCION_ANIOS']
+    hoy = hoy or date.today()
+    try:
+        return hoy.replace(year=hoy.year - anios)
+    except ValueError:  # 29 de febrero
+        return hoy.replace(year=hoy.year - anios, day=28)
+
+
+def archivar_fichajes(antes_de, lote=1000, dry_run=False):
+    """
+    Mueve a 'fichajes_archivo' las versiones sustituidas con fecha < antes_de.
+    Procesa 'lote' grupos por transacción (commit por lote) para no bloquear
+    la tabla ni acumular memoria.
+
+    Returns:
+        tuple: (versiones archivadas, grupos afectados)
+    """
+    archivable = (Fichaje.es_actual == False, Fichaje.fecha < antes_de)
+
+    if dry_run:
+        versiones = Fichaje.query.filter(*archivable).count()
+        grupos = db.session.query(Fichaje.grupo_id).filter(*archivable).distinct().count()
+        return versiones, grupos
+
+    total_versiones = total_grupos = 0
+    while True:
+        grupo_ids = [g for (g,) in db.session.query(Fichaje.grupo_id)
+                     .filter(*archivable).distinct().limit(lote)]
+        if not grupo_ids:
+            break
+
+        filas = db.session.query(*(getattr(Fichaje, c) for c in COLUMNAS)).filter(
+            Fichaje.grupo_id.in_(grupo_ids), *archivable
+        ).order_by(Fichaje.grupo_id, Fichaje.version).all()
+
+        por_grupo = {}
+        for fila in filas:
+            por_grupo.setdefault(fila.grupo_id, []).append(dict(zip(COLUMNAS, fila)))
+
+        # Un grupo puede haberse archivado en parte en una pasada anterior
+        existentes = {a.grupo_id: a for a in FichajeArchivado.query.filter(
+            FichajeArchivado.grupo_id.in_(grupo_ids))}
+
+        for grupo_id, versiones in por_grupo.items():
+            archivo = existentes.get(grupo_id)
+            if archivo is not None:
+                ya_archivadas = {v['id']: v for v in _descomprimir(archivo.versiones)}
+                ya_archivadas.update({v['id']: v for v in versiones})
+                versiones = sorted(ya_archivadas.values(), key=lambda v: v['version'])
+            else:
+                archivo = FichajeArchivado(grupo_id=grupo_id, usuario_id=versiones[0]['usuario_id'])
+                db.session.add(archivo)
+
+            creaciones = [v['fecha_creacion'] for v in versiones if v['fecha_creacion']]
+            auditables = [v['fecha_creacion'] for v in versiones
+                          if v['fecha_creacion'] and _es_auditable(v)]
+            archivo.fecha_max = max(v['fecha'] for v in versiones)
+            archivo.creacion_desde = min(creaciones, default=None)
+            archivo.creacion_hasta = max(creaciones, default=None)
+            archivo.auditable_desde = min(auditables, default=None)
+            archivo.auditable_hasta = max(auditables, default=None)
+            archivo.num_versiones = len(versiones)
+            archivo.versiones = _comprimir(versiones)
+            archivo.fecha_archivo = datetime.utcnow()
+
+        Fichaje.query.filter(
+            Fichaje.id.in_([f.id for f in filas])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+        total_versiones += len(filas)
+        total_grupos += len(por_grupo)
+
+    return total_versiones, total_grupos
+
+
+# ==========================================
+# LECTURA UNIFICADA (caliente + archivo)
+# ==========================================
+
+def _usuarios_por_id(ids):
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    return {u.id: u for u in Usuario.query.filter(Usuario.id.in_(ids))}
+
+
+def version_fichaje(grupo_id, version):
+    """Una versión concreta de un fichaje, esté en 'fichajes' o en el archivo."""
+    fichaje = Fichaje.query.filter(
+        Fichaje.grupo_id == grupo_id,
+        Fichaje.version == version
+    ).first()
+    if fichaje is not None:
+        return fichaje
+
+    archivo = db.session.get(FichajeArchivado, grupo_id)
+    if archivo is None:
+        return None
+    for datos in _descomprimir(archivo.versiones):
+        if datos['version'] == version:
+            return VersionArchivada(datos, _usuarios_por_id([datos['usuario_id'], datos['editor_id']]))
+    return None
+
+
+def versiones_archivadas_auditoria(desde, hasta=None, usuario_nombre=None):
+    """
+    Versiones archivadas que la auditoría mostraría si siguieran en
+    'fichajes': modificaciones (v>1), eliminaciones o creaciones por otro
+    usuario, con fecha_creacion en [desde, hasta) (hasta opcional).
+
+    'desde' es obligatorio: sin rango habría que descomprimir el archivo
+    entero. Solo se descomprimen los grupos cuyo rango de versiones
+    auditables (auditable_desde/auditable_hasta) toca el pedido.
+    """
+    query = FichajeArchivado.query.filter(FichajeArchivado.auditable_hasta >= desde)
+    if hasta:
+        query = query.filter(FichajeArchivado.auditable_desde < hasta)
+    if usuario_nombre:
+        query = query.join(Usuario, FichajeArchivado.usuario_id == Usuario.id).filter(
+            Usuario.nombre.ilike(f'%{usuario_nombre}%'))
+
+    seleccionadas = []
+    for archivo in query:
+        for datos in _descomprimir(archivo.versiones):
+            creacion = datos['fecha_creacion']
+            if not _es_auditable(datos) or creacion is None or creacion < desde:
+                continue
+            if hasta and creacion >= hasta:
+                continue
+            seleccionadas.append(datos)
+
+    usuarios = _usuarios_por_id([d['usuario_id'] for d in seleccionadas] +
+                                [d['editor_id'] for d in seleccionadas])
+    return [VersionArchivada(d, usuarios) for d in seleccionadas]
+
+
+# ==========================================
+# PARTICIONES (PostgreSQL)
+# ==========================================
+
+def fichajes_particionado():
+    """True si 'fichajes' es una tabla particionada de PostgreSQL."""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'fichajes'::regclass)"
+    )).scalar()
+
+
+def _rangos_particion(desde, hasta, granularidad):
+    """(nombre, inicio, fin) de cada partición que cubre [desde, hasta]."""
+    inicio = date(desde.year, 1 if granularidad == 'anual' else desde.month, 1)
+    while inicio <= hasta:
+        if granularidad == 'anual':
+            fin = date(inicio.year + 1, 1, 1)
+            nombre = f'fichajes_p{inicio.year}'
+        else:
+            fin = date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+            nombre = f'fichajes_p{inicio.year}_{inicio.month:02d}'
+        yield nombre, inicio, fin
+        inicio = fin
+
+
+def _granularidad_particiones(limites):
+    """
+    'anual' o 'mensual' según los límites (pg_get_expr de relpartbound) de
+    las particiones existentes; None si no hay ninguna de rango.
+    """
+    for limite in limites:
+        rango = re.search(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)", limite or '')
+        if rango:
+            inicio, fin = (date.fromisoformat(f) for f in rango.groups())
+            return 'anual' if (fin - inicio).days > 31 else 'mensual'
+    return None
+
+
+def crear_particiones_fichajes(meses=3, hoy=None):
+    """
+    Crea (si faltan) las particiones hasta 'meses' por delante. No hace nada
+    si la tabla no está particionada.
+
+    La granularidad sale de las particiones que ya existen, no de la
+    configuración: una partición mensual dentro de un año ya particionado
+    se solaparía y PostgreSQL la rechazaría. FICHAJES_PARTICIONES solo se
+    usa si aún no hay ninguna, y entonces es obligatoria.
+
+    Returns:
+        list: nombres de las particiones creadas.
+    """
+    if not fichajes_particionado():
+        return []
+
+    particiones = db.session.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'fichajes'::regclass"
+    )).all()
+    existentes = {nombre for nombre, _ in particiones}
+
+    configurada = current_app.config.get('FICHAJES_PARTICIONES')
+    granularidad = _granularidad_particiones(limite for _, limite in particiones)
+    if granularidad is None:
+        if configurada not in ('mensual', 'anual'):
+            raise ValueError("'fichajes' está particionada sin particiones de rango: "
+                             "FICHAJES_PARTICIONES debe valer 'mensual' o 'anual'")
+        granularidad = configurada
+    elif configurada and configurada != granularidad:
+        current_app.logger.warning(
+            f"FICHAJES_PARTICIONES={configurada!r} no coincide con las particiones existentes "
+            f"({granularidad}); se usa {granularidad}")
+
+    hoy = hoy or date.today()
+    mes = hoy.month - 1 + meses
+    hasta = date(hoy.year + mes // 12, mes % 12 + 1, 1)
+
+    creadas = []
+    for nombre, inicio, fin in _rangos_particion(hoy, hasta, granularidad):
+        if nombre in existentes:
+            continue
+        db.session.execute(text(
+            f"CREATE TABLE {nombre} PARTITION OF fichajes "
+            f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fin.isoformat()}')"
+        ))
+        creadas.append(nombre)
+    db.session.commit()
+    return creadas
@@ -0,0 +1,225 @@
+"""
+Disponibilidad por equipo: cuántas personas faltan cada día.
+
+Un "equipo" son los empleados a cargo de un aprobador (según la jerarquía de
+aprobación, src/hierarchy.py). Para un rango de fechas:
+
+    1. Una sola query (UNION ALL) con los intervalos aprobados de vacaciones
+       y bajas del equipo que tocan el rango.
+    2. Los intervalos de cada persona se fusionan (vacaciones y baja el mismo
+       día cuentan una vez).
+    3. Barrido con array de diferencias: +1 en el primer día de cada
+       intervalo, -1 en el siguiente al último y suma acumulada. O(n + días)
+       en lugar de comprobar cada día contra cada solicitud.
+    4. Fines de semana y festivos se marcan como no laborables.
+
+Los límites de ausencias simultáneas (LimiteAusenciasEquipo) reutilizan el
+mismo barrido: dias_sobre_capacidad() carga de una vez los intervalos de
+todos los equipos con límite a los que pertenece el empleado. Antes de
+comprobarlo en una aprobación hay que llamar a bloquear_limites().
+"""
+from datetime import timedelta
+from itertools import accumulate
+
+from sqlalchemy import select, union_all
+
+from src.models import (db, SolicitudVacaciones, SolicitudBaja, LimiteAusenciasEquipo, Usuario,
+                        JerarquiaAprobacion)
+from src.hierarchy import ids_a_cargo, ids_responsables, _profundidad
+from src.utils import get_festivos
+
+# Rango máximo de una consulta de disponibilidad (días)
+MAX_DIAS = 366
+
+
+def _fusionar(intervalos):
+    """Fusiona intervalos [inicio, fin] (en días) solapados o contiguos."""
+    fusionados = []
+    for inicio, fin in sorted(intervalos):
+        if fusionados and inicio <= fusionados[-1][1] + 1:
+            if fin > fusionados[-1][1]:
+                fusionados[-1][1] = fin
+        else:
+            fusionados.append([inicio, fin])
+    return fusionados
+
+
+def ocupacion_diaria(intervalos_por_usuario, desde, hasta):
+    """
+    Personas ausentes por día en [desde, hasta].
+
+    Args:
+        intervalos_por_usuario: dict usuario_id -> lista de (fecha_inicio, fecha_fin)
+
+    Returns:
+        list: un entero por día del rango.
+    """
+    dias = (hasta - desde).days + 1
+    diferencias = [0] * (dias + 1)
+    for intervalos in intervalos_por_usuario.values():
+        # Recortados al rango y en días desde 'desde'
+        recortados = [(max((ini - desde).days, 0), min((fin - desde).days, dias - 1))
+                      for ini, fin in intervalos if fin >= desde and ini <= hasta]
+        for inicio, fin in _fusionar(recortados):
+            diferencias[inicio] += 1
+            diferencias[fin + 1] -= 1
+    return list(accumulate(diferencias[:dias]))
+
+
+def intervalos_aprobados(usuario_ids, desde, hasta):
+    """
+    Vacaciones y bajas aprobadas vigentes de esos usuarios que tocan el
+    rango, en una sola query.
+
+    Returns:
+        dict: usuario_id -> lista de (fecha_inicio, fecha_fin)
+    """
+    vacaciones = select(SolicitudVacaciones.usuario_id, SolicitudVacaciones.fecha_inicio,
+                        SolicitudVacaciones.fecha_fin).where(
+        SolicitudVacaciones.usuario_id.in_(usuario_ids),
+        SolicitudVacaciones.estado == 'aprobada',
+        SolicitudVacaciones.es_actual == True,
+        SolicitudVacaciones.tipo_accion != 'cancelacion',
+        SolicitudVacaciones.fecha_inicio <= hasta,
+        SolicitudVacaciones.fecha_fin >= desde
+    )
+    bajas = select(SolicitudBaja.usuario_id, SolicitudBaja.fecha_inicio, SolicitudBaja.fecha_fin).where(
+        SolicitudBaja.usuario_id.in_(usuario_ids),
+        SolicitudBaja.estado == 'aprobada',
+        SolicitudBaja.es_actual == True,
+        SolicitudBaja.fecha_inicio <= hasta,
+        SolicitudBaja.fecha_fin >= desde
+    )
+
+    por_usuario = {}
+    for usuario_id, inicio, fin in db.session.execute(union_all(vacaciones, bajas)):
+        por_usuario.setdefault(usuario_id, []).append((inicio, fin))
+    return por_usuario
+
+
+def mascara_laborable(desde, hasta):
+    """True por cada día laborable del rango (ni fin de semana ni festivo)."""
+    festivos = get_festivos()
+    return [(dia.weekday() < 5 and dia not in festivos)
+            for dia in (desde + timedelta(days=i) for i in range((hasta - desde).days + 1))]
+
+
+def disponibilidad_equipo(aprobador_id, desde, hasta):
+    """
+    Ausencias por día del equipo de un aprobador, en formato compacto para
+    un mapa de calor: 'ausentes' tiene un valor por día del rango y null en
+    los días no laborables.
+    """
+    miembros = list(db.session.scalars(ids_a_cargo(aprobador_id)))
+    if miembros:
+        ausentes = ocupacion_diaria(intervalos_aprobados(miembros, desde, hasta), desde, hasta)
+    else:
+        ausentes = [0] * ((hasta - desde).days + 1)
+
+    return {
+        'equipo': aprobador_id,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'miembros': len(miembros),
+        'ausentes': [n if laborable else None
+                     for n, laborable in zip(ausentes, mascara_laborable(desde, hasta))],
+    }
+
+
+def dias_sobre_capacidad(usuario_id, fecha_inicio, fecha_fin):
+    """
+    Días laborables de [fecha_inicio, fecha_fin] en los que una ausencia más
+    de 'usuario_id' superaría el límite de alguno de sus equipos.
+
+    Tres queries en total, sea cual sea el número de equipos o de días:
+    límites de los equipos del usuario, miembros de esos equipos e
+    intervalos aprobados de todos ellos.
+
+    Las ausencias del propio usuario no cuentan como ocupación, así que al
+    modificar unas vacaciones la versión anterior no estorba a la nueva.
+
+    Returns:
+        list: dicts {equipo, nombre, fecha, ausentes, limite} ordenados por
+        fecha; ausentes es la ocupación actual, sin contar al usuario.
+    """
+    limites = {aprobador_id: (nombre, maximo) for aprobador_id, nombre, maximo in db.session.execute(
+        select(LimiteAusenciasEquipo.aprobador_id, Usuario.nombre, LimiteAusenciasEquipo.max_ausentes)
+        .join(Usuario, Usuario.id == LimiteAusenciasEquipo.aprobador_id)
+        .where(LimiteAusenciasEquipo.aprobador_id.in_(ids_responsables(usuario_id)))
+    )}
+    if not limites:
+        return []
+
+    # Compañeros de cada equipo (el propio usuario se suma aparte, como +1)
+    miembros = {}
+    for equipo, miembro in db.session.execute(
+        select(JerarquiaAprobacion.ancestro_id, JerarquiaAprobacion.descendiente_id).where(
+            JerarquiaAprobacion.ancestro_id.in_(limites),
+            JerarquiaAprobacion.profundidad <= _profundidad(None),
+            JerarquiaAprobacion.descendiente_id != usuario_id
+        )
+    ):
+        miembros.setdefault(equipo, set()).add(miembro)
+
+    todos = set().union(*miembros.values())
+    intervalos = intervalos_aprobados(todos, fecha_inicio, fecha_fin) if todos else {}
+    laborables = mascara_laborable(fecha_inicio, fecha_fin)
+
+    excesos = []
+    for equipo, (nombre, maximo) in limites.items():
+        companeros = miembros.get(equipo, ())
+        ocupacion = ocupacion_diaria({uid: intervalos[uid] for uid in companeros if uid in intervalos},
+                                     fecha_inicio, fecha_fin)
+        for i, (ausentes, laborable) in enumerate(zip(ocupacion, laborables)):
+            if laborable and ausentes + 1 > maximo:
+                excesos.append({'equipo': equipo, 'nombre': nombre,
+                                'fecha': fecha_inicio + timedelta(days=i),
+                                'ausentes': ausentes, 'limite': maximo})
+    excesos.sort(key=lambda e: (e['fecha'], e['equipo']))
+    return excesos
+
+
+def bloquear_limites(usuario_ids):
+    """
+    Bloquea (SELECT ... FOR UPDATE) hasta el final de la transacción los
+    límites de todos los equipos de esos usuarios.
+
+    Comprobar la capacidad y después aprobar es leer-y-escribir: sin bloqueo,
+    dos aprobadores (o dos lotes) del mismo equipo ven a la vez
+    'ausentes + 1 <= límite' y confirman los dos, superándolo. Con la fila
+    del límite bloqueada, la segunda transacción espera a que la primera
+    confirme y su comprobación (READ COMMITTED: cada sentencia ve lo ya
+    confirmado) cuenta esa aprobación. Se bloquean todos los equipos en una
+    sentencia y por aprobador_id para que dos lotes no se interbloqueen.
+    SQLite no tiene FOR UPDATE y lo omite.
+
+    Returns:
+        list: ids de los equipos bloqueados.
+    """
+    usuario_ids = set(usuario_ids)
+    if not usuario_ids:
+        return []
+    equipos = select(JerarquiaAprobacion.ancestro_id).where(
+        JerarquiaAprobacion.descendiente_id.in_(usuario_ids),
+        JerarquiaAprobacion.profundidad <= _profundidad(None)
+    )
+    return list(db.session.scalars(
+        select(LimiteAusenciasEquipo.aprobador_id)
+        .where(LimiteAusenciasEquipo.aprobador_id.in_(equipos))
+        .order_by(LimiteAusenciasEquipo.aprobador_id)
+        .with_for_update()
+    ))
+
+
+def describir_excesos(excesos, max_fechas=5):
+    """Mensaje legible para el usuario a partir de dias_sobre_capacidad()."""
+    por_equipo = {}
+    for exceso in excesos:
+        por_equipo.setdefault((exceso['nombre'], exceso['limite']), []).append(exceso['fecha'])
+    partes = []
+    for (nombre, limite), fechas in por_equipo.items():
+        texto = ', '.join(f.strftime('%d/%m/%Y') for f in fechas[:max_fechas])
+        if len(fechas) > max_fechas:
+            texto += f' y {len(fechas) - max_fechas} más'
+        partes.append(f'equipo de {nombre} (máximo {limite} ausentes): {texto}')
+    return 'Se superaría el límite de ausencias simultáneas en ' + '; '.join(partes) + '.'
@@ -0,0 +1,201 @@
+"""
+Saldos de vacaciones: libro de movimientos y reconciliación.
+
+Libro de movimientos ('movimientos_saldo'): todo cambio de un saldo pasa por
+registrar_movimiento(), que añade la fila al libro y suma el delta al total
+materializado de SaldoVacaciones con un UPDATE atómico
+(SET dias_disfrutados = dias_disfrutados + :delta). Leer un saldo sigue
+siendo leer una fila; dos aprobaciones simultáneas no se pisan porque
+ninguna escribe un valor leído antes; y cualquier saldo pasado se obtiene
+sumando el libro (saldo_segun_movimientos).
+
+Reconciliación:
+
+'dias_disfrutados' de SaldoVacaciones se va actualizando en cada aprobación,
+recálculo por festivo, etc. Aquí se recalcula para todos los usuarios de un
+año a partir de las solicitudes (misma regla que 'flask recalcular': las
+aprobadas vigentes que no son cancelación, por año de fecha_solicitud) con
+una única agregación GROUP BY, y se compara con lo guardado.
+
+Las correcciones se aplican con un UPDATE masivo por clave primaria y dejan
+un movimiento y una fila de auditoría en 'cambios_saldo' por saldo corregido.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, insert, literal, null, select, update
+
+from src.models import db, Usuario, SaldoVacaciones, SolicitudVacaciones, CambioSaldo, MovimientoSaldo
+from src.database import insert_con_conflicto
+
+ORIGEN_RECONCILIACION = 'reconciliacion'
+
+
+# ==========================================
+# LIBRO DE MOVIMIENTOS
+# ==========================================
+
+def abrir_saldo(usuario_id, anio, dias_totales, motivo=None):
+    """
+    Crea el saldo (usuario, año) con 'dias_totales' y su movimiento de
+    apertura, si no existe ya. Con ON CONFLICT DO NOTHING, dos peticiones
+    que lo abren a la vez no chocan.
+
+    Returns:
+        bool: True si lo ha creado.
+    """
+    resultado = db.session.execute(
+        insert_con_conflicto(db.session, SaldoVacaciones.__table__).values(
+            usuario_id=usuario_id, anio=anio, dias_totales=dias_totales,
+            dias_disfrutados=0, dias_carryover=0
+        ).on_conflict_do_nothing(index_elements=['usuario_id', 'anio'])
+    )
+    if not resultado.rowcount:
+        return False
+    db.session.add(MovimientoSaldo(usuario_id=usuario_id, anio=anio, tipo='apertura',
+                                   delta_totales=dias_totales, delta_disfrutados=0, motivo=motivo))
+    return True
+
+
+def registrar_movimiento(usuario_id, anio, tipo, delta_disfrutados=0, delta_totales=0,
+                         solicitud_id=None, motivo=None, dias_base=None):
+    """
+    Apunta un movimiento en el libro y lo suma al saldo materializado (sin
+    commit). El saldo no se lee antes de escribirlo.
+
+    Args:
+        dias_base: si se indica y el saldo no existe, se abre con este total
+            (base contractual). Sin él, un saldo inexistente no se toca.
+
+    Returns:
+        bool: False si no había saldo y no se ha apuntado nada.
+    """
+    if dias_base is not None:
+        abrir_saldo(usuario_id, anio, dias_base)
+
+    resultado = db.session.execute(update(SaldoVacaciones).where(
+        SaldoVacaciones.usuario_id == usuario_id, SaldoVacaciones.anio == anio
+    ).values(
+        dias_totales=SaldoVacaciones.dias_totales + delta_totales,
+        dias_disfrutados=SaldoVacaciones.dias_disfrutados + delta_disfrutados
+    ))
+    if not resultado.rowcount:
+        return False
+
+    db.session.add(MovimientoSaldo(usuario_id=usuario_id, anio=anio, tipo=tipo,
+                                   delta_totales=delta_totales, delta_disfrutados=delta_disfrutados,
+                                   solicitud_id=solicitud_id, motivo=motivo))
+    return True
+
+
+def saldo_segun_movimientos(usuario_id, anio, hasta=None):
+    """
+    (dias_totales, dias_disfrutados) de un saldo sumando el libro; con
+    'hasta' (datetime), el saldo que había en ese momento.
+    """
+    consulta = select(
+        func.coalesce(func.sum(MovimientoSaldo.delta_totales), 0),
+        func.coalesce(func.sum(MovimientoSaldo.delta_disfrutados), 0)
+    ).where(MovimientoSaldo.usuario_id == usuario_id, MovimientoSaldo.anio == anio)
+    if hasta is not None:
+        consulta = consulta.where(MovimientoSaldo.fecha <= hasta)
+    totales, disfrutados = db.session.execute(consulta).one()
+    return totales, disfrutados
+
+
+# ==========================================
+# RECONCILIACIÓN
+# ==========================================
+
+
+# saldo_id None: hay consumo pero no existe saldo del año
+Descuadre = namedtuple('Descuadre', ['usuario_id', 'nombre', 'email', 'saldo_id',
+                                     'dias_guardados', 'dias_calculados'])
+
+
+def _consumo_por_usuario(anio):
+    """Subconsulta (usuario_id, dias): días consumidos en el año según las solicitudes."""
+    return select(
+        SolicitudVacaciones.usuario_id,
+        func.sum(SolicitudVacaciones.dias_solicitados).label('dias')
+    ).where(
+        SolicitudVacaciones.estado == 'aprobada',
+        SolicitudVacaciones.es_actual == True,
+        SolicitudVacaciones.tipo_accion != 'cancelacion',
+        SolicitudVacaciones.fecha_solicitud >= datetime(anio, 1, 1),
+        SolicitudVacaciones.fecha_solicitud < datetime(anio + 1, 1, 1),
+    ).group_by(SolicitudVacaciones.usuario_id).subquery('consumo')
+
+
+def descuadres_saldos(anio):
+    """
+    Saldos del año cuyo 'dias_disfrutados' no coincide con las solicitudes,
+    más los usuarios con consumo y sin saldo. Ordenados por nombre.
+    """
+    consumo = _consumo_por_usuario(anio)
+    calculados = func.coalesce(consumo.c.dias, 0)
+
+    con_saldo = select(
+        SaldoVacaciones.usuario_id, Usuario.nombre, Usuario.email, SaldoVacaciones.id,
+        SaldoVacaciones.dias_disfrutados, calculados
+    ).join(Usuario, Usuario.id == SaldoVacaciones.usuario_id).outerjoin(
+        consumo, consumo.c.usuario_id == SaldoVacaciones.usuario_id
+    ).where(SaldoVacaciones.anio == anio, SaldoVacaciones.dias_disfrutados != calculados)
+
+    sin_saldo = select(
+        consumo.c.usuario_id, Usuario.nombre, Usuario.email, null(), literal(0), consumo.c.dias
+    ).join(Usuario, Usuario.id == consumo.c.usuario_id).where(
+        ~select(SaldoVacaciones.id).where(SaldoVacaciones.usuario_id == consumo.c.usuario_id,
+                                          SaldoVacaciones.anio == anio).exists(),
+        consumo.c.dias != 0
+    )
+
+    descuadres = [Descuadre(*fila) for consulta in (con_saldo, sin_saldo)
+                  for fila in db.session.execute(consulta)]
+    descuadres.sort(key=lambda d: (d.nombre, d.usuario_id))
+    return descuadres
+
+
+def corregir_descuadres(anio, descuadres, actor_label='system:cli'):
+    """
+    Lleva 'dias_disfrutados' al valor calculado (sin commit): un UPDATE
+    masivo que suma la diferencia a los saldos existentes, un INSERT para
+    los que faltan, y movimientos y auditoría en bloque.
+    """
+    existentes = [d for d in descuadres if d.saldo_id is not None]
+    nuevos = [d for d in descuadres if d.saldo_id is None]
+    ahora = datetime.utcnow()
+    motivo = f'Reconciliación de días disfrutados {anio}'
+    movimientos = []
+
+    if existentes:
+        saldos = SaldoVacaciones.__table__
+        db.session.execute(
+            saldos.update().where(saldos.c.id == bindparam('b_id')).values(
+                dias_disfrutados=saldos.c.dias_disfrutados + bindparam('b_delta')),
+            [{'b_id': d.saldo_id, 'b_delta': d.dias_calculados - d.dias_guardados} for d in existentes]
+        )
+    if nuevos:
+        # Saldo con la base contractual, como el resto de saldos creados al vuelo
+        bases = dict(db.session.execute(select(Usuario.id, Usuario.dias_vacaciones).where(
+            Usuario.id.in_([d.usuario_id for d in nuevos]))).all())
+        db.session.execute(insert(SaldoVacaciones), [
+            {'usuario_id': d.usuario_id, 'anio': anio, 'dias_totales': bases[d.usuario_id],
+             'dias_disfrutados': d.dias_calculados, 'dias_carryover': 0} for d in nuevos
+        ])
+        movimientos += [{'usuario_id': d.usuario_id, 'anio': anio, 'tipo': 'apertura',
+                         'delta_totales': bases[d.usuario_id], 'delta_disfrutados': 0,
+                         'motivo': motivo, 'fecha': ahora} for d in nuevos]
+    if descuadres:
+        movimientos += [{'usuario_id': d.usuario_id, 'anio': anio, 'tipo': 'reconciliacion',
+                         'delta_totales': 0, 'delta_disfrutados': d.dias_calculados - d.dias_guardados,
+                         'motivo': motivo, 'fecha': ahora} for d in descuadres]
+        db.session.execute(insert(MovimientoSaldo), movimientos)
+        db.session.execute(insert(CambioSaldo), [
+            {'usuario_id': d.usuario_id, 'actor_id': None, 'actor_label': actor_label, 'anio': anio,
+             'dias_anteriores': d.dias_guardados, 'dias_nuevos': d.dias_calculados,
+             'delta': d.dias_calculados - d.dias_guardados,
+             'motivo': motivo, 'origen': ORIGEN_RECONCILIACION,
+             'fecha': ahora} for d in descuadres
+        ])
+    return len(descuadres)
@@ -1,37 +1,47 @@
 import click
 from flask.cli import with_appcontext
 from src import db
-from src.models import Usuario, SaldoVacaciones, SolicitudVacaciones, CambioSaldo
+from src.models import Usuario, SaldoVacaciones, SolicitudVacaciones
 
 MSG_OPERACION_CANCELADA = "❌ Operación cancelada"
 
 @click.command('cerrar-anio')
 @click.argument('anio_origen', type=int)
-@click.option('--max-carryover', default=10, type=int, help='Máximo de días a traspasar al año siguiente')
+@click.option('--max-carryover', default=10, type=click.IntRange(min=0), help='Máximo de días a traspasar al año siguiente')
 @click.option('--gestionar-festivos', 
               type=click.Choice(['archivar', 'eliminar', 'mantener'], case_sensitive=False),
               default='archivar',
               help='Qué hacer con festivos antiguos: archivar (marcar inactivos), eliminar (borrar) o mantener')
 @click.option('--anios-antiguedad', default=1, type=int, help='Archivar/eliminar festivos con X años de antiguedad (default: 1)')
+@click.option('--lote', default=1000, type=click.IntRange(min=1), help='Usuarios por transacción')
+@click.option('--dry-run', is_flag=True, help='Solo mostrar estadísticas, sin modificar nada')
 @click.option('--force', is_flag=True, help='Forzar ejecución sin confirmación')
 @with_appcontext
-def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_antiguedad, force):
+def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_antiguedad, lote, dry_run, force):
     """
     Cierra el año fiscal especificado y genera los saldos del siguiente.
     Opcionalmente gestiona festivos antiguos.
+
+    Los saldos se generan por lotes con INSERT ... SELECT (ver
+    src/year_close.py); si el proceso se interrumpe, volver a lanzarlo
+    continúa desde el último lote confirmado.
     
     Ejemplos:
+        flask cerrar-anio 2024 --dry-run
         flask cerrar-anio 2024
         flask cerrar-anio 2024 --max-carryover 12 --gestionar-festivos archivar
         flask cerrar-anio 2024 --gestionar-festivos eliminar --anios-antiguedad 2
     """
-    from src.models import Festivo
+    import time
+    from src.models import Festivo, CierreAnio
     from datetime import date
     from src.utils import invalidar_cache_festivos
+    from src.year_close import estadisticas_cierre, cerrar_saldos
     
     db.create_all()  # Ensure tables exist
     
     anio_nuevo = anio_origen + 1
+    inicio = time.perf_counter()
     
     print("=" * 70)
     print(f"  CIERRE DE AÑO FISCAL {anio_origen} → {anio_nuevo}")
@@ -41,9 +51,14 @@ def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_an
     # 1. VERIFICACIONES PREVIAS
     # ========================================
     
-    # Verificar si ya existe cierre
-    saldos_nuevos = SaldoVacaciones.query.filter_by(anio=anio_nuevo).count()
-    if saldos_nuevos > 0 and not force:
+    estadisticas = estadisticas_cierre(anio_origen, max_carryover)
+    checkpoint = db.session.get(CierreAnio, anio_origen)
+    reanudable = (checkpoint is not None and checkpoint.fecha_fin is None
+                  and checkpoint.max_carryover == max_carryover and checkpoint.ultimo_usuario_id)
+
+    # Verificar si ya existe cierre (un cierre interrumpido se reanuda sin preguntar)
+    saldos_nuevos = estadisticas['ya_cerrados']
+    if saldos_nuevos > 0 and not force and not reanudable and not dry_run:
         print(f"\n⚠️  ADVERTENCIA: Ya existen {saldos_nuevos} saldos para {anio_nuevo}")
         print("   Si quieres rehacer el cierre, usa --force")
         if not click.confirm('\n¿Continuar de todas formas?', default=False):
@@ -54,30 +69,43 @@ def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_an
     # 2. RESUMEN DE OPERACIONES
     # ========================================
     
-    usuarios = Usuario.query.filter(Usuario.activo == True).all()
-    
     # Calcular festivos afectados
     # FIX: Archive festivos before the NEW year (includes the closing year)
     # With anios_antiguedad=1 and closing 2024→2025: limite=2025, so festivos < 2025-01-01 are archived
     anio_limite = anio_nuevo - anios_antiguedad + 1
-    festivos_antiguos = Festivo.query.filter(
-        Festivo.fecha < date(anio_limite, 1, 1),
-        Festivo.activo == True
-    ).all() if gestionar_festivos != 'mantener' else []
+    filtro_festivos = (Festivo.fecha < date(anio_limite, 1, 1), Festivo.activo == True)
+    festivos_antiguos = Festivo.query.filter(*filtro_festivos).order_by(Festivo.fecha).limit(11).all() \
+        if gestionar_festivos != 'mantener' else []
+    num_festivos = Festivo.query.filter(*filtro_festivos).count() if festivos_antiguos else 0
     
     print("\n📋 RESUMEN DE OPERACIONES:")
-    print(f"   • Usuarios a procesar: {len(usuarios)}")
+    print(f"   • Usuarios a procesar: {estadisticas['usuarios']}")
     print(f"   • Año origen: {anio_origen}")
     print(f"   • Año nuevo: {anio_nuevo}")
     print(f"   • Máximo carryover: {max_carryover} días")
     print(f"   • Gestión de festivos: {gestionar_festivos.upper()}")
     
     if gestionar_festivos != 'mantener':
-        print(f"   • Festivos a {gestionar_festivos}: {len(festivos_antiguos)} (anteriores a {anio_limite})")
-        if festivos_antiguos and len(festivos_antiguos) <= 10:
+        print(f"   • Festivos a {gestionar_festivos}: {num_festivos} (anteriores a {anio_limite})")
+        if festivos_antiguos and num_festivos <= 10:
             print(f"\n   Festivos afectados:")
             for f in festivos_antiguos:
                 print(f"      - {f.fecha.strftime('%d/%m/%Y')}: {f.descripcion}")
+
+    print(f"\n📊 ESTADÍSTICAS DEL CIERRE:")
+    print(f"   • Sin saldo {anio_origen} (base contractual): {estadisticas['usuarios'] - estadisticas['con_saldo']}")
+    print(f"   • Con días sobrantes: {estadisticas['con_sobrante']} "
+          f"({estadisticas['recortados']} recortados a {max_carryover})")
+    print(f"   • Días traspasados: {estadisticas['dias_traspasados']}")
+    print(f"   • Con deuda: {estadisticas['con_deuda']} ({estadisticas['dias_deuda']} días)")
+    print(f"   • Con saldo {anio_nuevo} ya creado: {saldos_nuevos}")
+    if reanudable:
+        print(f"\n⏯️  Cierre interrumpido: se reanudará tras el usuario {checkpoint.ultimo_usuario_id}")
+
+    if dry_run:
+        print("\n(dry-run: no se ha modificado nada)")
+        print(f"⏱️  {time.perf_counter() - inicio:.2f} s")
+        return
     
     # Confirmación
     if not force:
@@ -98,19 +126,13 @@ def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_an
     if gestionar_festivos != 'mantener' and festivos_antiguos:
         print(f"📅 Gestionando festivos antiguos (< {anio_limite})...")
         
+        consulta = Festivo.query.filter(*filtro_festivos)
         if gestionar_festivos == 'archivar':
             # Marcar como inactivos (soft delete)
-            for festivo in festivos_antiguos:
-                festivo.activo = False
-                print(f"   ⏸️  Archivado: {festivo.fecha.strftime('%d/%m/%Y')} - {festivo.descripcion}")
-                festivos_procesados += 1
-        
+            festivos_procesados = consulta.update({Festivo.activo: False}, synchronize_session=False)
         elif gestionar_festivos == 'eliminar':
             # Eliminar permanentemente
-            for festivo in festivos_antiguos:
-                print(f"   🗑️  Eliminado: {festivo.fecha.strftime('%d/%m/%Y')} - {festivo.descripcion}")
-                db.session.delete(festivo)
-                festivos_procesados += 1
+            festivos_procesados = consulta.delete(synchronize_session=False)
         
         db.session.commit()
         invalidar_cache_festivos()  # ✅ Invalidar cache después de cambios
@@ -121,103 +143,24 @@ def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_an
     # 4. CIERRE DE SALDOS DE VACACIONES
     # ========================================
     
-    print(f"💼 Procesando saldos de vacaciones...")
-    print()
-    
-    count_creados = 0
-    count_actualizados = 0
-    count_saltados = 0
-    errores = []
+    print(f"💼 Procesando saldos de vacaciones (lotes de {lote})...")
+    inicio_saldos = time.perf_counter()
+    procesados = [0]
+
+    def _progreso(checkpoint, usuarios_lote):
+        procesados[0] += usuarios_lote
+        print(f"   ✅ {procesados[0]:>7} usuarios | hasta id {checkpoint.ultimo_usuario_id} "
+              f"| {time.perf_counter() - inicio_saldos:.2f} s")
 
-    for u in usuarios:
-        try:
-            # 1. Obtener saldo del año que cierra
-            saldo_antiguo = SaldoVacaciones.query.filter_by(
-                usuario_id=u.id,
-                anio=anio_origen
-            ).first()
-
-            # Si no tiene saldo del año anterior, usar base contractual
-            if not saldo_antiguo:
-                sobrante = 0
-                print(f"   ⚠️  {u.nombre}: No tiene saldo {anio_origen}, usando base contractual")
-            else:
-                sobrante = saldo_antiguo.dias_totales - saldo_antiguo.dias_disfrutados
-
-            # 2. Aplicar política de Carryover
-            if sobrante > 0:
-                dias_a_traspasar = min(sobrante, max_carryover)
-                simbolo = "✅"
-            elif sobrante < 0:
-                dias_a_traspasar = sobrante  # Deuda completa
-                simbolo = "⚠️"
-            else:
-                dias_a_traspasar = 0
-                simbolo = "➖"
-
-            # 3. Calcular base del nuevo año
-            dias_base_nuevo_anio = u.dias_vacaciones 
-            total_nuevo = dias_base_nuevo_anio + dias_a_traspasar
-
-            # 4. Crear o Actualizar Saldo del Año Nuevo
-            saldo_nuevo = SaldoVacaciones.query.filter_by(
-                usuario_id=u.id,
-                anio=anio_nuevo
-            ).first()
-
-            saldo_aplicado = False
-
-            if not saldo_nuevo:
-                saldo_nuevo = SaldoVacaciones(
-                    usuario_id=u.id,
-                    anio=anio_nuevo,
-                    dias_totales=total_nuevo,
-                    dias_disfrutados=0,
-                    dias_carryover=dias_a_traspasar
-                )
-                db.session.add(saldo_nuevo)
-                count_creados += 1
-                saldo_aplicado = True
-                print(f"   {simbolo} {u.nombre:30} | Base: {dias_base_nuevo_anio:2} + Carryover: {dias_a_traspasar:3} = {total_nuevo:3} días")
-
-            elif force:
-                # Si force, actualizar saldo existente
-                saldo_nuevo.dias_totales = total_nuevo
-                saldo_nuevo.dias_carryover = dias_a_traspasar
-                saldo_nuevo.dias_disfrutados = 0  # Reset
-                count_actualizados += 1
-                saldo_aplicado = True
-                print(f"   🔄 {u.nombre:30} | ACTUALIZADO (force) = {total_nuevo} días")
-
-            else:
-                count_saltados += 1
-                print(f"   ⏭️  {u.nombre:30} | Ya existe saldo {anio_nuevo} (saltado)")
-
-            # 5. Auditoría: registrar el ajuste de carryover si lo hubo
-            if saldo_aplicado and dias_a_traspasar != 0:
-                db.session.add(CambioSaldo(
-                    usuario_id=u.id,
-                    actor_id=None,
-                    actor_label='system:cli',
-                    anio=anio_nuevo,
-                    dias_anteriores=dias_base_nuevo_anio,
-                    dias_nuevos=total_nuevo,
-                    delta=dias_a_traspasar,
-                    motivo=f"Ajuste cierre {anio_origen}",
-                    origen='cli',
-                ))
-
-        except Exception as e:
-            errores.append(f"{u.nombre}: {str(e)}")
-            print(f"   ❌ {u.nombre}: ERROR - {str(e)}")
-
-    # Commit de saldos
     try:
-        db.session.commit()
+        checkpoint, reanudado_desde = cerrar_saldos(
+            anio_origen, max_carryover, force=force, lote=lote, al_confirmar_lote=_progreso)
     except Exception as e:
         db.session.rollback()
         print(f"\n❌ ERROR AL HACER COMMIT: {str(e)}")
+        print("   Los lotes anteriores quedaron confirmados; vuelve a lanzar el comando para reanudar.")
         return
+    duracion_saldos = time.perf_counter() - inicio_saldos
     
     # ========================================
     # 5. RESUMEN FINAL
@@ -232,17 +175,20 @@ def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_an
         print(f"   • Procesados: {festivos_procesados}")
         print(f"   • Acción: {gestionar_festivos.upper()}")
     
+    total = checkpoint.creados + checkpoint.actualizados + checkpoint.saltados
     print(f"\n💼 Saldos de Vacaciones:")
-    print(f"   • Creados: {count_creados}")
+    if reanudado_desde:
+        print(f"   • Reanudado tras el usuario {reanudado_desde}")
+    print(f"   • Creados: {checkpoint.creados}")
     if force:
-        print(f"   • Actualizados: {count_actualizados}")
-    print(f"   • Saltados: {count_saltados}")
-    print(f"   • Total procesado: {count_creados + count_actualizados + count_saltados}/{len(usuarios)}")
-    
-    if errores:
-        print(f"\n❌ Errores encontrados ({len(errores)}):")
-        for error in errores:
-            print(f"   • {error}")
+        print(f"   • Actualizados: {checkpoint.actualizados}")
+    print(f"   • Saltados: {checkpoint.saltados}")
+    print(f"   • Total procesado: {total}/{estadisticas['usuarios']}")
+
+    print(f"\n⏱️  Tiempo:")
+    print(f"   • Saldos: {duracion_saldos:.2f} s"
+          + (f" ({procesados[0] / duracion_saldos:.0f} usuarios/s)" if duracion_saldos > 0 and procesados[0] else ""))
+    print(f"   • Total: {time.perf_counter() - inicio:.2f} s")
     
     print("\n" + "=" * 70)
     print("✅ PROCESO COMPLETADO")
@@ -251,24 +197,33 @@ def cerrar_anio_command(anio_origen, max_carryover, gestionar_festivos, anios_an
 
 @click.command('import-users')
 @click.argument('csv_file', type=click.Path(exists=True))
+@click.option('--credenciales', type=click.Path(dir_okay=False),
+              help='Fichero CSV donde guardar las contraseñas generadas '
+                   '(default: <csv>_credenciales_<fecha>.csv junto al CSV)')
+@click.option('--lote', default=500, type=click.IntRange(min=1), help='Filas por transacción')
+@click.option('--procesos', default=None, type=click.IntRange(min=1),
+              help='Procesos para calcular los hashes (default: uno por CPU)')
 @with_appcontext
-def import_users_command(csv_file):
+def import_users_command(csv_file, credenciales, lote, procesos):
     """
     Importa usuarios desde un fichero CSV.
     Formato esperado: nombre,email
+
+    Las contraseñas generadas se escriben en el fichero de credenciales
+    (permisos 600), no en pantalla.
     """
     import csv
-    import secrets
-    from werkzeug.security import generate_password_hash
+    import os
+    import time
     from datetime import datetime
-    from src.models import SaldoVacaciones  # ✅ Añadir import
+    from src.user_import import importar_usuarios
 
     db.create_all()  # Ensure tables exist
     print(f"--- Importando usuarios desde {csv_file} ---")
     
     count_new = 0
     count_skip = 0
-    anio_actual = datetime.now().year  # ✅ Calcular una vez
+    inicio = time.perf_counter()
 
     with open(csv_file, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
@@ -278,49 +233,36 @@ def import_users_command(csv_file):
             print("❌ Error: El CSV debe tener columnas 'nombre' y 'email'.")
             return
 
-        for row in reader:
-            nombre = row.get('nombre', '').strip()
-            email = row.get('email', '').strip()
-
-            if not email:
-                continue
-
-            existing = Usuario.query.filter_by(email=email).first()
-            if existing:
-                print(f"Saltado {email}: Ya existe.")
-                count_skip += 1
-                continue
-
-            # Crear usuario
-            raw_pass = secrets.token_urlsafe(8)
-            password_hash = generate_password_hash(raw_pass)
-
-            new_user = Usuario(
-                nombre=nombre,
-                email=email,
-                password=password_hash,
-                rol='usuario',
-                dias_vacaciones=25
-            )
-            
-            db.session.add(new_user)
-            db.session.flush()  # ✅ Genera new_user.id
-            
-            # ✅ NUEVO: Crear saldo automáticamente
-            saldo = SaldoVacaciones(
-                usuario_id=new_user.id,
-                anio=anio_actual,
-                dias_totales=25,
-                dias_disfrutados=0,
-                dias_carryover=0
-            )
-            db.session.add(saldo)
-            
-            count_new += 1
-            print(f"✅ Creado: {nombre} ({email}) - Pass: {raw_pass}")
+        if not credenciales:
+            base = os.path.splitext(csv_file)[0]
+            credenciales = f"{base}_credenciales_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        try:
+            # Solo legible por el propietario; nunca sobrescribe uno existente
+            fd = os.open(credenciales, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            print(f"❌ Error: El fichero de credenciales {credenciales} ya existe.")
+            return
 
-    db.session.commit()
-    print(f"\nResumen: {count_new} creados, {count_skip} saltados.")
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as salida:
+            writer = csv.writer(salida)
+            writer.writerow(['nombre', 'email', 'password'])
+
+            for creados, saltados in importar_usuarios(reader, lote=lote, procesos=procesos):
+                for email in saltados:
+                    print(f"Saltado {email}: Ya existe.")
+                for nombre, email, raw_pass in creados:
+                    writer.writerow([nombre, email, raw_pass])
+                    print(f"✅ Creado: {nombre} ({email})")
+                salida.flush()
+                count_new += len(creados)
+                count_skip += len(saltados)
+
+    print(f"\nResumen: {count_new} creados, {count_skip} saltados "
+          f"({time.perf_counter() - inicio:.2f} s).")
+    if count_new:
+        print(f"🔑 Credenciales guardadas en {credenciales}")
+    else:
+        os.remove(credenciales)
 
 
 @click.command('recalcular')
@@ -419,11 +361,69 @@ def recalcular_command(usuario, anio, dry_run):
         print(MSG_OPERACION_CANCELADA)
         return
 
-    saldo.dias_disfrutados = dias_disfrutados_calc
+    from src.balances import registrar_movimiento
+    registrar_movimiento(user.id, anio, 'reconciliacion', delta_disfrutados=diff,
+                         motivo=f'flask recalcular {anio}')
     db.session.commit()
     print("\n✅ Saldo actualizado.")
 
 
+@click.command('reconciliar-saldos')
+@click.option('--anio', type=int, default=None, help='Año a reconciliar (default: año actual)')
+@click.option('--fix', is_flag=True, help='Corregir los descuadres encontrados')
+@click.option('--force', is_flag=True, help='Corregir sin pedir confirmación')
+@with_appcontext
+def reconciliar_saldos_command(anio, fix, force):
+    """
+    Recalcula 'dias_disfrutados' de TODOS los saldos de un año a partir de
+    las solicitudes aprobadas (la misma regla que 'flask recalcular') y
+    muestra los descuadres. Con --fix los corrige de una vez, dejando
+    auditoría en 'cambios_saldo'.
+
+    Ejemplos:
+        flask reconciliar-saldos
+        flask reconciliar-saldos --anio 2025 --fix
+    """
+    import time
+    from datetime import datetime
+    from src.balances import descuadres_saldos, corregir_descuadres
+
+    if anio is None:
+        anio = datetime.now().year
+
+    inicio = time.perf_counter()
+    descuadres = descuadres_saldos(anio)
+
+    print("=" * 70)
+    print(f"  RECONCILIACIÓN DE SALDOS DE VACACIONES {anio}")
+    print("=" * 70)
+
+    if not descuadres:
+        print(f"\n✅ Todos los saldos cuadran ({time.perf_counter() - inicio:.2f} s).")
+        return
+
+    print(f"\n⚠️  Descuadres encontrados: {len(descuadres)}\n")
+    print(f"   {'Usuario':30} {'Guardado':>9} {'Calculado':>10} {'Dif.':>6}")
+    for d in descuadres:
+        guardado = d.dias_guardados if d.saldo_id is not None else 'sin saldo'
+        print(f"   {d.nombre[:30]:30} {guardado:>9} {d.dias_calculados:>10} "
+              f"{d.dias_calculados - d.dias_guardados:>+6}")
+    print(f"\n   Diferencia neta: {sum(d.dias_calculados - d.dias_guardados for d in descuadres):+d} días "
+          f"({time.perf_counter() - inicio:.2f} s)")
+
+    if not fix:
+        print("\n💡 Usa --fix para corregirlos.")
+        return
+
+    if not force and not click.confirm('\n¿Corregir todos los descuadres?', default=False):
+        print(MSG_OPERACION_CANCELADA)
+        return
+
+    corregidos = corregir_descuadres(anio, descuadres)
+    db.session.commit()
+    print(f"\n✅ {corregidos} saldos corregidos.")
+
+
 @click.command('cambiar-saldo')
 @click.option('--usuario', '-u', required=True, help='Email del usuario')
 @click.option('--delta', type=int, required=True,
@@ -537,18 +537,95 @@ def init_admin_command():
     
     # ✅ NUEVO: Crear saldo automáticamente para el año actual
     from datetime import datetime
-    from src.models import SaldoVacaciones
+    from src.balances import abrir_saldo
     
-    anio_actual = datetime.now().year
-    saldo = SaldoVacaciones(
-        usuario_id=admin.id,
-        anio=anio_actual,
-        dias_totales=25,
-        dias_disfrutados=0,
-        dias_carryover=0
-    )
-    db.session.add(saldo)
+    abrir_saldo(admin.id, datetime.now().year, 25)
     
     db.session.commit()
     print(f"✅ Usuario Administrador creado: {email}")
-    
\ No newline at end of file
+    
+
+
+@click.command('recalcular-sugerencias')
+@click.option('--usuario', '-u', default=None, help='Email del usuario (default: todos)')
+@with_appcontext
+def recalcular_sugerencias_command(usuario):
+    """
+    Recalcula desde el histórico los horarios sugeridos en el formulario de
+    fichaje (normalmente lo hace el job nocturno).
+
+    Ejemplos:
+        flask recalcular-sugerencias
+        flask recalcular-sugerencias -u john.doe@adhara.io
+    """
+    from src.suggestions import recalcular_sugerencias
+
+    usuario_ids = None
+    if usuario:
+        user = Usuario.query.filter_by(email=usuario).first()
+        if not user:
+            print(f"❌ Usuario no encontrado: {usuario}")
+            return
+        usuario_ids = [user.id]
+
+    total = recalcular_sugerencias(usuario_ids)
+    db.session.commit()
+    print(f"✅ Sugerencias recalculadas para {total} usuarios.")
+
+
+@click.command('archivar-fichajes')
+@click.option('--anios', type=int, default=None,
+              help='Años en caliente (default: FICHAJES_RETENCION_ANIOS)')
+@click.option('--lote', default=1000, type=int, help='Grupos de fichajes por transacción')
+@click.option('--dry-run', is_flag=True, help='Solo contar lo que se archivaría')
+@click.option('--force', is_flag=True, help='Archivar sin pedir confirmación')
+@with_appcontext
+def archivar_fichajes_command(anios, lote, dry_run, force):
+    """
+    Mueve las versiones sustituidas de fichajes (rectificaciones antiguas,
+    es_actual = False) anteriores al plazo de retención a la tabla de archivo
+    comprimida. La versión vigente de cada fichaje no se toca; la auditoría
+    sigue mostrando las versiones archivadas.
+
+    Ejemplos:
+        flask archivar-fichajes --dry-run
+        flask archivar-fichajes --anios 5 --force
+    """
+    from src.archive import archivar_fichajes, limite_retencion
+
+    limite = limite_retencion(anios)
+    versiones, grupos = archivar_fichajes(limite, lote=lote, dry_run=True)
+
+    print("=" * 70)
+    print("  ARCHIVO DE VERSIONES DE FICHAJES")
+    print("=" * 70)
+    print(f"\n📅 Versiones sustituidas anteriores a: {limite.strftime('%d/%m/%Y')}")
+    print(f"📦 A archivar: {versiones} versiones de {grupos} fichajes")
+
+    if dry_run or versiones == 0:
+        return
+
+    if not force and not click.confirm('\n¿Archivar?', default=False):
+        print(MSG_OPERACION_CANCELADA)
+        return
+
+    versiones, grupos = archivar_fichajes(limite, lote=lote)
+    print(f"\n✅ Archivadas {versiones} versiones de {grupos} fichajes.")
+
+
+@click.command('reconstruir-jerarquia')
+@with_appcontext
+def reconstruir_jerarquia_command():
+    """
+    Reconstruye desde cero la tabla de cierre de la jerarquía de aprobación
+    a partir de 'aprobadores' (normalmente se mantiene sola; útil tras cargas
+    masivas hechas fuera de la aplicación).
+
+    Ejemplo:
+        flask reconstruir-jerarquia
+    """
+    from src.hierarchy import recalcular_jerarquia
+
+    filas = recalcular_jerarquia()
+    db.session.commit()
+    print(f"✅ Jerarquía de aprobación reconstruida: {filas} relaciones.")
@@ -0,0 +1,208 @@
+"""
+Notificaciones en tiempo real del estado del reloj (Server-Sent Events).
+
+Cada pestaña abierta en /fichajes/reloj mantiene una conexión SSE con
+/fichajes/stream. Con workers gevent cada conexión es un greenlet esperando
+en una cola, así que mantener muchas abiertas es barato y no consulta la BBDD.
+
+Flujo de un cambio de estado (toggle, editar, eliminar, cierre nocturno):
+
+    publicar_estado(usuario_id, estado)
+        -> bus 'postgres': pg_notify() dentro de la transacción; Postgres lo
+           entrega a todos los workers (LISTEN) solo si hay COMMIT.
+        -> bus 'local': se guarda en la sesión y se reparte tras el COMMIT,
+           solo a las conexiones de este proceso (desarrollo / SQLite).
+    _repartir(usuario_id, evento)
+        -> cola de cada conexión SSE abierta por ese usuario en este proceso.
+
+CLOCK_EVENTS_BUS ('local' | 'postgres') fija el bus; por defecto se usa
+'postgres' si la BBDD es PostgreSQL.
+"""
+import json
+import queue
+import select
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, func, text, select as sa_select
+
+from src.models import db
+from src.database import SesionEnrutada
+
+CANAL = 'tempus_fichajes'
+
+# Eventos pendientes por conexión: si un cliente no lee, se descartan los viejos
+MAX_EVENTOS_EN_COLA = 20
+
+_suscriptores = {}  # usuario_id -> set(queue.Queue)
+_lock = threading.Lock()
+_escucha_iniciada = False
+
+
+def bus_configurado(app=None):
+    app = app or current_app
+    bus = app.config.get('CLOCK_EVENTS_BUS')
+    if bus:
+        return bus
+    return 'postgres' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql') else 'local'
+
+
+def estado_reloj(inicio=None):
+    """
+    Estado del reloj en el mismo formato que /fichajes/estado (sin duración,
+    que el cliente calcula a partir de 'inicio').
+
+    Args:
+        inicio: datetime de entrada del fichaje abierto, o None si no hay ninguno.
+    """
+    if inicio is None:
+        return {'activo': False, 'inicio': None, 'fecha': None}
+    return {'activo': True, 'inicio': inicio.isoformat(), 'fecha': inicio.date().isoformat()}
+
+
+# ==========================================
+# SUSCRIPCIONES (una cola por conexión SSE)
+# ==========================================
+
+def suscribir(usuario_id):
+    """Registra una conexión SSE del usuario y devuelve su cola de eventos."""
+    if bus_configurado() == 'postgres':
+        _iniciar_escucha_postgres(current_app._get_current_object())
+    cola = queue.Queue(maxsize=MAX_EVENTOS_EN_COLA)
+    with _lock:
+        _suscriptores.setdefault(usuario_id, set()).add(cola)
+    return cola
+
+
+def cancelar_suscripcion(usuario_id, cola):
+    with _lock:
+        colas = _suscriptores.get(usuario_id)
+        if colas is not None:
+            colas.discard(cola)
+            if not colas:
+                del _suscriptores[usuario_id]
+
+
+def _repartir(usuario_id, evento):
+    """Entrega el evento a todas las conexiones del usuario en este proceso."""
+    with _lock:
+        colas = list(_suscriptores.get(usuario_id, ()))
+    for cola in colas:
+        try:
+            cola.put_nowait(evento)
+        except queue.Full:
+            # Cliente que no consume: descartamos el evento más antiguo
+            try:
+                cola.get_nowait()
+            except queue.Empty:
+                pass
+            cola.put_nowait(evento)
+
+
+# ==========================================
+# PUBLICACIÓN (transaccional)
+# ==========================================
+
+def _evento(usuario_id, estado, fecha_afectada):
+    return {'usuario_id': usuario_id, 'estado': estado,
+            'fecha': fecha_afectada.isoformat() if fecha_afectada else None}
+
+
+def publicar_estado(usuario_id, estado, fecha_afectada=None):
+    """
+    Publica el nuevo estado del reloj del usuario. Se entrega solo si la
+    transacción actual de db.session hace COMMIT.
+
+    Args:
+        estado: dict de estado_reloj(), o None si el estado no cambia pero sí
+                los tramos de 'fecha_afectada' (p. ej. al editar un fichaje cerrado).
+    """
+    publicar_estados([(usuario_id, estado, fecha_afectada)])
+
+
+def publicar_estados(cambios):
+    """
+    Versión por lotes de publicar_estado: 'cambios' es una lista de tuplas
+    (usuario_id, estado, fecha_afectada). En Postgres se emite una única
+    sentencia para todo el lote.
+    """
+    eventos = [_evento(*cambio) for cambio in cambios]
+    if not eventos:
+        return
+
+    if bus_configurado() == 'postgres':
+        if len(eventos) == 1:
+            db.session.execute(sa_select(func.pg_notify(CANAL, json.dumps(eventos[0]))))
+        else:
+            db.session.execute(
+                text("SELECT pg_notify(:canal, p) FROM unnest(CAST(:payloads AS text[])) AS p"),
+                {'canal': CANAL, 'payloads': [json.dumps(e) for e in eventos]}
+            )
+    else:
+        db.session.info.setdefault('eventos_reloj', []).extend(eventos)
+
+
+@event.listens_for(SesionEnrutada, 'after_commit')
+def _tras_commit(sesion):
+    for evento in sesion.info.pop('eventos_reloj', ()):
+        _repartir(evento['usuario_id'], evento)
+
+
+@event.listens_for(SesionEnrutada, 'after_rollback')
+def _tras_rollback(sesion):
+    sesion.info.pop('eventos_reloj', None)
+
+
+# ==========================================
+# BUS ENTRE WORKERS (Postgres LISTEN/NOTIFY)
+# ==========================================
+
+def _iniciar_escucha_postgres(app):
+    """Arranca (una vez por proceso) el hilo/greenlet que escucha el canal."""
+    global _escucha_iniciada
+    with _lock:
+        if _escucha_iniciada:
+            return
+        _escucha_iniciada = True
+    hilo = threading.Thread(target=_escuchar_postgres, args=(app,),
+                            name='tempus-listen', daemon=True)
+    hilo.start()
+
+
+def _escuchar_postgres(app):
+    """
+    Mantiene una conexión dedicada (fuera del pool) en LISTEN y reparte cada
+    notificación a las conexiones SSE locales. Se reconecta si se cae.
+    """
+    while True:
+        conexion = None
+        try:
+            with app.app_context():
+                conexion = db.engine.raw_connection()
+            # La sacamos del pool: no debe ocupar un hueco de las peticiones
+            conexion.detach()
+            dbapi = conexion.driver_connection
+            dbapi.autocommit = True
+            with dbapi.cursor() as cursor:
+                cursor.execute(f'LISTEN {CANAL}')
+            app.logger.info(f"Escuchando notificaciones de fichajes en '{CANAL}'")
+
+            while True:
+                # select() está parcheado por gevent: cede el control mientras espera
+                if select.select([dbapi], [], [], 60) == ([], [], []):
+                    continue
+                dbapi.poll()
+                while dbapi.notifies:
+                    notificacion = dbapi.notifies.pop(0)
+                    evento = json.loads(notificacion.payload)
+                    _repartir(evento['usuario_id'], evento)
+        except Exception as e:
+            app.logger.warning(f"Bus de notificaciones de fichajes caído, reintentando: {e}")
+            time.sleep(5)
+        finally:
+            if conexion is not None:
+                try:
+                    conexion.close()
+                except Exception:
+                    pass
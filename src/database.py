@@ -0,0 +1,372 @@
+"""
+Integración de la base de datos con el servidor de aplicaciones.
+
+En producción gunicorn arranca con workers gevent ('-k gevent'): cada worker
+atiende muchas peticiones concurrentes como greenlets sobre un único hilo.
+psycopg2 es una extensión C bloqueante, así que sin ayuda cada query congela
+todos los greenlets del worker mientras espera a Postgres. Instalando un
+'wait callback' psycopg2 pasa a modo asíncrono y cede el control al hub de
+gevent mientras espera el socket, igual que hace psycogreen.
+"""
+import os
+import sys
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+
+def gevent_activo():
+    """True si el proceso corre con gevent y sus sockets parcheados (worker gevent)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def esperar_gevent(conn, timeout=None):
+    """
+    Wait callback para psycopg2: espera cooperativamente (cediendo al hub de
+    gevent) hasta que la operación en curso de la conexión termina.
+    """
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import extensions, OperationalError
+
+    while True:
+        estado = conn.poll()
+        if estado == extensions.POLL_OK:
+            break
+        elif estado == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif estado == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Resultado inesperado de poll(): {estado!r}")
+
+
+def instalar_driver_cooperativo():
+    """
+    Registra esperar_gevent como wait callback global de psycopg2.
+
+    Returns:
+        bool: True si se ha instalado (psycopg2 disponible).
+    """
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    extensions.set_wait_callback(esperar_gevent)
+    return True
+
+
+# Valores por defecto de statement_timeout (ms) por rol del proceso. La web
+# corta pronto para que un informe pesado no retenga conexiones que necesitan
+# los fichajes; el scheduler y la CLI hacen trabajo por lotes (0 = sin límite).
+STATEMENT_TIMEOUT_POR_ROL = {
+    'web': 30000,
+    'scheduler': 300000,
+    'cli': 0,
+}
+
+
+def _entero_env(nombre, defecto):
+    valor = os.environ.get(nombre)
+    if valor is None or valor.strip() == '':
+        return defecto
+    return int(valor)
+
+
+def rol_proceso():
+    """
+    Rol con el que se identifica el proceso ante Postgres: 'web' o 'cli'.
+    TEMPUS_ROLE tiene prioridad; si no, 'flask <comando>' (salvo 'flask run')
+    se considera CLI. El scheduler corre dentro del proceso web y ajusta su
+    rol por transacción (ver aplicar_rol_transaccion).
+    """
+    rol = os.environ.get('TEMPUS_ROLE')
+    if rol:
+        return rol
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true' and sys.argv[1:2] != ['run']:
+        return 'cli'
+    return 'web'
+
+
+def statement_timeout_rol(rol):
+    """statement_timeout (ms) del rol: DB_STATEMENT_TIMEOUT_<ROL> o el valor por defecto."""
+    return _entero_env(f'DB_STATEMENT_TIMEOUT_{rol.upper()}', STATEMENT_TIMEOUT_POR_ROL.get(rol, 0))
+
+
+def opciones_engine(database_uri, cooperativo=False, rol='web'):
+    """
+    Construye SQLALCHEMY_ENGINE_OPTIONS para la URI dada a partir del entorno:
+
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (s), DB_POOL_RECYCLE (s),
+        DB_POOL_PRE_PING (True/False), DB_STATEMENT_TIMEOUT_<ROL> (ms)
+
+    Con workers gevent un mismo proceso puede tener cientos de greenlets
+    activos: el pool se dimensiona para la concurrencia real contra Postgres
+    (no para el número de greenlets) y con un timeout corto de checkout, de
+    forma que bajo picos las peticiones esperan turno en vez de abrir
+    conexiones sin límite (4 workers x 15 = 60 < max_connections=100).
+
+    En SQLite solo se aplican pre-ping y recycle: el tamaño del pool y los
+    parámetros de sesión de Postgres no tienen sentido ahí.
+    """
+    es_postgres = database_uri.startswith('postgresql')
+
+    opciones = {}
+    pre_ping = os.environ.get('DB_POOL_PRE_PING')
+    if pre_ping is not None:
+        opciones['pool_pre_ping'] = pre_ping.lower() == 'true'
+    elif es_postgres:
+        opciones['pool_pre_ping'] = True
+
+    recycle = _entero_env('DB_POOL_RECYCLE', None)
+    if recycle is not None:
+        opciones['pool_recycle'] = recycle
+
+    if not es_postgres:
+        return opciones
+
+    pool_size, max_overflow, pool_timeout = (10, 5, 10) if cooperativo else (5, 10, 30)
+    opciones['pool_size'] = _entero_env('DB_POOL_SIZE', pool_size)
+    opciones['max_overflow'] = _entero_env('DB_MAX_OVERFLOW', max_overflow)
+    opciones['pool_timeout'] = _entero_env('DB_POOL_TIMEOUT', pool_timeout)
+
+    # Parámetros de sesión fijados al abrir cada conexión física
+    parametros = [f'application_name=tempus-{rol}']
+    timeout = statement_timeout_rol(rol)
+    if timeout > 0:
+        parametros.append(f'statement_timeout={timeout}')
+    opciones['connect_args'] = {'options': ' '.join(f'-c {p}' for p in parametros)}
+    return opciones
+
+
+def aplicar_rol_transaccion(sesion, rol):
+    """
+    Ajusta statement_timeout y application_name solo para la transacción en
+    curso (SET LOCAL). Lo usan las tareas del scheduler, que comparten el pool
+    del proceso web pero necesitan límites propios. No hace nada fuera de Postgres.
+    """
+    if sesion.get_bind().dialect.name != 'postgresql':
+        return
+    sesion.execute(text("SELECT set_config('application_name', :nombre, true)"),
+                   {'nombre': f'tempus-{rol}'})
+    sesion.execute(text("SELECT set_config('statement_timeout', :ms, true)"),
+                   {'ms': str(statement_timeout_rol(rol))})
+
+
+def insert_con_conflicto(sesion, tabla):
+    """
+    insert() del dialecto de la sesión, con on_conflict_do_nothing/_update
+    (misma API en PostgreSQL y SQLite).
+    """
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    dialecto = postgresql if sesion.get_bind().dialect.name == 'postgresql' else sqlite
+    return dialecto.insert(tabla)
+
+
+# ==========================================
+# MÉTRICAS DEL POOL DE CONEXIONES
+# ==========================================
+
+class MetricasPool:
+    """
+    Contadores de uso del pool de un engine: conexiones en uso, pico, checkouts
+    y tiempo que cada endpoint retiene la conexión. Permite ver si un informe
+    pesado está acaparando el pool que necesitan los fichajes.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.en_uso = 0
+        self.pico_en_uso = 0
+        self.checkouts = 0
+        self.conexiones_abiertas = 0
+        self.por_endpoint = {}  # endpoint -> [checkouts, segundos_totales, segundos_max]
+
+    def al_conectar(self, dbapi_conn, registro):
+        with self.lock:
+            self.conexiones_abiertas += 1
+
+    def al_cerrar(self, dbapi_conn, registro):
+        with self.lock:
+            self.conexiones_abiertas -= 1
+
+    def al_checkout(self, dbapi_conn, registro, proxy):
+        registro.info['checkout_en'] = time.monotonic()
+        registro.info['endpoint'] = request.endpoint if has_request_context() else None
+        with self.lock:
+            self.checkouts += 1
+            self.en_uso += 1
+            self.pico_en_uso = max(self.pico_en_uso, self.en_uso)
+
+    def al_checkin(self, dbapi_conn, registro):
+        inicio = registro.info.pop('checkout_en', None)
+        endpoint = registro.info.pop('endpoint', None) or '(sin petición)'
+        if inicio is None:
+            return
+        retenida = time.monotonic() - inicio
+        with self.lock:
+            self.en_uso -= 1
+            datos = self.por_endpoint.setdefault(endpoint, [0, 0.0, 0.0])
+            datos[0] += 1
+            datos[1] += retenida
+            datos[2] = max(datos[2], retenida)
+
+    def resumen(self):
+        pool = self.engine.pool
+        with self.lock:
+            endpoints = {
+                endpoint: {
+                    'checkouts': n,
+                    'retencion_media_ms': round(total / n * 1000, 1),
+                    'retencion_max_ms': round(maximo * 1000, 1),
+                }
+                for endpoint, (n, total, maximo) in self.por_endpoint.items()
+            }
+            return {
+                'pool': pool.__class__.__name__,
+                'tamano': pool.size() if hasattr(pool, 'size') else None,
+                'desbordamiento': pool.overflow() if hasattr(pool, 'overflow') else None,
+                'en_uso': self.en_uso,
+                'pico_en_uso': self.pico_en_uso,
+                'checkouts': self.checkouts,
+                'conexiones_abiertas': self.conexiones_abiertas,
+                'por_endpoint': endpoints,
+            }
+
+
+_metricas = {}  # nombre del bind -> MetricasPool
+
+
+def registrar_metricas_pool(engine, nombre='default'):
+    """Engancha los eventos del pool del engine para recoger métricas."""
+    if nombre in _metricas:
+        return _metricas[nombre]
+    metricas = MetricasPool(engine)
+    event.listen(engine, 'connect', metricas.al_conectar)
+    event.listen(engine, 'close', metricas.al_cerrar)
+    event.listen(engine, 'checkout', metricas.al_checkout)
+    event.listen(engine, 'checkin', metricas.al_checkin)
+    _metricas[nombre] = metricas
+    return metricas
+
+
+def metricas_pool():
+    """Resumen de métricas de todos los engines registrados."""
+    return {nombre: metricas.resumen() for nombre, metricas in _metricas.items()}
+
+
+# ==========================================
+# RÉPLICA DE LECTURA PARA INFORMES
+# ==========================================
+#
+# Si SQLALCHEMY_REPLICA_URI está definida, se registra como bind 'replica'.
+# Las vistas marcadas con @usar_replica envían sus SELECT a la réplica; las
+# escrituras (flush, DML, SELECT ... FOR UPDATE) van siempre al primario. Si la
+# réplica no responde o acumula más retraso que REPLICA_MAX_LAG segundos, se
+# lee del primario.
+
+# Retraso de la réplica: 0 si ha aplicado todo lo recibido (una réplica ociosa
+# no se considera retrasada aunque la última transacción sea antigua)
+_SQL_RETRASO_POSTGRES = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_estado_replica = {'comprobado_en': None, 'disponible': False, 'retraso': None}
+_lock_replica = threading.Lock()
+
+
+def _medir_retraso(engine):
+    """Segundos de retraso de la réplica (0 fuera de Postgres)."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            return float(conn.execute(_SQL_RETRASO_POSTGRES).scalar() or 0)
+        conn.execute(text('SELECT 1'))
+        return 0.0
+
+
+def estado_replica(forzar=False):
+    """
+    Devuelve {'disponible', 'retraso', 'comprobado_en'} de la réplica.
+    La comprobación se cachea REPLICA_HEALTH_TTL segundos por proceso para no
+    añadir un round-trip a cada petición de informes.
+    """
+    engine = current_app.extensions['sqlalchemy'].engines.get('replica')
+    if engine is None:
+        return {'disponible': False, 'retraso': None, 'comprobado_en': None}
+
+    ttl = current_app.config.get('REPLICA_HEALTH_TTL', 10)
+    ahora = time.monotonic()
+    with _lock_replica:
+        comprobado_en = _estado_replica['comprobado_en']
+        if not forzar and comprobado_en is not None and ahora - comprobado_en < ttl:
+            return dict(_estado_replica)
+
+    try:
+        retraso = _medir_retraso(engine)
+        disponible = retraso <= current_app.config.get('REPLICA_MAX_LAG', 30)
+        if not disponible:
+            current_app.logger.warning(f"Réplica con {retraso:.1f}s de retraso: se lee del primario")
+    except Exception as e:
+        retraso, disponible = None, False
+        current_app.logger.warning(f"Réplica no disponible, se lee del primario: {e}")
+
+    with _lock_replica:
+        _estado_replica.update(comprobado_en=ahora, disponible=disponible, retraso=retraso)
+        return dict(_estado_replica)
+
+
+def invalidar_estado_replica():
+    """Fuerza una nueva comprobación de la réplica en el siguiente uso."""
+    with _lock_replica:
+        _estado_replica.update(comprobado_en=None, disponible=False, retraso=None)
+
+
+def usar_replica(f):
+    """
+    Decorador para vistas de solo lectura (informes, exportaciones): durante la
+    vista, las consultas de db.session se envían a la réplica si está sana.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        anterior = g.get('usar_replica', False)
+        g.usar_replica = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.usar_replica = anterior
+    return decorated_function
+
+
+class SesionEnrutada(Session):
+    """
+    Sesión de Flask-SQLAlchemy que enruta las lecturas a la réplica dentro de
+    vistas marcadas con @usar_replica. Todo lo demás usa el bind habitual.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._leer_de_replica(clause):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _leer_de_replica(self, clause):
+        if not has_app_context() or not g.get('usar_replica', False):
+            return False
+        if self._flushing or 'replica' not in self._db.engines:
+            return False
+        if clause is not None and (getattr(clause, 'is_dml', False)
+                                   or getattr(clause, '_for_update_arg', None) is not None):
+            return False
+        return estado_replica()['disponible']
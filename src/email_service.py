@@ -104,11 +104,8 @@ Sistema de Gestión de Fichajes
     future.add_done_callback(handle_email_result)
 
 
-def enviar_email_respuesta(usuario, solicitud):
-    """
-    Envía email de notificación de respuesta (aprobación/rechazo).
-    Funciona para Vacaciones y Bajas.
-    """
+def _mensaje_respuesta(usuario, solicitud):
+    """Construye el email de respuesta (aprobación/rechazo) de una solicitud."""
     # Corregido: Usar .estado en lugar de .state
     estado_texto = "APROBADA" if solicitud.estado == 'aprobada' else "RECHAZADA"
     
@@ -148,6 +145,15 @@ Detalles de la solicitud:
 Saludos,
 Sistema de Gestión de Fichajes
     '''
+    return msg
+
+
+def enviar_email_respuesta(usuario, solicitud):
+    """
+    Envía email de notificación de respuesta (aprobación/rechazo).
+    Funciona para Vacaciones y Bajas.
+    """
+    msg = _mensaje_respuesta(usuario, solicitud)
     
     # Enviar usando el executor
     app = current_app._get_current_object()
@@ -162,6 +168,45 @@ Sistema de Gestión de Fichajes
     future.add_done_callback(handle_email_result)
 
 
+def _send_batch_async(app, mensajes):
+    """
+    Envía varios emails reutilizando una única conexión SMTP.
+    Se ejecuta en thread separado.
+    """
+    with app.app_context():
+        try:
+            with mail.connect() as conexion:
+                for msg in mensajes:
+                    try:
+                        conexion.send(msg)
+                        print(f"✅ Email enviado: {msg.subject} -> {msg.recipients}")
+                    except Exception as e:
+                        print(f"❌ Error enviando email: {e}")
+        except Exception as e:
+            print(f"❌ Error conectando al servidor de correo: {e}")
+
+
+def enviar_emails_respuesta(solicitudes):
+    """
+    Envía los emails de respuesta de varias solicitudes como un solo trabajo
+    del executor (una conexión SMTP para todo el lote).
+    """
+    mensajes = [_mensaje_respuesta(s.usuario, s) for s in solicitudes]
+    if not mensajes:
+        return
+
+    app = current_app._get_current_object()
+    future = email_executor.submit(_send_batch_async, app, mensajes)
+    
+    def handle_email_result(fut):
+        try:
+            fut.result()
+        except Exception as e:
+            print(f"⚠️ Email callback error: {e}")
+    
+    future.add_done_callback(handle_email_result)
+
+
 def enviar_email_otp(usuario, codigo):
     """
     Envía email con el código OTP para verificación de MFA.
@@ -56,6 +56,63 @@ def get_calendar_service():
         return None
 
 
+def _evento_vacaciones(solicitud):
+    """Cuerpo del evento de Calendar para unas vacaciones aprobadas."""
+    evento = {
+        'summary': f'🏖️ {solicitud.usuario.nombre} - Vacaciones',
+        'description': (
+            f'Vacaciones aprobadas\n'
+            f'Empleado: {solicitud.usuario.nombre}\n'
+            f'Email: {solicitud.usuario.email}\n'
+            f'Días: {solicitud.dias_solicitados}\n'
+            f'Motivo: {solicitud.motivo or "No especificado"}'
+        ),
+        'start': {
+            'date': solicitud.fecha_inicio.isoformat(),
+            'timeZone': 'Europe/Madrid',
+        },
+        'end': {
+            # Google Calendar: fecha fin es exclusiva, sumamos 1 día
+            'date': (solicitud.fecha_fin + timedelta(days=1)).isoformat(),
+            'timeZone': 'Europe/Madrid',
+        },
+        'colorId': '10',  # Verde para vacaciones
+        'reminders': {
+            'useDefault': False,
+        },
+    }
+    return evento
+
+
+def _evento_baja(solicitud):
+    """Cuerpo del evento de Calendar para una baja/ausencia aprobada."""
+    tipo_nombre = solicitud.tipo_ausencia.nombre if solicitud.tipo_ausencia else 'Ausencia'
+
+    evento = {
+        'summary': f'🏥 {solicitud.usuario.nombre} - {tipo_nombre}',
+        'description': (
+            f'Tipo: {tipo_nombre}\n'
+            f'Empleado: {solicitud.usuario.nombre}\n'
+            f'Email: {solicitud.usuario.email}\n'
+            f'Días: {solicitud.dias_solicitados}\n'
+            f'Motivo: {solicitud.motivo}'
+        ),
+        'start': {
+            'date': solicitud.fecha_inicio.isoformat(),
+            'timeZone': 'Europe/Madrid',
+        },
+        'end': {
+            'date': (solicitud.fecha_fin + timedelta(days=1)).isoformat(),
+            'timeZone': 'Europe/Madrid',
+        },
+        'colorId': '11',  # Rojo para bajas
+        'reminders': {
+            'useDefault': False,
+        },
+    }
+    return evento
+
+
 def crear_evento_vacaciones(solicitud):
     """
     Crea un evento en el calendario COMPARTIDO para vacaciones aprobadas.
@@ -80,29 +137,7 @@ def crear_evento_vacaciones(solicitud):
     calendar_id = os.environ.get('GOOGLE_CALENDAR_ID', 'primary')
     
     try:
-        evento = {
-            'summary': f'🏖️ {solicitud.usuario.nombre} - Vacaciones',
-            'description': (
-                f'Vacaciones aprobadas\n'
-                f'Empleado: {solicitud.usuario.nombre}\n'
-                f'Email: {solicitud.usuario.email}\n'
-                f'Días: {solicitud.dias_solicitados}\n'
-                f'Motivo: {solicitud.motivo or "No especificado"}'
-            ),
-            'start': {
-                'date': solicitud.fecha_inicio.isoformat(),
-                'timeZone': 'Europe/Madrid',
-            },
-            'end': {
-                # Google Calendar: fecha fin es exclusiva, sumamos 1 día
-                'date': (solicitud.fecha_fin + timedelta(days=1)).isoformat(),
-                'timeZone': 'Europe/Madrid',
-            },
-            'colorId': '10',  # Verde para vacaciones
-            'reminders': {
-                'useDefault': False,
-            },
-        }
+        evento = _evento_vacaciones(solicitud)
         
         evento_creado = service.events().insert(
             calendarId=calendar_id,
@@ -140,29 +175,7 @@ def crear_evento_baja(solicitud):
     
     try:
         tipo_nombre = solicitud.tipo_ausencia.nombre if solicitud.tipo_ausencia else 'Ausencia'
-        
-        evento = {
-            'summary': f'🏥 {solicitud.usuario.nombre} - {tipo_nombre}',
-            'description': (
-                f'Tipo: {tipo_nombre}\n'
-                f'Empleado: {solicitud.usuario.nombre}\n'
-                f'Email: {solicitud.usuario.email}\n'
-                f'Días: {solicitud.dias_solicitados}\n'
-                f'Motivo: {solicitud.motivo}'
-            ),
-            'start': {
-                'date': solicitud.fecha_inicio.isoformat(),
-                'timeZone': 'Europe/Madrid',
-            },
-            'end': {
-                'date': (solicitud.fecha_fin + timedelta(days=1)).isoformat(),
-                'timeZone': 'Europe/Madrid',
-            },
-            'colorId': '11',  # Rojo para bajas
-            'reminders': {
-                'useDefault': False,
-            },
-        }
+        evento = _evento_baja(solicitud)
         
         evento_creado = service.events().insert(
             calendarId=calendar_id,
@@ -271,4 +284,59 @@ def actualizar_evento(event_id, solicitud, tipo='vacaciones'):
         return False
     except Exception as error:
         print(f"❌ Error al actualizar evento: {error}")
-        return False
\ No newline at end of file
+        return False
+
+# La API admite hasta 1000 llamadas por batch; Google recomienda no pasar de 50
+OPERACIONES_POR_BATCH = 50
+
+
+def sincronizar_eventos_lote(crear=(), eliminar=()):
+    """
+    Crea y elimina eventos del calendario compartido agrupando las llamadas
+    en peticiones batch (una petición HTTP cada OPERACIONES_POR_BATCH).
+    
+    Args:
+        crear: lista de (clave, solicitud, tipo) con tipo 'vacaciones' o 'baja'
+        eliminar: lista de IDs de evento a eliminar
+    
+    Returns:
+        dict: clave -> ID del evento creado (solo los creados con éxito)
+    """
+    if not crear and not eliminar:
+        return {}
+    
+    service = get_calendar_service()
+    
+    if not service:
+        return {}
+    
+    calendar_id = os.environ.get('GOOGLE_CALENDAR_ID', 'primary')
+    creados = {}
+    
+    def _callback(clave):
+        def _resultado(request_id, respuesta, error):
+            if error is not None:
+                print(f"❌ Error en operación batch de Calendar: {error}")
+            elif clave is not None:
+                creados[clave] = respuesta.get('id')
+        return _resultado
+    
+    operaciones = []
+    for clave, solicitud, tipo in crear:
+        evento = _evento_vacaciones(solicitud) if tipo == 'vacaciones' else _evento_baja(solicitud)
+        operaciones.append((service.events().insert(calendarId=calendar_id, body=evento), clave))
+    for event_id in eliminar:
+        operaciones.append((service.events().delete(calendarId=calendar_id, eventId=event_id), None))
+    
+    for inicio in range(0, len(operaciones), OPERACIONES_POR_BATCH):
+        batch = service.new_batch_http_request()
+        for peticion, clave in operaciones[inicio:inicio + OPERACIONES_POR_BATCH]:
+            batch.add(peticion, callback=_callback(clave))
+        try:
+            batch.execute()
+        except Exception as error:
+            print(f"❌ Error al ejecutar batch de Calendar: {error}")
+    
+    print(f"✅ Calendar compartido sincronizado: {len(creados)} eventos creados, "
+          f"{len(eliminar)} eliminaciones enviadas")
+    return creados
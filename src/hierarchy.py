@@ -0,0 +1,135 @@
+"""
+Jerarquía de aprobación multinivel.
+
+'aprobadores' solo guarda relaciones directas (aprobador -> empleado). Para
+consultar cadenas completas sin recorrer listas en Python se mantiene la
+tabla de cierre 'jerarquia_aprobacion' (ancestro, descendiente, profundidad):
+
+    - "¿está X a cargo de Y?"      -> búsqueda por clave primaria
+    - "empleados a cargo de Y"     -> rango del índice (ancestro, profundidad)
+
+APPROVAL_HIERARCHY_DEPTH fija hasta qué nivel da derechos de aprobación:
+1 (por defecto) = solo empleados directos; 2 = también los de sus
+subordinados aprobadores; etc. La tabla guarda todos los niveles, así que
+cambiar el valor no requiere recalcular nada.
+
+Mantenimiento: tras cada flush que crea, modifica o borra filas de
+'aprobadores', se recalculan los ancestros de los empleados afectados y de
+todo lo que cuelga de ellos, con un CTE recursivo y dentro de la misma
+transacción. Los borrados masivos (Query.delete) no pasan por el flush:
+quien los haga debe llamar a recalcular_jerarquia().
+"""
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, inspect, literal, select
+
+from src.models import db, Aprobador, JerarquiaAprobacion
+from src.database import SesionEnrutada
+
+# Tope de niveles al recorrer la cadena: corta ciclos (A aprueba a B y B a A)
+MAX_PROFUNDIDAD = 32
+
+
+def _profundidad(profundidad):
+    if profundidad is None:
+        profundidad = current_app.config.get('APPROVAL_HIERARCHY_DEPTH', 1)
+    return max(int(profundidad), 1)
+
+
+def ids_a_cargo(aprobador_id, profundidad=None):
+    """
+    SELECT de los ids de empleados a cargo del aprobador (directos y, según
+    APPROVAL_HIERARCHY_DEPTH, indirectos). Sirve para IN (...) o scalars().
+    """
+    return select(JerarquiaAprobacion.descendiente_id).where(
+        JerarquiaAprobacion.ancestro_id == aprobador_id,
+        JerarquiaAprobacion.profundidad <= _profundidad(profundidad)
+    )
+
+
+def ids_responsables(usuario_id, profundidad=None):
+    """SELECT de los ids de aprobadores de los que depende el usuario (inversa de ids_a_cargo)."""
+    return select(JerarquiaAprobacion.ancestro_id).where(
+        JerarquiaAprobacion.descendiente_id == usuario_id,
+        JerarquiaAprobacion.profundidad <= _profundidad(profundidad)
+    )
+
+
+def esta_a_cargo(aprobador_id, usuario_id, profundidad=None):
+    """True si 'usuario_id' está a cargo de 'aprobador_id' (una query por PK)."""
+    # Sin pasar por el identity map: la tabla se reescribe con sentencias Core
+    return db.session.scalar(select(JerarquiaAprobacion.profundidad).where(
+        JerarquiaAprobacion.ancestro_id == aprobador_id,
+        JerarquiaAprobacion.descendiente_id == usuario_id,
+        JerarquiaAprobacion.profundidad <= _profundidad(profundidad)
+    )) is not None
+
+
+# ==========================================
+# MANTENIMIENTO DE LA TABLA DE CIERRE
+# ==========================================
+
+def recalcular_jerarquia(conexion=None, usuario_ids=None):
+    """
+    Recalcula las filas de la tabla de cierre cuyo descendiente es uno de
+    'usuario_ids' o cuelga de alguno de ellos. Sin 'usuario_ids', la
+    reconstruye entera.
+
+    Returns:
+        int: filas insertadas.
+    """
+    conexion = conexion if conexion is not None else db.session.connection()
+    cierre = JerarquiaAprobacion.__table__
+    aprobadores = Aprobador.__table__
+
+    if usuario_ids is not None:
+        usuario_ids = set(usuario_ids)
+        if not usuario_ids:
+            return 0
+        # Todo lo que cuelga de un empleado afectado cambia de ancestros con él
+        usuario_ids.update(conexion.scalars(select(cierre.c.descendiente_id).where(
+            cierre.c.ancestro_id.in_(usuario_ids))))
+        conexion.execute(delete(cierre).where(cierre.c.descendiente_id.in_(usuario_ids)))
+    else:
+        conexion.execute(delete(cierre))
+
+    # Subimos desde cada empleado: cadena(ancestro, descendiente, profundidad)
+    base = select(
+        aprobadores.c.aprobador_id.label('ancestro_id'),
+        aprobadores.c.usuario_id.label('descendiente_id'),
+        literal(1).label('profundidad')
+    )
+    if usuario_ids is not None:
+        base = base.where(aprobadores.c.usuario_id.in_(usuario_ids))
+    cadena = base.cte('cadena', recursive=True)
+    cadena = cadena.union(
+        select(aprobadores.c.aprobador_id, cadena.c.descendiente_id, cadena.c.profundidad + 1)
+        .join(cadena, aprobadores.c.usuario_id == cadena.c.ancestro_id)
+        .where(cadena.c.profundidad < MAX_PROFUNDIDAD)
+    )
+    filas = select(cadena.c.ancestro_id, cadena.c.descendiente_id, func.min(cadena.c.profundidad)).where(
+        cadena.c.ancestro_id != cadena.c.descendiente_id
+    ).group_by(cadena.c.ancestro_id, cadena.c.descendiente_id)
+
+    conexion.execute(insert(cierre).from_select(
+        ['ancestro_id', 'descendiente_id', 'profundidad'], filas))
+
+    # rowcount de INSERT ... SELECT no es fiable en todos los drivers (SQLite: -1)
+    insertadas = select(func.count()).select_from(cierre)
+    if usuario_ids is not None:
+        insertadas = insertadas.where(cierre.c.descendiente_id.in_(usuario_ids))
+    return conexion.scalar(insertadas)
+
+
+@event.listens_for(SesionEnrutada, 'after_flush')
+def _actualizar_tras_flush(sesion, contexto):
+    afectados = set()
+    for obj in (*sesion.new, *sesion.dirty, *sesion.deleted):
+        if not isinstance(obj, Aprobador):
+            continue
+        afectados.add(obj.usuario_id)
+        # Si se reasignó la relación a otro empleado, el anterior también cambia
+        historial = inspect(obj).attrs.usuario_id.history
+        afectados.update(historial.deleted or ())
+    afectados.discard(None)
+    if afectados:
+        recalcular_jerarquia(sesion.connection(), afectados)
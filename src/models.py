@@ -2,9 +2,13 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 from sqlalchemy.schema import UniqueConstraint
+import os
 import uuid
 
-db = SQLAlchemy()
+from src.database import SesionEnrutada
+
+# Sesión con enrutado opcional de lecturas a la réplica (ver src/database.py)
+db = SQLAlchemy(session_options={'class_': SesionEnrutada})
 
 # Función auxiliar para generar UUIDs
 def generate_uuid():
@@ -111,6 +115,37 @@ class SaldoVacaciones(db.Model):
         return f'<SaldoVacaciones {self.usuario.nombre} - {self.anio}>'
 
 
+class MovimientoSaldo(db.Model):
+    """
+    Libro de movimientos de saldo (solo se añaden filas, nunca se editan).
+
+    SaldoVacaciones guarda el total materializado; cada cambio de ese total
+    pasa por src/balances.py, que apunta aquí el movimiento y suma el delta
+    con un UPDATE atómico. La suma de los movimientos de un (usuario, año)
+    hasta una fecha da el saldo en ese momento.
+    """
+    __tablename__ = 'movimientos_saldo'
+
+    __table_args__ = (
+        db.Index('idx_movimiento_saldo_usuario_anio', 'usuario_id', 'anio', 'fecha'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    anio = db.Column(db.Integer, nullable=False)
+    # apertura | solicitud | reversion | carryover | ajuste | festivo | reconciliacion
+    tipo = db.Column(db.String(20), nullable=False)
+    delta_totales = db.Column(db.Integer, nullable=False, default=0)
+    delta_disfrutados = db.Column(db.Integer, nullable=False, default=0)
+    solicitud_id = db.Column(db.Integer, db.ForeignKey('solicitudes_vacaciones.id'), nullable=True)
+    motivo = db.Column(db.String(255), nullable=True)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return (f'<MovimientoSaldo u={self.usuario_id} {self.anio} {self.tipo} '
+                f'tot={self.delta_totales:+d} disf={self.delta_disfrutados:+d}>')
+
+
 class CambioSaldo(db.Model):
     __tablename__ = 'cambios_saldo'
 
@@ -138,6 +173,45 @@ class CambioSaldo(db.Model):
         return f'<CambioSaldo u={self.usuario_id} {self.anio} {self.delta:+d}>'
 
 
+class CierreAnio(db.Model):
+    """
+    Punto de control de 'flask cerrar-anio': el cierre avanza por lotes de
+    usuarios (por id) y cada lote se confirma junto con su checkpoint, de
+    modo que un cierre interrumpido se reanuda donde se quedó.
+    """
+    __tablename__ = 'cierres_anio'
+
+    anio_origen = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    max_carryover = db.Column(db.Integer, nullable=False)
+    ultimo_usuario_id = db.Column(db.Integer, nullable=False, default=0)
+    creados = db.Column(db.Integer, nullable=False, default=0)
+    actualizados = db.Column(db.Integer, nullable=False, default=0)
+    saltados = db.Column(db.Integer, nullable=False, default=0)
+    fecha_inicio = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    fecha_fin = db.Column(db.DateTime, nullable=True)  # NULL = en curso o interrumpido
+
+    def __repr__(self):
+        return f'<CierreAnio {self.anio_origen} hasta usuario {self.ultimo_usuario_id}>'
+
+
+# Predicado de "fichaje abierto": versión vigente, sin salida y no eliminado
+FICHAJE_ABIERTO = "hora_salida IS NULL AND es_actual AND tipo_accion <> 'eliminacion'"
+
+# Con 'fichajes' particionada por fecha (FICHAJES_PARTICIONES, migración
+# e5b1c7a2d9f4, solo PostgreSQL) todo índice único incluye la clave de
+# partición: el de fichaje abierto pasa a ser por usuario y día. Se lee del
+# entorno y se normaliza como la migración y app.config, para que el modelo
+# declare el mismo índice.
+FICHAJES_PARTICIONADOS = os.environ.get('FICHAJES_PARTICIONES', '').strip().lower() in ('mensual', 'anual')
+
+# Predicados de "fila vigente" para los índices parciales de PostgreSQL.
+# Casi todas las consultas filtran por ellos; indexar solo esas filas deja
+# fuera todo el historial de versiones. Solo se crean en PostgreSQL (ddl_if):
+# SQLite no usa un índice parcial si la consulta lleva parámetros enlazados.
+FICHAJE_VIGENTE = "es_actual AND tipo_accion <> 'eliminacion'"
+SOLICITUD_VIGENTE = "es_actual AND estado IN ('pendiente', 'aprobada')"
+SOLICITUD_PENDIENTE = "es_actual AND estado = 'pendiente'"
+
 class Fichaje(db.Model):
     __tablename__ = 'fichajes'
 
@@ -150,6 +224,24 @@ class Fichaje(db.Model):
         db.Index('idx_fichaje_grupo', 'grupo_id'),
 
         db.Index('idx_fichaje_fecha', 'fecha'),
+
+        # 3. Índice único parcial: como mucho UN fichaje abierto por usuario
+        # (por usuario y día si la tabla está particionada; ver _alternar_fichaje).
+        # Evita que dos toggles simultáneos (doble clic) abran dos jornadas
+        db.Index('uq_fichaje_abierto_usuario',
+                 *(('usuario_id', 'fecha') if FICHAJES_PARTICIONADOS else ('usuario_id',)), unique=True,
+                 postgresql_where=db.text(FICHAJE_ABIERTO),
+                 sqlite_where=db.text(FICHAJE_ABIERTO)),
+
+        # 4. Parciales y de cobertura (solo PostgreSQL) sobre las filas vigentes:
+        # "Mis Fichajes", resumen semanal, timeline y comprobación de solapes
+        db.Index('idx_fichaje_vigente_usuario_fecha', 'usuario_id', 'fecha', 'hora_entrada',
+                 postgresql_include=['hora_salida', 'pausa'],
+                 postgresql_where=db.text(FICHAJE_VIGENTE)).ddl_if(dialect='postgresql'),
+        # Informes y exportaciones de admin por rango de fechas (todos los usuarios)
+        db.Index('idx_fichaje_vigente_fecha', 'fecha',
+                 postgresql_include=['usuario_id', 'hora_entrada', 'hora_salida', 'pausa'],
+                 postgresql_where=db.text(FICHAJE_VIGENTE)).ddl_if(dialect='postgresql'),
     )
     
     id = db.Column(db.Integer, primary_key=True)
@@ -209,6 +301,13 @@ class SolicitudVacaciones(db.Model):
         
         # 2. Índice para historial de versiones
         db.Index('idx_vacaciones_grupo', 'grupo_id'),
+
+        # 3. Parciales (solo PostgreSQL): solape sobre solicitudes vigentes y
+        # contadores/bandeja de pendientes del aprobador
+        db.Index('idx_vacaciones_vigente_usuario', 'usuario_id', 'fecha_inicio', 'fecha_fin',
+                 postgresql_where=db.text(SOLICITUD_VIGENTE)).ddl_if(dialect='postgresql'),
+        db.Index('idx_vacaciones_pendiente_usuario', 'usuario_id', 'fecha_solicitud',
+                 postgresql_where=db.text(SOLICITUD_PENDIENTE)).ddl_if(dialect='postgresql'),
     )
     
     id = db.Column(db.Integer, primary_key=True)
@@ -242,14 +341,23 @@ class SolicitudVacaciones(db.Model):
         Calcula dinámicamente cuántos días de adelanto supone esta solicitud
         basándose en el saldo actual del usuario para el año de la solicitud.
         Solo devuelve adelanto si hay un saldo configurado (> 0) que se excede.
+
+        Los listados lo precalculan en lote (src/approvals.py) para no lanzar
+        una query de saldo por fila.
         """
+        precalculado = self.__dict__.get('_dias_adelanto')
+        if precalculado is not None:
+            return precalculado
+
         if not self.usuario:
             return 0
             
         # Usamos el año de la solicitud (cuando se pidió), no el de las fechas de vacaciones
         anio = self.fecha_solicitud.year
-        disponible = self.usuario.dias_vacaciones_disponibles(anio)
-        
+        return self.adelanto_sobre(self.usuario.dias_vacaciones_disponibles(anio))
+
+    def adelanto_sobre(self, disponible):
+        """Días de adelanto de esta solicitud frente a un saldo disponible dado."""
         # Solo calcular adelanto si hay saldo configurado (> 0) y se excede
         if disponible > 0 and self.dias_solicitados > disponible:
             return self.dias_solicitados - disponible
@@ -267,6 +375,10 @@ class SolicitudBaja(db.Model):
         # Mismo razonamiento que en vacaciones
         db.Index('idx_bajas_solape', 'usuario_id', 'es_actual', 'estado', 'fecha_inicio', 'fecha_fin'),
         db.Index('idx_bajas_grupo', 'grupo_id'),
+        db.Index('idx_bajas_vigente_usuario', 'usuario_id', 'fecha_inicio', 'fecha_fin',
+                 postgresql_where=db.text(SOLICITUD_VIGENTE)).ddl_if(dialect='postgresql'),
+        db.Index('idx_bajas_pendiente_usuario', 'usuario_id', 'fecha_solicitud',
+                 postgresql_where=db.text(SOLICITUD_PENDIENTE)).ddl_if(dialect='postgresql'),
     )
     
     id = db.Column(db.Integer, primary_key=True)
@@ -332,6 +444,49 @@ class Aprobador(db.Model):
         return f'<Aprobador {self.aprobador.nombre} aprueba a {self.usuario.nombre}>'
 
 
+class JerarquiaAprobacion(db.Model):
+    """
+    Tabla de cierre de 'aprobadores': una fila por cada par (ancestro,
+    descendiente) conectado por una cadena de aprobación, con la profundidad
+    del camino más corto (1 = aprobador directo).
+
+    No se escribe a mano: se recalcula para los empleados afectados en el
+    mismo flush que cambia 'aprobadores' (ver src/hierarchy.py).
+    """
+    __tablename__ = 'jerarquia_aprobacion'
+    __table_args__ = (
+        # "Todos los empleados a cargo de X hasta profundidad N" sin tocar la tabla
+        db.Index('idx_jerarquia_ancestro', 'ancestro_id', 'profundidad', 'descendiente_id'),
+        # Recalcular los ancestros de un empleado al cambiar sus aprobadores
+        db.Index('idx_jerarquia_descendiente', 'descendiente_id'),
+    )
+
+    ancestro_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    descendiente_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    profundidad = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<JerarquiaAprobacion {self.ancestro_id} -> {self.descendiente_id} ({self.profundidad})>'
+
+
+class LimiteAusenciasEquipo(db.Model):
+    """
+    Máximo de personas del equipo de un aprobador (sus empleados a cargo)
+    ausentes el mismo día laborable. Se comprueba al solicitar, modificar y
+    aprobar vacaciones (ver src/availability.py).
+    """
+    __tablename__ = 'limites_ausencias_equipo'
+
+    aprobador_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    max_ausentes = db.Column(db.Integer, nullable=False)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    aprobador = db.relationship('Usuario')
+
+    def __repr__(self):
+        return f'<LimiteAusenciasEquipo {self.aprobador_id}: {self.max_ausentes}>'
+
+
 class Festivo(db.Model):
     __tablename__ = 'festivos'
     
@@ -479,4 +634,95 @@ class UserKnownIP(db.Model):
     )
 
     def __repr__(self):
-        return f'<UserKnownIP {self.ip_address} - User {self.usuario_id}>'
\ No newline at end of file
+        return f'<UserKnownIP {self.ip_address} - User {self.usuario_id}>'
+
+
+class IdempotenciaFichaje(db.Model):
+    """
+    Respuesta ya servida para una clave 'Idempotency-Key' del reloj.
+    Se inserta en la misma transacción que el fichaje: un reintento con la
+    misma clave (aunque llegue a otro worker) devuelve la respuesta original
+    en lugar de volver a alternar el estado.
+    """
+    __tablename__ = 'idempotencia_fichajes'
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    clave = db.Column(db.String(64), primary_key=True)
+    respuesta = db.Column(db.JSON, nullable=False)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotenciaFichaje {self.usuario_id}:{self.clave}>'
+
+
+class EventoTerminal(db.Model):
+    """
+    Marcaje recibido de un terminal de fichaje (lector de tarjetas) por la
+    API /api/v1/punches. La clave (dispositivo, evento_id) deduplica los
+    reenvíos del terminal; 'grupo_id' enlaza con el Fichaje generado.
+    """
+    __tablename__ = 'eventos_terminal'
+
+    dispositivo = db.Column(db.String(64), primary_key=True)
+    evento_id = db.Column(db.String(64), primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
+    momento = db.Column(db.DateTime, nullable=False)
+    sentido = db.Column(db.String(3), nullable=False)  # 'in' / 'out'
+    # 'emparejado', 'abierto', 'ignorado', 'huerfano', 'solapado', 'usuario_desconocido'
+    resultado = db.Column(db.String(20), nullable=False)
+    grupo_id = db.Column(db.String(36), nullable=True, index=True)
+    fecha_recepcion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<EventoTerminal {self.dispositivo}:{self.evento_id} {self.sentido}>'
+
+
+class SugerenciaFichaje(db.Model):
+    """
+    Horarios frecuentes precalculados por usuario para el formulario de fichaje.
+
+    'turnos' guarda los candidatos como [entrada_min, salida_min, pausa, peso],
+    con el peso ponderado por antigüedad y normalizado a la fecha 'referencia'.
+    Se mantiene de forma incremental al crear/rectificar/eliminar fichajes y
+    se recalcula completo en el job nocturno (ver src/suggestions.py).
+    """
+    __tablename__ = 'sugerencias_fichaje'
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    referencia = db.Column(db.Date, nullable=False)
+    turnos = db.Column(db.JSON, nullable=False, default=list)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SugerenciaFichaje usuario={self.usuario_id} ({len(self.turnos or [])} turnos)>'
+
+
+class FichajeArchivado(db.Model):
+    """
+    Versiones sustituidas (es_actual == False) de un fichaje, sacadas de la
+    tabla 'fichajes' al superar el plazo de retención en caliente.
+
+    Una fila por grupo_id; 'versiones' es la lista de versiones en JSON
+    comprimido con zlib (ver src/archive.py). Los rangos de fechas permiten
+    filtrar la auditoría sin descomprimir: auditable_desde/auditable_hasta
+    cubren solo las versiones que muestra la auditoría (NULL si ninguna).
+    """
+    __tablename__ = 'fichajes_archivo'
+
+    __table_args__ = (
+        db.Index('idx_fichajes_archivo_auditable', 'auditable_hasta', 'auditable_desde'),
+    )
+
+    grupo_id = db.Column(db.String(36), primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
+    fecha_max = db.Column(db.Date, nullable=False)
+    creacion_desde = db.Column(db.DateTime)
+    creacion_hasta = db.Column(db.DateTime)
+    auditable_desde = db.Column(db.DateTime)
+    auditable_hasta = db.Column(db.DateTime)
+    num_versiones = db.Column(db.Integer, nullable=False)
+    versiones = db.Column(db.LargeBinary, nullable=False)
+    fecha_archivo = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<FichajeArchivado {self.grupo_id} ({self.num_versiones} versiones)>'
@@ -0,0 +1,203 @@
+"""
+Contadores de solicitudes pendientes por aprobador (portada y badge del menú).
+
+La portada es la página más visitada y, para aprobadores y admins, contaba en
+cada carga las vacaciones y bajas pendientes de sus empleados a cargo. Aquí
+cada proceso guarda en memoria, por aprobador:
+
+    (expira_en, version, usuarios a cargo, [vacaciones, bajas])
+
+y lo mantiene de forma incremental con eventos de la sesión:
+
+    - after_flush: por cada SolicitudVacaciones/SolicitudBaja creada,
+      modificada o borrada se calcula si ha entrado o salido de "pendiente"
+      (es_actual y estado == 'pendiente') y se acumula el delta por empleado.
+      Crear, aprobar, rechazar y cancelar pasan todos por aquí.
+    - after_commit: se aplican los deltas a los aprobadores en cache que
+      tienen al empleado a cargo. Un cambio en 'aprobadores' puede mover
+      empleados en toda la cadena de la jerarquía: descarta todo el cache
+      del proceso (se recalcula en la siguiente lectura).
+    - after_rollback: los deltas se descartan.
+
+Los cambios hechos por otros workers no llegan a este cache: el TTL
+(PENDING_COUNTERS_TTL, segundos) acota ese desfase.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, select
+
+from src.models import db, Aprobador, SolicitudVacaciones, SolicitudBaja
+from src.database import SesionEnrutada
+from src.hierarchy import ids_a_cargo
+
+# Límite de entradas para no crecer sin control en procesos de larga vida
+MAX_ENTRADAS = 5000
+
+_TIPOS = {SolicitudVacaciones: 0, SolicitudBaja: 1}
+
+_cache = {}  # aprobador_id -> (expira_en, version, frozenset(usuarios), [vacaciones, bajas])
+_version = 0
+_lock = threading.Lock()
+
+
+def invalidar_contadores_pendientes(*aprobador_ids):
+    """
+    Descarta los contadores de los aprobadores indicados, o todos si no se
+    indica ninguno (p. ej. tras un borrado masivo de relaciones).
+    """
+    global _version
+    with _lock:
+        if not aprobador_ids:
+            _version += 1
+            _cache.clear()
+            return
+        for aprobador_id in aprobador_ids:
+            _cache.pop(aprobador_id, None)
+
+
+def _calcular(aprobador_id):
+    usuarios = frozenset(db.session.scalars(ids_a_cargo(aprobador_id)))
+    if not usuarios:
+        return usuarios, [0, 0]
+
+    def _pendientes(modelo):
+        return select(func.count(modelo.id)).where(
+            modelo.usuario_id.in_(usuarios),
+            modelo.estado == 'pendiente',
+            modelo.es_actual == True
+        ).scalar_subquery()
+
+    vacaciones, bajas = db.session.execute(
+        select(_pendientes(SolicitudVacaciones), _pendientes(SolicitudBaja))).one()
+    return usuarios, [vacaciones, bajas]
+
+
+def contadores_pendientes(aprobador_id):
+    """
+    Solicitudes pendientes de los empleados a cargo del aprobador.
+    Con el cache caliente no hace ninguna query.
+
+    Returns:
+        dict: {'vacaciones': int, 'bajas': int, 'total': int}
+    """
+    ttl = current_app.config.get('PENDING_COUNTERS_TTL', 30)
+    ahora = time.monotonic()
+    entrada = _cache.get(aprobador_id)
+
+    if ttl > 0 and entrada is not None and entrada[0] >= ahora and entrada[1] == _version:
+        vacaciones, bajas = entrada[3]
+    else:
+        version = _version
+        usuarios, cuentas = _calcular(aprobador_id)
+        vacaciones, bajas = cuentas
+        if ttl > 0:
+            with _lock:
+                if len(_cache) >= MAX_ENTRADAS:
+                    _cache.clear()
+                # Si alguien invalidó mientras contábamos, no guardamos un valor viejo
+                if version == _version:
+                    _cache[aprobador_id] = (ahora + ttl, version, usuarios, cuentas)
+
+    return {'vacaciones': vacaciones, 'bajas': bajas, 'total': vacaciones + bajas}
+
+
+# ==========================================
+# MANTENIMIENTO INCREMENTAL
+# ==========================================
+
+_DESCONOCIDO = object()
+
+
+def _valor_previo(estado, atributo):
+    """Valor del atributo antes del flush, o _DESCONOCIDO si no estaba cargado."""
+    historial = estado.attrs[atributo].history
+    if historial.deleted:
+        return historial.deleted[0]
+    if historial.unchanged:
+        return historial.unchanged[0]
+    return _DESCONOCIDO
+
+
+def _es_pendiente(estado_solicitud, es_actual):
+    if _DESCONOCIDO in (estado_solicitud, es_actual):
+        return _DESCONOCIDO
+    return estado_solicitud == 'pendiente' and bool(es_actual)
+
+
+@event.listens_for(SesionEnrutada, 'after_flush')
+def _acumular_cambios(sesion, contexto):
+    def _delta(usuario_id, tipo, valor):
+        deltas = sesion.info.setdefault('pendientes_delta', {})
+        deltas[(usuario_id, tipo)] = deltas.get((usuario_id, tipo), 0) + valor
+
+    def _descartar(usuario_id):
+        # Contadores de quien tenga a cargo a este usuario: se recalculan
+        sesion.info.setdefault('pendientes_descartar', set()).add(usuario_id)
+
+    for obj in sesion.new:
+        tipo = _TIPOS.get(type(obj))
+        if tipo is not None and obj.estado == 'pendiente' and obj.es_actual:
+            _delta(obj.usuario_id, tipo, 1)
+        elif isinstance(obj, Aprobador):
+            sesion.info['pendientes_jerarquia'] = True
+
+    for obj in sesion.deleted:
+        tipo = _TIPOS.get(type(obj))
+        if tipo is not None:
+            estado = inspect(obj)
+            antes = _es_pendiente(_valor_previo(estado, 'estado'), _valor_previo(estado, 'es_actual'))
+            if antes is _DESCONOCIDO:
+                _descartar(obj.usuario_id)
+            elif antes:
+                _delta(obj.usuario_id, tipo, -1)
+        elif isinstance(obj, Aprobador):
+            sesion.info['pendientes_jerarquia'] = True
+
+    for obj in sesion.dirty:
+        tipo = _TIPOS.get(type(obj))
+        if tipo is None:
+            if isinstance(obj, Aprobador):
+                sesion.info['pendientes_jerarquia'] = True
+            continue
+        estado = inspect(obj)
+        usuario_antes = _valor_previo(estado, 'usuario_id')
+        antes = _es_pendiente(_valor_previo(estado, 'estado'), _valor_previo(estado, 'es_actual'))
+        ahora = obj.estado == 'pendiente' and bool(obj.es_actual)
+        if antes is _DESCONOCIDO or usuario_antes is _DESCONOCIDO or usuario_antes != obj.usuario_id:
+            _descartar(obj.usuario_id)
+            if usuario_antes is not _DESCONOCIDO:
+                _descartar(usuario_antes)
+        elif antes != ahora:
+            _delta(obj.usuario_id, tipo, 1 if ahora else -1)
+
+
+@event.listens_for(SesionEnrutada, 'after_commit')
+def _aplicar_cambios(sesion):
+    deltas = sesion.info.pop('pendientes_delta', None)
+    descartar = sesion.info.pop('pendientes_descartar', set())
+    if sesion.info.pop('pendientes_jerarquia', False):
+        invalidar_contadores_pendientes()
+        return
+    if not deltas and not descartar:
+        return
+
+    with _lock:
+        for aprobador_id, (expira, version, usuarios, cuentas) in list(_cache.items()):
+            if usuarios & descartar:
+                del _cache[aprobador_id]
+                continue
+            nuevas = list(cuentas)
+            for (usuario_id, tipo), valor in (deltas or {}).items():
+                if usuario_id in usuarios:
+                    nuevas[tipo] = max(nuevas[tipo] + valor, 0)
+            if nuevas != cuentas:
+                _cache[aprobador_id] = (expira, version, usuarios, nuevas)
+
+
+@event.listens_for(SesionEnrutada, 'after_rollback')
+def _tras_rollback(sesion):
+    sesion.info.pop('pendientes_delta', None)
+    sesion.info.pop('pendientes_descartar', None)
+    sesion.info.pop('pendientes_jerarquia', None)
@@ -0,0 +1,343 @@
+"""
+Ingesta masiva de marcajes de terminales de fichaje (lectores de tarjetas).
+
+Un terminal envía lotes de eventos (usuario, momento, sentido 'in'/'out').
+El lote completo se procesa con un número fijo de queries, independiente
+del número de eventos:
+
+    1. Deduplicación contra eventos ya recibidos del mismo terminal.
+    2. Resolución de usuarios (por id o email).
+    3. Fichajes abiertos actuales de esos usuarios.
+    4. Emparejado en memoria de entradas/salidas por usuario y en orden.
+    5. Comprobación de solapes contra los fichajes existentes (una query).
+    6. Cierre masivo de los abiertos (UPDATE ... RETURNING: una salida cuyo
+       fichaje ya cerró otro camino queda como 'ya_cerrado'), después
+       inserción masiva de fichajes nuevos (una entrada abierta de un usuario
+       cuyo fichaje anterior sigue abierto queda como 'fichaje_abierto') y
+       registro masivo de los eventos. Los tramos cerrados se suman a las
+       sugerencias de horario de cada usuario (un SELECT y un UPDATE).
+"""
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytz
+from flask import current_app
+from sqlalchemy import case, insert, update, func, or_
+
+from src.models import db, Usuario, Fichaje, EventoTerminal
+from src.clock_events import publicar_estados, estado_reloj
+from src.suggestions import sumar_tramos_sugerencias
+
+SENTIDOS = ('in', 'out')
+
+# Un tramo entrada/salida más largo que esto se considera un error de marcaje
+MAX_DURACION_TRAMO = timedelta(hours=24)
+
+
+def _zona_horaria():
+    try:
+        return pytz.timezone(current_app.config.get('TIMEZONE', 'Europe/Madrid'))
+    except pytz.UnknownTimeZoneError:
+        return pytz.utc
+
+
+def _parsear_evento(bruto, tz):
+    """Valida un evento del lote. Lanza ValueError con el motivo si no es válido."""
+    if not isinstance(bruto, dict):
+        raise ValueError("El evento debe ser un objeto")
+
+    evento_id = str(bruto.get('event_id') or '').strip()
+    if not evento_id or len(evento_id) > 64:
+        raise ValueError("event_id obligatorio (máx. 64 caracteres)")
+
+    sentido = bruto.get('direction')
+    if sentido not in SENTIDOS:
+        raise ValueError("direction debe ser 'in' u 'out'")
+
+    try:
+        momento = datetime.fromisoformat(str(bruto.get('timestamp')))
+    except ValueError:
+        raise ValueError("timestamp debe estar en formato ISO 8601")
+    if momento.tzinfo is not None:
+        # Los fichajes se guardan en hora local de la empresa (naive)
+        momento = momento.astimezone(tz).replace(tzinfo=None)
+
+    usuario_id = bruto.get('usuario_id')
+    email = (bruto.get('email') or '').strip().lower() or None
+    if usuario_id is None and email is None:
+        raise ValueError("Se requiere usuario_id o email")
+    try:
+        usuario_id = int(usuario_id) if usuario_id is not None else None
+    except (TypeError, ValueError):
+        raise ValueError("usuario_id debe ser un entero")
+
+    return {'evento_id': evento_id, 'usuario_id': usuario_id, 'email': email,
+            'momento': momento, 'sentido': sentido, 'resultado': None, 'grupo_id': None}
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute + hora.second / 60
+
+
+def _se_solapan(entrada_a, salida_a, entrada_b, salida_b):
+    """
+    Intersección de tramos del mismo día (misma regla que
+    verificar_solapamiento_fichaje). Un tramo abierto (salida None) es un
+    instante; un tramo nocturno (salida < entrada) llega hasta medianoche.
+    """
+    ea, eb = _minutos(entrada_a), _minutos(entrada_b)
+    sa = _minutos(salida_a) if salida_a is not None else ea
+    sb = _minutos(salida_b) if salida_b is not None else eb
+    if salida_a is not None and sa < ea:
+        sa = 24 * 60
+    if salida_b is not None and sb < eb:
+        sb = 24 * 60
+    if sa == ea:
+        return eb <= ea < sb
+    if sb == eb:
+        return ea <= eb < sa
+    return ea < sb and sa > eb
+
+
+def _emparejar(eventos, abierto):
+    """
+    Empareja en orden cronológico los eventos de un usuario.
+
+    Args:
+        eventos: eventos válidos del usuario en este lote.
+        abierto: fichaje abierto actual en BBDD (fila con id, fecha, hora_entrada) o None.
+
+    Returns:
+        (tramos, cierre): tramos nuevos [(evento_in, evento_out|None)] y, si
+        procede, (fila_abierta, evento_out) para cerrar el fichaje existente.
+    """
+    tramos, cierre = [], None
+    pendiente = None
+
+    for ev in sorted(eventos, key=lambda e: (e['momento'], e['sentido'] == 'out')):
+        if ev['sentido'] == 'in':
+            if pendiente or abierto:
+                # Ya hay una jornada abierta: entrada repetida
+                ev['resultado'] = 'ignorado'
+            else:
+                pendiente = ev
+            continue
+
+        if pendiente:
+            duracion = ev['momento'] - pendiente['momento']
+            if timedelta(0) < duracion <= MAX_DURACION_TRAMO:
+                tramos.append((pendiente, ev))
+            else:
+                pendiente['resultado'] = ev['resultado'] = 'huerfano'
+            pendiente = None
+        elif abierto:
+            duracion = ev['momento'] - datetime.combine(abierto.fecha, abierto.hora_entrada)
+            if timedelta(0) < duracion <= MAX_DURACION_TRAMO:
+                cierre = (abierto, ev)
+                abierto = None
+            else:
+                ev['resultado'] = 'huerfano'
+        else:
+            # Salida sin entrada previa
+            ev['resultado'] = 'huerfano'
+
+    if pendiente:
+        tramos.append((pendiente, None))
+    return tramos, cierre
+
+
+def ingerir_marcajes(dispositivo, eventos_brutos):
+    """
+    Procesa un lote de marcajes del terminal 'dispositivo'. No hace commit.
+
+    Returns:
+        dict: resumen del lote (recibidos, duplicados, fichajes creados/cerrados,
+        eventos rechazados o no emparejados con su motivo).
+    """
+    tz = _zona_horaria()
+    ahora = datetime.now(tz).replace(tzinfo=None)
+    resumen = {'recibidos': len(eventos_brutos), 'duplicados': 0, 'fichajes_creados': 0,
+               'fichajes_cerrados': 0, 'rechazados': []}
+
+    validos, vistos = [], set()
+    for bruto in eventos_brutos:
+        try:
+            ev = _parsear_evento(bruto, tz)
+        except ValueError as e:
+            evento_id = bruto.get('event_id') if isinstance(bruto, dict) else None
+            resumen['rechazados'].append({'event_id': evento_id, 'motivo': str(e)})
+            continue
+        if ev['evento_id'] in vistos:
+            resumen['duplicados'] += 1
+            continue
+        vistos.add(ev['evento_id'])
+        validos.append(ev)
+
+    if not validos:
+        return resumen
+
+    # 1. DEDUPLICACIÓN: reenvíos del terminal
+    ya_recibidos = {
+        fila.evento_id for fila in db.session.query(EventoTerminal.evento_id).filter(
+            EventoTerminal.dispositivo == dispositivo,
+            EventoTerminal.evento_id.in_(vistos)
+        )
+    }
+    nuevos = [ev for ev in validos if ev['evento_id'] not in ya_recibidos]
+    resumen['duplicados'] += len(validos) - len(nuevos)
+    if not nuevos:
+        return resumen
+
+    # 2. USUARIOS (activos) por id o email
+    ids = {ev['usuario_id'] for ev in nuevos if ev['usuario_id'] is not None}
+    emails = {ev['email'] for ev in nuevos if ev['usuario_id'] is None}
+    usuarios = db.session.query(Usuario.id, Usuario.email).filter(
+        Usuario.activo == True,
+        or_(Usuario.id.in_(ids), func.lower(Usuario.email).in_(emails))
+    ).all()
+    ids_validos = {u.id for u in usuarios}
+    id_por_email = {u.email.lower(): u.id for u in usuarios}
+
+    por_usuario = defaultdict(list)
+    for ev in nuevos:
+        usuario_id = ev['usuario_id'] if ev['usuario_id'] is not None else id_por_email.get(ev['email'])
+        if usuario_id not in ids_validos:
+            ev['usuario_id'] = None
+            ev['resultado'] = 'usuario_desconocido'
+            continue
+        ev['usuario_id'] = usuario_id
+        por_usuario[usuario_id].append(ev)
+
+    # 3. FICHAJES ABIERTOS actuales (índice parcial uq_fichaje_abierto_usuario)
+    abiertos = {
+        f.usuario_id: f for f in db.session.query(
+            Fichaje.id, Fichaje.usuario_id, Fichaje.fecha, Fichaje.hora_entrada
+        ).filter(
+            Fichaje.usuario_id.in_(por_usuario.keys()),
+            Fichaje.es_actual == True,
+            Fichaje.hora_salida.is_(None),
+            Fichaje.tipo_accion != 'eliminacion'
+        )
+    }
+
+    # 4. EMPAREJADO en memoria
+    tramos, cierres = [], []
+    for usuario_id, eventos in por_usuario.items():
+        tramos_usuario, cierre = _emparejar(eventos, abiertos.get(usuario_id))
+        tramos.extend((usuario_id, entrada, salida) for entrada, salida in tramos_usuario)
+        if cierre:
+            cierres.append((usuario_id, *cierre))
+
+    # 5. SOLAPES contra fichajes cerrados existentes (una sola query para todo el lote)
+    afectados = {t[0] for t in tramos} | {c[0] for c in cierres}
+    fechas = {entrada['momento'].date() for _, entrada, _ in tramos} | {fila.fecha for _, fila, _ in cierres}
+    existentes = defaultdict(list)
+    if afectados:
+        for f in db.session.query(
+            Fichaje.usuario_id, Fichaje.fecha, Fichaje.hora_entrada, Fichaje.hora_salida
+        ).filter(
+            Fichaje.usuario_id.in_(afectados),
+            Fichaje.fecha.in_(fechas),
+            Fichaje.es_actual == True,
+            Fichaje.tipo_accion != 'eliminacion',
+            Fichaje.hora_salida.isnot(None)
+        ):
+            existentes[(f.usuario_id, f.fecha)].append((f.hora_entrada, f.hora_salida))
+
+    def _hay_solape(usuario_id, fecha, entrada, salida):
+        return any(_se_solapan(entrada, salida, e, s) for e, s in existentes[(usuario_id, fecha)])
+
+    # 6. ESCRITURA MASIVA
+    # Primero los cierres: el fichaje abierto de un usuario tiene que estar
+    # cerrado antes de insertar su nueva entrada abierta, o el índice único
+    # 'uq_fichaje_abierto_usuario' rechazaría el lote entero
+    estados = {}
+    tramos_cerrados = []
+    cierres_validos = {}
+    for usuario_id, fila, salida in cierres:
+        hora_salida = salida['momento'].time().replace(microsecond=0)
+        if _hay_solape(usuario_id, fila.fecha, fila.hora_entrada, hora_salida):
+            salida['resultado'] = 'solapado'
+            continue
+        cierres_validos[fila.id] = (usuario_id, fila, salida, hora_salida)
+
+    cerrados = set()
+    if cierres_validos:
+        # Un solo UPDATE ... RETURNING, solo si sigue abierto: si el toggle web o
+        # el cierre nocturno ganaron la carrera, ese id no vuelve y no se cuenta
+        tabla = Fichaje.__table__
+        cerrados = set(db.session.scalars(
+            update(tabla)
+            .where(tabla.c.id.in_(cierres_validos), tabla.c.hora_salida.is_(None))
+            .values(hora_salida=case({id_: hora for id_, (_, _, _, hora) in cierres_validos.items()},
+                                     value=tabla.c.id),
+                    pausa=0)
+            .returning(tabla.c.id)
+        ))
+    for fichaje_id, (usuario_id, fila, salida, hora) in cierres_validos.items():
+        if fichaje_id not in cerrados:
+            salida['resultado'] = 'ya_cerrado'
+            continue
+        salida['resultado'] = 'emparejado'
+        estados[usuario_id] = (estado_reloj(), fila.fecha)
+        tramos_cerrados.append((usuario_id, Fichaje(fecha=fila.fecha, hora_entrada=fila.hora_entrada,
+                                                     hora_salida=hora, pausa=0)))
+
+    # Usuarios cuyo fichaje abierto sigue abierto (su salida no se pudo aplicar)
+    siguen_abiertos = {u for u, fila, salida in cierres if salida['resultado'] == 'solapado'}
+
+    nuevos_fichajes = []
+    for usuario_id, entrada, salida in tramos:
+        fecha = entrada['momento'].date()
+        hora_entrada = entrada['momento'].time().replace(microsecond=0)
+        hora_salida = salida['momento'].time().replace(microsecond=0) if salida else None
+        marcados = [entrada] + ([salida] if salida else [])
+
+        if _hay_solape(usuario_id, fecha, hora_entrada, hora_salida):
+            for ev in marcados:
+                ev['resultado'] = 'solapado'
+            continue
+        if salida is None and usuario_id in siguen_abiertos:
+            # Se rechaza solo esta entrada; el resto del lote sigue adelante
+            entrada['resultado'] = 'fichaje_abierto'
+            continue
+
+        grupo_id = str(uuid.uuid4())
+        for ev in marcados:
+            ev['resultado'] = 'emparejado' if salida else 'abierto'
+            ev['grupo_id'] = grupo_id
+        nuevos_fichajes.append({
+            'usuario_id': usuario_id, 'editor_id': None, 'grupo_id': grupo_id,
+            'version': 1, 'es_actual': True, 'tipo_accion': 'creacion',
+            'fecha': fecha, 'hora_entrada': hora_entrada, 'hora_salida': hora_salida,
+            'pausa': 0, 'fecha_creacion': ahora,
+        })
+        if salida is not None:
+            tramos_cerrados.append((usuario_id, Fichaje(fecha=fecha, hora_entrada=hora_entrada,
+                                                        hora_salida=hora_salida, pausa=0)))
+        # Una entrada abierta manda sobre el estado del reloj; un tramo cerrado no pisa un cierre
+        if salida is None or usuario_id not in estados:
+            estados[usuario_id] = (estado_reloj(entrada['momento']) if salida is None else None, fecha)
+
+    if nuevos_fichajes:
+        db.session.execute(insert(Fichaje), nuevos_fichajes)
+
+    db.session.execute(insert(EventoTerminal), [{
+        'dispositivo': dispositivo, 'evento_id': ev['evento_id'], 'usuario_id': ev['usuario_id'],
+        'momento': ev['momento'], 'sentido': ev['sentido'], 'resultado': ev['resultado'],
+        'grupo_id': ev['grupo_id'], 'fecha_recepcion': datetime.utcnow(),
+    } for ev in nuevos])
+
+    # Sugerencias de horario, en la misma transacción que los fichajes
+    sumar_tramos_sugerencias(tramos_cerrados)
+
+    publicar_estados([(usuario_id, estado, fecha) for usuario_id, (estado, fecha) in estados.items()])
+
+    resumen['fichajes_creados'] = len(nuevos_fichajes)
+    resumen['fichajes_cerrados'] = len(cerrados)
+    resumen['rechazados'].extend(
+        {'event_id': ev['evento_id'], 'motivo': ev['resultado']}
+        for ev in nuevos if ev['resultado'] not in ('emparejado', 'abierto')
+    )
+    return resumen
@@ -6,6 +6,7 @@ main_bp = Blueprint('main', __name__)
 fichajes_bp = Blueprint('fichajes', __name__)
 ausencias_bp = Blueprint('ausencias', __name__)
 admin_bp = Blueprint('admin', __name__)
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
 
 # Importamos las rutas para que se registren
-from . import auth, main, fichajes, ausencias, admin
\ No newline at end of file
+from . import auth, main, fichajes, ausencias, admin, api
\ No newline at end of file
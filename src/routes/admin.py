@@ -6,10 +6,20 @@ from datetime import datetime, date, timedelta
 from calendar import monthrange
 
 from src import db, admin_required
-from src.models import Usuario, Aprobador, Fichaje, SolicitudVacaciones, Festivo, TipoAusencia, SolicitudBaja, CambioSaldo, SaldoVacaciones
+from src.models import Usuario, Aprobador, Fichaje, SolicitudVacaciones, Festivo, TipoAusencia, SolicitudBaja, CambioSaldo, SaldoVacaciones, LimiteAusenciasEquipo
 from src.utils import invalidar_cache_festivos, aplicar_cambio_saldo
+from src.user_cache import invalidar_cache_usuario, invalidar_cache_usuarios
+from src.database import metricas_pool, estado_replica, usar_replica
+from src.archive import version_fichaje, versiones_archivadas_auditoria
+from src.user_search import buscar_usuarios
+from src.pending_counters import invalidar_contadores_pendientes
+from src.hierarchy import recalcular_jerarquia
+from src.balances import abrir_saldo
 from . import admin_bp
 
+# Resultados por página del typeahead de usuarios
+RESULTADOS_BUSQUEDA = 20
+
 @admin_bp.route('/admin/usuarios')
 @admin_required
 def admin_usuarios():
@@ -23,29 +33,41 @@ def admin_usuarios():
 def admin_buscar_usuarios():
     """
     Endpoint AJAX para buscar usuarios por nombre/email.
-    Retorna JSON para autocompletado typeahead.
+    Retorna JSON para autocompletado typeahead, paginado con 'page' ('more'
+    indica si hay otra página). 'rol=aprobador' limita a aprobadores y admins.
     """
     query = request.args.get('q', '')
     if not query or len(query) < 2:
-        return {'results': []}
-    
-    # Búsqueda insensible a mayúsculas (solo usuarios activos)
-    usuarios = Usuario.query.filter(
-        Usuario.activo == True,
-        or_(
-            Usuario.nombre.ilike(f'%{query}%'),
-            Usuario.email.ilike(f'%{query}%')
-        )
-    ).limit(20).all()
-    
+        return {'results': [], 'more': False}
+    page = max(request.args.get('page', 1, type=int), 1)
+    roles = ['aprobador', 'admin'] if request.args.get('rol') == 'aprobador' else None
+
+    # Índice trigram (PostgreSQL) o en memoria; sin acentos y por relevancia.
+    # Pedimos uno de más para saber si hay otra página
+    usuarios = buscar_usuarios(query, limite=RESULTADOS_BUSQUEDA + 1,
+                               desplazamiento=(page - 1) * RESULTADOS_BUSQUEDA, roles=roles)
+
     results = [
         {
-            'id': u.id,
-            'text': f"{u.nombre} ({u.email})"
-        } for u in usuarios
+            'id': id_,
+            'text': f"{nombre} ({email})"
+        } for id_, nombre, email in usuarios[:RESULTADOS_BUSQUEDA]
     ]
     
-    return {'results': results}
+    return {'results': results, 'more': len(usuarios) > RESULTADOS_BUSQUEDA}
+
+@admin_bp.route('/admin/api/metricas/pool')
+@admin_required
+def admin_metricas_pool():
+    """
+    Endpoint JSON con el uso del pool de conexiones de este worker:
+    conexiones en uso, pico y tiempo de retención por endpoint.
+    """
+    return {
+        'rol': current_app.config.get('TEMPUS_ROLE'),
+        'engines': metricas_pool(),
+        'replica': estado_replica(),
+    }
 
 @admin_bp.route('/admin/usuarios/crear', methods=['GET', 'POST'])
 @admin_required
@@ -73,18 +95,7 @@ def admin_crear_usuario():
         db.session.flush()  # ✅ Genera el usuario.id sin hacer commit
         
         # ✅ NUEVO: Crear saldo automáticamente para el año actual
-        from datetime import datetime
-        from src.models import SaldoVacaciones
-        
-        anio_actual = datetime.now().year
-        saldo = SaldoVacaciones(
-            usuario_id=usuario.id,
-            anio=anio_actual,
-            dias_totales=dias_vacaciones,
-            dias_disfrutados=0,
-            dias_carryover=0
-        )
-        db.session.add(saldo)
+        abrir_saldo(usuario.id, datetime.now().year, dias_vacaciones)
         
         db.session.commit()
 
@@ -127,6 +138,9 @@ def admin_editar_usuario(id):
 
         
         db.session.commit()
+        # Sus datos (nombre/email/rol) también están materializados en el cache
+        # de los empleados que aprueba: invalidamos todo el cache del proceso
+        invalidar_cache_usuarios()
 
         # --- LOGGING INICIO ---
         current_app.logger.info(
@@ -241,10 +255,15 @@ def admin_eliminar_usuario(id):
     Aprobador.query.filter(
         (Aprobador.usuario_id == id) | (Aprobador.aprobador_id == id)
     ).delete(synchronize_session='fetch')
+    # El borrado masivo no pasa por el flush: recalcular la jerarquía a mano
+    recalcular_jerarquia(usuario_ids=[id])
     
     # Archivar usuario (soft delete)
     usuario.activo = False
     db.session.commit()
+    # Las relaciones borradas afectan al cache de otros usuarios
+    invalidar_cache_usuarios()
+    invalidar_contadores_pendientes()
 
     # --- LOGGING INICIO ---
     current_app.logger.info(
@@ -270,20 +289,40 @@ def admin_eliminar_usuario(id):
 @admin_bp.route('/admin/aprobadores')
 @admin_required
 def admin_aprobadores():
-    # Optimización N+1
-    aprobadores = Aprobador.query.options(
-        db.joinedload(Aprobador.usuario),
-        db.joinedload(Aprobador.aprobador)
-    ).all()
-    # Only show active users in dropdown
-    usuarios = Usuario.query.filter_by(activo=True).order_by(Usuario.nombre).all()
-    return render_template('admin/aprobadores.html', aprobadores=aprobadores, usuarios=usuarios)
+    # Relaciones paginadas en servidor; los selectores de usuario usan el
+    # typeahead (/admin/api/usuarios/buscar) en vez de cargar toda la tabla
+    page = request.args.get('page', 1, type=int)
+    usuario_id = request.args.get('usuario_id', type=int)
+
+    query = Aprobador.query.join(Usuario, Aprobador.usuario_id == Usuario.id).options(
+        db.contains_eager(Aprobador.usuario),
+        db.joinedload(Aprobador.aprobador)  # Optimización N+1
+    )
+    usuario_seleccionado = None
+    if usuario_id:
+        usuario_seleccionado = db.session.get(Usuario, usuario_id)
+        # Como empleado o como aprobador
+        query = query.filter(or_(Aprobador.usuario_id == usuario_id,
+                                 Aprobador.aprobador_id == usuario_id))
+
+    pagination = query.order_by(Usuario.nombre, Aprobador.id).paginate(
+        page=page, per_page=50, error_out=False)
+    limites = LimiteAusenciasEquipo.query.join(LimiteAusenciasEquipo.aprobador).options(
+        db.contains_eager(LimiteAusenciasEquipo.aprobador)
+    ).order_by(Usuario.nombre).all()
+    return render_template('admin/aprobadores.html', aprobadores=pagination.items,
+                           pagination=pagination, usuario_seleccionado=usuario_seleccionado,
+                           limites=limites)
 
 @admin_bp.route('/admin/aprobadores/asignar', methods=['POST'])
 @admin_required
 def admin_asignar_aprobador():
-    usuario_id = int(request.form.get('usuario_id'))
-    aprobador_id = int(request.form.get('aprobador_id'))
+    usuario_id = request.form.get('usuario_id', type=int)
+    aprobador_id = request.form.get('aprobador_id', type=int)
+    # El typeahead no rellena el id si no se elige un resultado de la lista
+    if not usuario_id or not aprobador_id:
+        flash('Selecciona el usuario y el aprobador de la lista de resultados', 'warning')
+        return redirect(url_for('admin.admin_aprobadores'))
     
     if Aprobador.query.filter_by(usuario_id=usuario_id, aprobador_id=aprobador_id).first():
         flash('Esta relación ya existe', 'warning')
@@ -292,6 +331,7 @@ def admin_asignar_aprobador():
     relacion = Aprobador(usuario_id=usuario_id, aprobador_id=aprobador_id)
     db.session.add(relacion)
     db.session.commit()
+    invalidar_cache_usuario(usuario_id, aprobador_id)
     flash('Aprobador asignado correctamente', 'success')
     return redirect(url_for('admin.admin_aprobadores'))
 
@@ -299,11 +339,40 @@ def admin_asignar_aprobador():
 @admin_required
 def admin_eliminar_aprobador(id):
     aprobador = Aprobador.query.get_or_404(id)
+    ids_afectados = (aprobador.usuario_id, aprobador.aprobador_id)
     db.session.delete(aprobador)
     db.session.commit()
+    invalidar_cache_usuario(*ids_afectados)
     flash('Relación eliminada correctamente', 'success')
     return redirect(url_for('admin.admin_aprobadores'))
 
+@admin_bp.route('/admin/aprobadores/limite', methods=['POST'])
+@admin_required
+def admin_limite_equipo():
+    """Fija (o quita, con 0 o vacío) el máximo de ausentes simultáneos del equipo de un aprobador."""
+    aprobador_id = request.form.get('aprobador_id', type=int)
+    max_ausentes = request.form.get('max_ausentes', type=int) or 0
+    if not aprobador_id or not db.session.get(Usuario, aprobador_id):
+        flash('Selecciona el aprobador de la lista de resultados', 'warning')
+        return redirect(url_for('admin.admin_aprobadores'))
+    if max_ausentes < 0:
+        flash('El límite no puede ser negativo', 'danger')
+        return redirect(url_for('admin.admin_aprobadores'))
+
+    limite = db.session.get(LimiteAusenciasEquipo, aprobador_id)
+    if max_ausentes == 0:
+        if limite:
+            db.session.delete(limite)
+        flash('Límite de ausencias eliminado', 'success')
+    else:
+        if limite is None:
+            limite = LimiteAusenciasEquipo(aprobador_id=aprobador_id)
+            db.session.add(limite)
+        limite.max_ausentes = max_ausentes
+        flash(f'Límite de ausencias simultáneas fijado en {max_ausentes}', 'success')
+    db.session.commit()
+    return redirect(url_for('admin.admin_aprobadores'))
+
 # --- FESTIVOS ---
 @admin_bp.route('/admin/festivos')
 @admin_required
@@ -519,6 +588,7 @@ def admin_editar_tipo_ausencia(id):
 # --- RESUMEN ---
 @admin_bp.route('/admin/resumen')
 @admin_required
+@usar_replica
 def admin_resumen():
     """
     Panel de resumen global anual con estadísticas agregadas y paginación real.
@@ -654,6 +724,7 @@ def admin_resumen():
 # --- CSV EXPORT ENDPOINTS ---
 @admin_bp.route('/admin/resumen/export')
 @admin_required
+@usar_replica
 def admin_resumen_export():
     """Export all users vacation summary to CSV."""
     import io
@@ -705,6 +776,7 @@ def admin_resumen_export():
 
 @admin_bp.route('/admin/fichajes/export')
 @admin_required
+@usar_replica
 def admin_fichajes_export():
     """Export fichajes to CSV with current filters."""
     import io
@@ -766,6 +838,7 @@ def admin_fichajes_export():
 
 @admin_bp.route('/admin/ausencias/export')
 @admin_required
+@usar_replica
 def admin_ausencias_export():
     """Export ausencias to CSV with current filters."""
     import io
@@ -777,8 +850,14 @@ def admin_ausencias_export():
     fecha_inicio_str = request.args.get('fecha_inicio')
     fecha_fin_str = request.args.get('fecha_fin')
     
-    query_vac = SolicitudVacaciones.query.filter_by(es_actual=True)
-    query_bajas = SolicitudBaja.query.filter_by(es_actual=True)
+    # Empleado y tipo ya cargados: el CSV los escribe en cada fila
+    query_vac = SolicitudVacaciones.query.options(
+        db.joinedload(SolicitudVacaciones.usuario)
+    ).filter_by(es_actual=True)
+    query_bajas = SolicitudBaja.query.options(
+        db.joinedload(SolicitudBaja.usuario),
+        db.joinedload(SolicitudBaja.tipo_ausencia)
+    ).filter_by(es_actual=True)
     
     if usuario_id:
         query_vac = query_vac.filter_by(usuario_id=usuario_id)
@@ -852,11 +931,8 @@ def _generar_detalle_cambios_fichaje(fichaje_actual):
     if fichaje_actual.tipo_accion == 'eliminacion':
         return f"{fichaje_actual.fecha.strftime('%d/%m/%Y')} ({fichaje_actual.hora_entrada.strftime('%H:%M')} - {fichaje_actual.hora_salida.strftime('%H:%M')})"
     
-    # Buscar la versión anterior
-    version_anterior = Fichaje.query.filter(
-        Fichaje.grupo_id == fichaje_actual.grupo_id,
-        Fichaje.version == fichaje_actual.version - 1
-    ).first()
+    # Buscar la versión anterior (en 'fichajes' o, si es antigua, en el archivo)
+    version_anterior = version_fichaje(fichaje_actual.grupo_id, fichaje_actual.version - 1)
     
     if not version_anterior:
         # Si no hay versión anterior, mostrar info básica
@@ -892,6 +968,7 @@ def _generar_detalle_cambios_fichaje(fichaje_actual):
 # --- AUDITORÍA UNIFICADA (Fichajes + Ausencias + Impersonation) ---
 @admin_bp.route('/admin/auditoria')
 @admin_required
+@usar_replica
 def admin_auditoria():
     usuario_nombre = request.args.get('usuario')
     fecha_inicio = request.args.get('fecha_inicio')
@@ -911,13 +988,18 @@ def admin_auditoria():
     
     if usuario_nombre:
         query_fichajes = query_fichajes.filter(Usuario.nombre.ilike(f'%{usuario_nombre}%'))
-    if fecha_inicio:
-        query_fichajes = query_fichajes.filter(Fichaje.fecha_creacion >= datetime.strptime(fecha_inicio, '%Y-%m-%d'))
-    if fecha_fin:
-        fin = datetime.strptime(fecha_fin, '%Y-%m-%d') + timedelta(days=1)
+    desde = datetime.strptime(fecha_inicio, '%Y-%m-%d') if fecha_inicio else None
+    fin = datetime.strptime(fecha_fin, '%Y-%m-%d') + timedelta(days=1) if fecha_fin else None
+    if desde:
+        query_fichajes = query_fichajes.filter(Fichaje.fecha_creacion >= desde)
+    if fin:
         query_fichajes = query_fichajes.filter(Fichaje.fecha_creacion < fin)
-        
-    for f in query_fichajes.all():
+
+    # Versiones antiguas movidas al archivo por 'flask archivar-fichajes'.
+    # Solo con fecha de inicio: sin rango habría que descomprimir todo el archivo
+    archivadas = versiones_archivadas_auditoria(desde, fin, usuario_nombre) if desde else []
+
+    for f in query_fichajes.all() + archivadas:
         tipo = 'MODIFICACIÓN'
         if f.tipo_accion == 'eliminacion': tipo = 'ELIMINACIÓN'
         elif f.version == 1: tipo = 'CREACIÓN (ADMIN)'
@@ -1019,10 +1101,11 @@ def admin_auditoria():
     logs_unificados.sort(key=lambda x: x['fecha_accion'], reverse=True)
 
     # Renderizamos la plantilla nueva que sabe mostrar esta lista unificada
-    return render_template('admin/auditoria.html', logs=logs_unificados)
+    return render_template('admin/auditoria.html', logs=logs_unificados, incluye_archivo=desde is not None)
 
 @admin_bp.route('/admin/admin_fichajes', methods=['GET'])
 @admin_required
+@usar_replica
 def admin_fichajes():
     # 1. Obtener filtros de la URL o defaults
     usuario_id = request.args.get('usuario_id', type=int)
@@ -1111,6 +1194,7 @@ def admin_fichajes():
 
 @admin_bp.route('/admin/gestion-ausencias')
 @admin_required
+@usar_replica
 def admin_gestion_ausencias():
     # 1. Obtener filtros
     usuario_id = request.args.get('usuario_id', type=int)
@@ -1119,8 +1203,14 @@ def admin_gestion_ausencias():
     fecha_fin_str = request.args.get('fecha_fin')
     
     # 2. Consultas Base (Solo versiones actuales)
-    query_vac = SolicitudVacaciones.query.filter_by(es_actual=True)
-    query_bajas = SolicitudBaja.query.filter_by(es_actual=True)
+    #    (con el empleado y el tipo ya cargados: la tabla los pinta en cada fila)
+    query_vac = SolicitudVacaciones.query.options(
+        db.joinedload(SolicitudVacaciones.usuario)
+    ).filter_by(es_actual=True)
+    query_bajas = SolicitudBaja.query.options(
+        db.joinedload(SolicitudBaja.usuario),
+        db.joinedload(SolicitudBaja.tipo_ausencia)
+    ).filter_by(es_actual=True)
     
     # 3. Filtros
     if usuario_id:
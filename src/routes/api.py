@@ -0,0 +1,73 @@
+import hmac
+from functools import wraps
+
+from flask import current_app, request, jsonify, g
+from sqlalchemy.exc import IntegrityError
+
+from src import db, limiter
+from src.punches import ingerir_marcajes
+from . import api_bp
+
+
+def _dispositivo_por_token(token):
+    """
+    Resuelve el terminal a partir de su token. PUNCH_API_TOKENS tiene el
+    formato 'terminal1:token1,terminal2:token2'.
+    """
+    for entrada in current_app.config.get('PUNCH_API_TOKENS', '').split(','):
+        nombre, _, esperado = entrada.strip().partition(':')
+        if nombre and esperado and hmac.compare_digest(esperado.encode(), token.encode()):
+            return nombre
+    return None
+
+
+def terminal_required(f):
+    """Autenticación 'Authorization: Bearer <token>' de terminales de fichaje."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        cabecera = request.headers.get('Authorization', '')
+        tipo, _, token = cabecera.partition(' ')
+        dispositivo = _dispositivo_por_token(token.strip()) if tipo.lower() == 'bearer' else None
+        if not dispositivo:
+            return jsonify({'error': 'Token de terminal no válido'}), 401
+        g.dispositivo = dispositivo
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@api_bp.route('/punches', methods=['POST'])
+@limiter.limit("120 per minute")
+@terminal_required
+def ingerir_punches():
+    """
+    Recibe un lote de marcajes de un terminal:
+
+        {"events": [{"event_id": "...", "usuario_id": 12 | "email": "...",
+                     "timestamp": "2026-10-19T08:59:12+02:00", "direction": "in"|"out"}]}
+
+    Los eventos ya recibidos (mismo terminal y event_id) se ignoran, así que el
+    terminal puede reenviar un lote completo sin riesgo tras un error de red.
+    """
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict) or not isinstance(datos.get('events'), list):
+        return jsonify({'error': "Se esperaba un objeto JSON con la lista 'events'"}), 400
+
+    eventos = datos['events']
+    maximo = current_app.config.get('PUNCH_API_MAX_BATCH', 5000)
+    if len(eventos) > maximo:
+        return jsonify({'error': f'Lote demasiado grande (máximo {maximo} eventos)'}), 413
+
+    try:
+        resumen = ingerir_marcajes(g.dispositivo, eventos)
+        db.session.commit()
+    except IntegrityError:
+        # Lote concurrente del mismo terminal o fichaje abierto simultáneo desde el reloj
+        db.session.rollback()
+        current_app.logger.warning(f"Conflicto al ingerir lote del terminal {g.dispositivo}")
+        return jsonify({'error': 'Conflicto con otra operación simultánea, reintente el lote'}), 409
+
+    current_app.logger.info(
+        f"Lote de marcajes del terminal {g.dispositivo}: {resumen['recibidos']} recibidos, "
+        f"{resumen['fichajes_creados']} fichajes creados, {resumen['fichajes_cerrados']} cerrados"
+    )
+    return jsonify(resumen)
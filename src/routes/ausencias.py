@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, date
 import uuid
@@ -6,7 +6,10 @@ import uuid
 from src import db
 from src.models import SolicitudVacaciones, SolicitudBaja, TipoAusencia, Usuario, SaldoVacaciones
 from src.utils import calcular_dias_habiles, verificar_solapamiento, simular_modificacion_vacaciones
-from src.google_calendar import crear_evento_vacaciones, crear_evento_baja, eliminar_evento
+from src.approvals import ACCIONES, RespuestasSolicitudes, bandeja_pendientes, responder_lote, exceso_capacidad
+from src.availability import bloquear_limites, dias_sobre_capacidad, describir_excesos
+from src.pending_counters import contadores_pendientes
+from src.hierarchy import esta_a_cargo
 from . import ausencias_bp
 
 # -------------------------------------------------------------------------
@@ -73,11 +76,8 @@ def listar_vacaciones():
 @login_required
 def solicitar_vacaciones():
     """Formulario y proceso de creación de nueva solicitud de vacaciones."""
-    
-    # Si es admin, cargar usuarios para el selector
-    usuarios = []
-    if current_user.rol == 'admin':
-        usuarios = Usuario.query.order_by(Usuario.nombre).all()
+
+    # Si es admin, el empleado se elige con el typeahead (/admin/api/usuarios/buscar)
 
     if request.method == 'POST':
         fecha_inicio_str = request.form.get('fecha_inicio')
@@ -115,6 +115,17 @@ def solicitar_vacaciones():
             flash(f'Error ({target_user.nombre}): {mensaje_error}', 'danger')
             return redirect(url_for('ausencias.solicitar_vacaciones'))
 
+        # 2b. Límite de ausencias simultáneas de sus equipos. Si el admin la
+        #     crea ya aprobada, con los límites bloqueados hasta el commit
+        #     (ver bloquear_limites): es una aprobación más
+        es_admin_gestion = (current_user.rol == 'admin' and target_user.id != current_user.id)
+        if es_admin_gestion:
+            bloquear_limites([target_user.id])
+        excesos = dias_sobre_capacidad(target_user.id, fecha_inicio, fecha_fin)
+        if excesos:
+            flash(f'Error ({target_user.nombre}): {describir_excesos(excesos)}', 'danger')
+            return redirect(url_for('ausencias.solicitar_vacaciones'))
+
         # 3. Cálculo de Días (Solo días Hábiles para vacaciones)
         dias_calculados = calcular_dias_habiles(fecha_inicio, fecha_fin)
         
@@ -135,7 +146,6 @@ def solicitar_vacaciones():
             return redirect(url_for('ausencias.solicitar_vacaciones'))
         
         # 5. Configurar Estado
-        es_admin_gestion = (current_user.rol == 'admin' and target_user.id != current_user.id)
         estado_inicial = 'aprobada' if es_admin_gestion else 'pendiente'
         aprobador_inicial = current_user.id if es_admin_gestion else None
         fecha_respuesta = datetime.utcnow() if es_admin_gestion else None
@@ -181,7 +191,7 @@ def solicitar_vacaciones():
         
         return redirect(url_for('ausencias.listar_vacaciones'))
         
-    return render_template('solicitar_vacaciones.html', usuarios=usuarios)
+    return render_template('solicitar_vacaciones.html')
 
 
 @ausencias_bp.route('/vacaciones/cancelar/<int:id>', methods=['POST'])
@@ -297,6 +307,11 @@ def modificar_vacaciones(id):
             flash(f"Error al modificar: {resultado['motivo']}", 'danger')
             return redirect(url_for('ausencias.modificar_vacaciones', id=id))
             
+        excesos = dias_sobre_capacidad(current_user.id, nueva_fecha_inicio, nueva_fecha_fin)
+        if excesos:
+            flash(f"Error al modificar: {describir_excesos(excesos)}", 'danger')
+            return redirect(url_for('ausencias.modificar_vacaciones', id=id))
+
         if resultado.get('es_adelanto'):
             flash(f"Atención: Estás solicitando vacaciones por adelantado ({resultado['saldo_proyectado']} días).", 'warning')
 
@@ -359,11 +374,8 @@ def listar_bajas():
 def solicitar_baja():
     """Formulario y proceso de creación de nueva baja/permiso."""
     tipos = TipoAusencia.query.filter_by(activo=True).all()
-    
-    # Si es admin, cargar usuarios
-    usuarios = []
-    if current_user.rol == 'admin':
-        usuarios = Usuario.query.order_by(Usuario.nombre).all()
+
+    # Si es admin, el empleado se elige con el typeahead (/admin/api/usuarios/buscar)
     
     if request.method == 'POST':
         tipo_id = request.form.get('tipo_ausencia')
@@ -454,7 +466,7 @@ def solicitar_baja():
         flash(msg_exito, 'success')
         return redirect(url_for('ausencias.listar_bajas'))
         
-    return render_template('solicitar_baja.html', tipos=tipos, usuarios=usuarios)
+    return render_template('solicitar_baja.html', tipos=tipos)
 
 
 # En src/routes/ausencias.py
@@ -497,28 +509,26 @@ def aprobar_solicitudes():
         flash('Acceso denegado. No tienes rol de aprobador.', 'danger')
         return redirect(url_for('main.index'))
     
-    # Obtener lista de IDs de usuarios asignados a este aprobador
-    ids_a_cargo = [r.usuario_id for r in current_user.usuarios_a_cargo]
-    
-    # 1. Buscar solicitudes de vacaciones pendientes
-    vacaciones = SolicitudVacaciones.query.filter(
-        SolicitudVacaciones.usuario_id.in_(ids_a_cargo),
-        SolicitudVacaciones.estado == 'pendiente',
-        SolicitudVacaciones.es_actual == True
-    ).all()
-    
-    # 2. Buscar bajas pendientes
-    bajas = SolicitudBaja.query.filter(
-        SolicitudBaja.usuario_id.in_(ids_a_cargo),
-        SolicitudBaja.estado == 'pendiente',
-        SolicitudBaja.es_actual == True
-    ).all()
+    # Pendientes de los empleados a cargo, con relaciones y adelantos precalculados
+    vacaciones, bajas = bandeja_pendientes(current_user.id)
     
     return render_template('aprobar_solicitudes.html', 
                          solicitudes_vac=vacaciones, 
                          solicitudes_bajas=bajas)
 
 
+@ausencias_bp.route('/aprobaciones/pendientes')
+@login_required
+def contador_pendientes():
+    """Contadores de solicitudes pendientes para el badge del menú (JSON)."""
+    if current_user.rol not in ['aprobador', 'admin']:
+        return jsonify({'error': 'No tienes permisos.'}), 403
+
+    respuesta = jsonify(contadores_pendientes(current_user.id))
+    respuesta.headers['Cache-Control'] = 'private, max-age=30'
+    return respuesta
+
+
 @ausencias_bp.route('/aprobaciones/vacaciones/<int:id>/<accion>', methods=['POST'])
 @login_required
 def responder_solicitud(id, accion):
@@ -530,126 +540,28 @@ def responder_solicitud(id, accion):
     solicitud = SolicitudVacaciones.query.get_or_404(id)
     
     # Seguridad: Validar que el empleado realmente está a su cargo (o soy admin)
-    es_mi_empleado = any(r.usuario_id == solicitud.usuario_id for r in current_user.usuarios_a_cargo)
+    es_mi_empleado = esta_a_cargo(current_user.id, solicitud.usuario_id)
     if not es_mi_empleado and current_user.rol != 'admin':
          flash('No tienes permiso para gestionar solicitudes de este usuario.', 'danger')
          return redirect(url_for('ausencias.aprobar_solicitudes'))
 
-    # Procesar Acción
-    if accion == 'aprobar':
-        # --- CASO A: CREACIÓN (Primera vez) ---
-        if solicitud.tipo_accion == 'creacion':
-            # 1. Actualizar Saldo
-            anio = solicitud.fecha_solicitud.year
-            saldo = SaldoVacaciones.query.filter_by(usuario_id=solicitud.usuario_id, anio=anio).first()
-
-            # Create SaldoVacaciones if it doesn't exist for this user/year
-            if not saldo:
-                saldo = SaldoVacaciones(
-                    usuario_id=solicitud.usuario_id,
-                    anio=anio,
-                    dias_totales=solicitud.usuario.dias_vacaciones,
-                    dias_disfrutados=0
-                )
-                db.session.add(saldo)
-
-            saldo.dias_disfrutados += solicitud.dias_solicitados
-            
-            solicitud.estado = 'aprobada'
-            
-            # Sincronizar con Calendar Compartido
-            event_id = crear_evento_vacaciones(solicitud)
-            if event_id:
-                solicitud.google_event_id = event_id
-            
-            flash(f'Solicitud de vacaciones aprobada. Días descontados.', 'success')
-
-        # --- CASO B: MODIFICACIÓN O CANCELACIÓN (Versionado) ---
-        elif solicitud.tipo_accion in ['modificacion', 'cancelacion']:
-            # 1. Buscar V1 (La versión actual anterior)
-            v1 = SolicitudVacaciones.query.filter(
-                SolicitudVacaciones.grupo_id == solicitud.grupo_id,
-                SolicitudVacaciones.es_actual == True,
-                SolicitudVacaciones.id != solicitud.id
-            ).first()
-
-            # 2. Consolidar V1 (Obsoleta)
-            dias_reintegro = 0
-            if v1:
-                v1.es_actual = False
-                dias_reintegro = v1.dias_solicitados
-                
-                # Eliminar evento viejo del Calendar
-                if v1.google_event_id:
-                    eliminar_evento(v1.google_event_id)
-            
-            # 3. Activar V2 (Esta solicitud)
-            solicitud.estado = 'aprobada'
-            solicitud.es_actual = True
-            
-            # 4. Ajuste de Saldo
-            coste_nuevo = 0
-            if solicitud.tipo_accion == 'modificacion':
-                coste_nuevo = solicitud.dias_solicitados
-                
-                # Crear evento nuevo en Calendar
-                event_id = crear_evento_vacaciones(solicitud)
-                if event_id:
-                    solicitud.google_event_id = event_id
-                    
-            elif solicitud.tipo_accion == 'cancelacion':
-                coste_nuevo = 0 # Cancelar implica que no se consumen días
-                # No crear evento (es una cancelación)
-            
-            anio = solicitud.fecha_solicitud.year
-            saldo = SaldoVacaciones.query.filter_by(usuario_id=solicitud.usuario_id, anio=anio).first()
-
-            # Create SaldoVacaciones if it doesn't exist for this user/year
-            if not saldo:
-                saldo = SaldoVacaciones(
-                    usuario_id=solicitud.usuario_id,
-                    anio=anio,
-                    dias_totales=solicitud.usuario.dias_vacaciones,
-                    dias_disfrutados=0
-                )
-                db.session.add(saldo)
-
-            saldo.dias_disfrutados = saldo.dias_disfrutados - dias_reintegro + coste_nuevo
-                
-            flash(f"Solicitud aprobada. Saldo ajustado (Devueltos: {dias_reintegro}, Nuevos: {coste_nuevo}).", 'success')
-
-    elif accion == 'rechazar':
-        solicitud.estado = 'rechazada'
-        flash(f'Solicitud de vacaciones de {solicitud.usuario.nombre} rechazada.', 'info')
-        
-        # Tarea 8: Si rechazamos una MODIFICACIÓN/CANCELACIÓN (v2), esa versión muere.
-        # La versión original (v1) sigue siendo la válida y 'actual'.
-        # Por tanto, marcamos la rechazada como es_actual=False para que no salga en listados como "actual" aprobada.
-        if solicitud.tipo_accion in ['modificacion', 'cancelacion']:
-            solicitud.es_actual = False
-            # Nota: No tocamos v1. v1 ya era es_actual=True y sigue siendolo.
-            # No tocamos Saldo.
-        
-        # Si rechazamos una CREACIÓN (v1), sigue siendo es_actual=True (pero rechazada), 
-        # para que el usuario vea que fue rechazada en su historial.
-    
-    else:
+    if accion not in ACCIONES:
         flash('Acción no reconocida.', 'warning')
         return redirect(url_for('ausencias.aprobar_solicitudes'))
-    
-    # Registrar auditoría de la respuesta
-    solicitud.aprobador_id = current_user.id
-    solicitud.fecha_respuesta = datetime.utcnow()
-    
+
+    if accion == 'aprobar':
+        error = exceso_capacidad(solicitud)
+        if error:
+            flash(f'No se puede aprobar: {error}', 'danger')
+            return redirect(url_for('ausencias.aprobar_solicitudes'))
+
+    # Procesar acción; Calendar y email van después del commit
+    respuestas = RespuestasSolicitudes(current_user.id, vacaciones=[solicitud])
+    mensaje, categoria = respuestas.responder_vacaciones(solicitud, accion)
     db.session.commit()
-    
-    # Enviar email al usuario con el resultado
-    try:
-        from src.email_service import enviar_email_respuesta
-        enviar_email_respuesta(solicitud.usuario, solicitud)
-    except Exception as e:
-        print(f"Error enviando email notificación: {e}")
+    respuestas.ejecutar_efectos()
 
+    flash(mensaje, categoria)
     return redirect(url_for('ausencias.aprobar_solicitudes'))
 
 
@@ -664,41 +576,77 @@ def responder_baja(id, accion):
     solicitud = SolicitudBaja.query.get_or_404(id)
     
     # Seguridad: Validar que el empleado está a su cargo
-    es_mi_empleado = any(r.usuario_id == solicitud.usuario_id for r in current_user.usuarios_a_cargo)
+    es_mi_empleado = esta_a_cargo(current_user.id, solicitud.usuario_id)
     if not es_mi_empleado and current_user.rol != 'admin':
          flash('No tienes permiso para gestionar solicitudes de este usuario.', 'danger')
          return redirect(url_for('ausencias.aprobar_solicitudes'))
     
-    # Procesar Acción
-    if accion == 'aprobar':
-        solicitud.estado = 'aprobada'
-        
-        # Sincronizar con Calendar Compartido
-        event_id = crear_evento_baja(solicitud)
-        if event_id:
-            solicitud.google_event_id = event_id
-        
-        flash(f'Baja/Permiso de {solicitud.usuario.nombre} aprobada.', 'success')
-        
-    elif accion == 'rechazar':
-        solicitud.estado = 'rechazada'
-        flash(f'Baja/Permiso de {solicitud.usuario.nombre} rechazada.', 'info')
-    
-    else:
+    if accion not in ACCIONES:
         flash('Acción no reconocida.', 'warning')
         return redirect(url_for('ausencias.aprobar_solicitudes'))
-    
-    # Registrar auditoría
-    solicitud.aprobador_id = current_user.id
-    solicitud.fecha_respuesta = datetime.utcnow()
-    
+
+    # Procesar acción; Calendar y email van después del commit
+    respuestas = RespuestasSolicitudes(current_user.id, bajas=[solicitud])
+    mensaje, categoria = respuestas.responder_baja(solicitud, accion)
     db.session.commit()
+    respuestas.ejecutar_efectos()
+
+    flash(mensaje, categoria)
+    return redirect(url_for('ausencias.aprobar_solicitudes'))
 
-    # Enviar email al usuario con el resultado
-    try:
-        from src.email_service import enviar_email_respuesta
-        enviar_email_respuesta(solicitud.usuario, solicitud)
-    except Exception as e:
-        print(f"Error enviando email notificación: {e}")
 
-    return redirect(url_for('ausencias.aprobar_solicitudes'))
\ No newline at end of file
+@ausencias_bp.route('/aprobaciones/lote', methods=['POST'])
+@login_required
+def responder_lote_solicitudes():
+    """
+    Aprueba o rechaza varias solicitudes pendientes a la vez.
+
+    Acepta formulario (accion, vacaciones[], bajas[]) o JSON con las mismas
+    claves. En JSON devuelve el resultado por solicitud; con formulario lo
+    resume en un flash y vuelve a la bandeja.
+    """
+    if current_user.rol not in ['aprobador', 'admin']:
+        if request.is_json:
+            return jsonify({'error': 'No tienes permisos.'}), 403
+        flash('No tienes permisos.', 'danger')
+        return redirect(url_for('main.index'))
+
+    if request.is_json:
+        datos = request.get_json(silent=True) or {}
+        accion = datos.get('accion')
+        try:
+            ids_vacaciones = [int(i) for i in datos.get('vacaciones', [])]
+            ids_bajas = [int(i) for i in datos.get('bajas', [])]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Identificadores no válidos.'}), 400
+    else:
+        accion = request.form.get('accion')
+        ids_vacaciones = request.form.getlist('vacaciones', type=int)
+        ids_bajas = request.form.getlist('bajas', type=int)
+
+    if accion not in ACCIONES:
+        if request.is_json:
+            return jsonify({'error': 'Acción no reconocida.'}), 400
+        flash('Acción no reconocida.', 'warning')
+        return redirect(url_for('ausencias.aprobar_solicitudes'))
+
+    resultados = responder_lote(current_user, accion, ids_vacaciones, ids_bajas)
+    procesadas = sum(1 for r in resultados if r['ok'])
+
+    if request.is_json:
+        return jsonify({
+            'accion': accion,
+            'procesadas': procesadas,
+            'omitidas': len(resultados) - procesadas,
+            'resultados': resultados
+        })
+
+    if not resultados:
+        flash('No has seleccionado ninguna solicitud.', 'warning')
+    else:
+        verbo = 'aprobadas' if accion == 'aprobar' else 'rechazadas'
+        flash(f'{procesadas} solicitudes {verbo}.', 'success' if procesadas else 'warning')
+        for r in resultados:
+            if not r['ok']:
+                flash(f"Solicitud de {r['tipo']} #{r['id']} omitida: {r['mensaje']}", 'warning')
+    return redirect(url_for('ausencias.aprobar_solicitudes'))
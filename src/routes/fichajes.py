@@ -1,15 +1,20 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import render_template, request, redirect, url_for, flash, jsonify, current_app, Response
 from flask_login import login_required, current_user
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time, timedelta
 from calendar import monthrange
-from sqlalchemy import func, desc, cast, Float
+from sqlalchemy import func, cast, Float, update, insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import extract
 from src.utils import es_festivo, verificar_solapamiento, verificar_solapamiento_fichaje, decimal_to_human
+import json
+import queue
 import uuid
 import pytz
 
 from src import db
-from src.models import Fichaje
+from src.models import Fichaje, IdempotenciaFichaje, Usuario, FICHAJES_PARTICIONADOS
+from src.suggestions import obtener_sugerencias, actualizar_sugerencias
+from src.clock_events import publicar_estado, estado_reloj, suscribir, cancelar_suscripcion
 from src.utils import es_festivo, verificar_solapamiento
 from . import fichajes_bp
 
@@ -189,27 +194,14 @@ def crear():
         )
         
         db.session.add(fichaje)
+        actualizar_sugerencias(current_user.id, nuevo=fichaje)
         db.session.commit()
         flash('Fichaje registrado correctamente', 'success')
         return redirect(url_for('fichajes.listar'))
     
     # --- LÓGICA DE SUGERENCIAS (TOP 3 FRECUENTES) ---
-    sugerencias = db.session.query(
-        Fichaje.hora_entrada,
-        Fichaje.hora_salida,
-        Fichaje.pausa,
-        func.count(Fichaje.id).label('total')
-    ).filter(
-        Fichaje.usuario_id == current_user.id,
-        Fichaje.es_actual == True,
-        Fichaje.tipo_accion != 'eliminacion'
-    ).group_by(
-        Fichaje.hora_entrada,
-        Fichaje.hora_salida,
-        Fichaje.pausa
-    ).order_by(
-        desc('total')
-    ).limit(3).all()
+    # Precalculadas por usuario (src/suggestions.py): una lectura por clave primaria
+    sugerencias = obtener_sugerencias(current_user.id)
     
     return render_template('crear_fichaje.html', now=datetime.now, sugerencias=sugerencias)
 
@@ -262,6 +254,11 @@ def editar(id):
         )
         
         db.session.add(nuevo_fichaje)
+        actualizar_sugerencias(fichaje_actual.usuario_id, nuevo=nuevo_fichaje, anterior=fichaje_actual)
+        # Avisar a las pestañas abiertas: si era el fichaje abierto, ya no lo está
+        era_abierto = fichaje_actual.hora_salida is None and fichaje_actual.tipo_accion != 'eliminacion'
+        publicar_estado(fichaje_actual.usuario_id, estado_reloj() if era_abierto else None,
+                        nuevo_fichaje.fecha)
         db.session.commit()
         flash('Fichaje rectificado correctamente (histórico guardado).', 'success')
         
@@ -309,6 +306,10 @@ def eliminar(id):
     )
     
     db.session.add(fichaje_borrado)
+    actualizar_sugerencias(fichaje_actual.usuario_id, anterior=fichaje_actual)
+    era_abierto = fichaje_actual.hora_salida is None and fichaje_actual.tipo_accion != 'eliminacion'
+    publicar_estado(fichaje_actual.usuario_id, estado_reloj() if era_abierto else None,
+                    fichaje_actual.fecha)
     db.session.commit()
     flash('Fichaje eliminado correctamente.', 'success')
     
@@ -398,50 +399,78 @@ def estado_fichaje():
         'duracion_segundos': 0
     })
 
-@fichajes_bp.route('/fichajes/toggle', methods=['POST'])
-@login_required
-def toggle_fichaje():
+def _alternar_fichaje(usuario_id, ahora_local):
     """
-    Acción del botón: Inicia o Detiene el fichaje.
+    Alterna el estado del usuario con sentencias atómicas, sin SELECT previo:
+
+    1. UPDATE ... RETURNING cierra el fichaje abierto, si lo hay.
+    2. Si no había ninguno, INSERT de uno nuevo abierto. El índice único
+       parcial 'uq_fichaje_abierto_usuario' garantiza que dos peticiones
+       simultáneas no puedan abrir dos jornadas.
+
+    Con la tabla particionada el índice es por usuario y día y ya no impide
+    dos aperturas en fechas distintas (dos toggles a medianoche, o uno del
+    terminal y otro de la web). Por eso:
+      - Se bloquea antes la fila del usuario: sus toggles se serializan y el
+        segundo ve el fichaje que abrió el primero.
+      - Si aun así hay más de un fichaje abierto, se cierra a la hora actual
+        solo el más reciente; los anteriores se cierran como el job nocturno
+        (23:59:59, marcados como incidencia para revisar).
+
+    Returns:
+        dict: respuesta JSON del toggle.
     """
-    ahora_local = get_user_now()
     fecha_actual = ahora_local.date()
     hora_actual = ahora_local.time()
 
-    # 1. Buscar si ya hay uno abierto
-    fichaje_activo = Fichaje.query.filter(
-        Fichaje.usuario_id == current_user.id,
-        Fichaje.es_actual == True,
-        Fichaje.hora_salida.is_(None),
-        Fichaje.tipo_accion != 'eliminacion'
-    ).first()
+    if FICHAJES_PARTICIONADOS:
+        db.session.execute(select(Usuario.id).where(Usuario.id == usuario_id).with_for_update())
 
-    if fichaje_activo:
+    cerrados = db.session.execute(
+        update(Fichaje)
+        .where(
+            Fichaje.usuario_id == usuario_id,
+            Fichaje.es_actual == True,
+            Fichaje.hora_salida.is_(None),
+            Fichaje.tipo_accion != 'eliminacion'
+        )
+        .values(hora_salida=hora_actual, pausa=0)
+        .returning(Fichaje.id, Fichaje.fecha, Fichaje.hora_entrada)
+        .execution_options(synchronize_session=False)
+    ).all()
+    cerrado = max(cerrados, key=lambda f: (f.fecha, f.hora_entrada), default=None)
+
+    if len(cerrados) > 1:
+        olvidados = [f.id for f in cerrados if f.id != cerrado.id]
+        db.session.execute(
+            update(Fichaje).where(Fichaje.id.in_(olvidados)).values(
+                hora_salida=time(23, 59, 59),
+                motivo_rectificacion="CIERRE AUTOMÁTICO (OLVIDO DE SALIDA) - PENDIENTE DE REVISAR"
+            ).execution_options(synchronize_session=False)
+        )
+        current_app.logger.warning(
+            f"Usuario {usuario_id} tenía {len(cerrados)} fichajes abiertos; "
+            f"cerrados como incidencia: {olvidados}")
+
+    if cerrado:
         # --- CASO: DETENER (STOP) ---
-        # Cerramos el fichaje existente
-        fichaje_activo.hora_salida = hora_actual
-        
-        # Opcional: Calcular pausa automática si quisiéramos, pero
-        # en este modelo Start/Stop la pausa es simplemente el tiempo entre fichajes.
-        fichaje_activo.pausa = 0 
-        
-        db.session.commit()
-        
-        return jsonify({
+        # En este modelo Start/Stop la pausa es simplemente el tiempo entre fichajes
+        tramo = Fichaje(fecha=cerrado.fecha, hora_entrada=cerrado.hora_entrada,
+                        hora_salida=hora_actual, pausa=0)
+        actualizar_sugerencias(usuario_id, nuevo=tramo)
+        publicar_estado(usuario_id, estado_reloj(), cerrado.fecha)
+        return {
             'status': 'stopped',
             'mensaje': f'Jornada pausada/finalizada a las {hora_actual.strftime("%H:%M")}',
-            'total_horas': decimal_to_human(fichaje_activo.horas_trabajadas())
-        })
-
-    else:
-        # --- CASO: INICIAR (START) ---
-        
-        # Validar si ya existe un fichaje cerrado HOY que solape (improbable con Start/Stop, pero posible por seguridad)
-        # En modo Start/Stop puro, permitimos múltiples fragmentos.
-        
-        nuevo_fichaje = Fichaje(
-            usuario_id=current_user.id,
-            editor_id=current_user.id,
+            'total_horas': decimal_to_human(tramo.horas_trabajadas())
+        }
+
+    # --- CASO: INICIAR (START) ---
+    # En modo Start/Stop puro, permitimos múltiples fragmentos por día.
+    db.session.execute(
+        insert(Fichaje).values(
+            usuario_id=usuario_id,
+            editor_id=usuario_id,
             grupo_id=str(uuid.uuid4()),
             version=1,
             es_actual=True,
@@ -452,15 +481,47 @@ def toggle_fichaje():
             pausa=0,
             fecha_creacion=ahora_local
         )
-        
-        db.session.add(nuevo_fichaje)
+    )
+    publicar_estado(usuario_id, estado_reloj(ahora_local), fecha_actual)
+    return {
+        'status': 'started',
+        'mensaje': f'Fichaje iniciado a las {hora_actual.strftime("%H:%M")}',
+        'inicio': ahora_local.isoformat()
+    }
+
+@fichajes_bp.route('/fichajes/toggle', methods=['POST'])
+@login_required
+def toggle_fichaje():
+    """
+    Acción del botón: Inicia o Detiene el fichaje.
+
+    Admite la cabecera 'Idempotency-Key': si el cliente reintenta con la misma
+    clave (timeout, red móvil...) se devuelve la respuesta original sin volver
+    a alternar el estado.
+    """
+    usuario_id = current_user.id
+    clave = (request.headers.get('Idempotency-Key') or '').strip()[:64]
+
+    try:
+        respuesta = _alternar_fichaje(usuario_id, get_user_now())
+        if clave:
+            db.session.execute(insert(IdempotenciaFichaje).values(
+                usuario_id=usuario_id, clave=clave, respuesta=respuesta,
+                fecha_creacion=datetime.utcnow()
+            ))
         db.session.commit()
-        
-        return jsonify({
-            'status': 'started',
-            'mensaje': f'Fichaje iniciado a las {hora_actual.strftime("%H:%M")}',
-            'inicio': ahora_local.isoformat()
-        })
+    except IntegrityError:
+        db.session.rollback()
+        if clave:
+            # Reintento de una petición ya confirmada: devolver su respuesta
+            previa = db.session.get(IdempotenciaFichaje, (usuario_id, clave))
+            if previa:
+                return jsonify(previa.respuesta)
+        # Otra petición simultánea abrió la jornada primero: el estado final es "iniciado"
+        current_app.logger.info(f"Toggle concurrente descartado para usuario {usuario_id}")
+        return jsonify({'status': 'started', 'mensaje': 'El fichaje ya estaba iniciado'}), 409
+
+    return jsonify(respuesta)
     
 @fichajes_bp.route('/fichajes/reloj')
 @login_required
@@ -468,12 +529,51 @@ def reloj():
     """Nueva pantalla de fichaje Start/Stop"""
     return render_template('reloj.html')
 
+@fichajes_bp.route('/fichajes/stream')
+@login_required
+def stream_estado():
+    """
+    Server-Sent Events con los cambios de estado del reloj del usuario.
+    La conexión no consulta la BBDD: espera en una cola que se alimenta al
+    confirmar toggles, rectificaciones, eliminaciones y cierres automáticos.
+    """
+    usuario_id = current_user.id
+    latido = current_app.config.get('CLOCK_STREAM_HEARTBEAT', 25)
+    cola = suscribir(usuario_id)
+
+    def eventos():
+        try:
+            # Reintento del navegador si se corta la conexión (ms)
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    evento = cola.get(timeout=latido)
+                except queue.Empty:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ': ping\n\n'
+                    continue
+                yield f"event: reloj\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            cancelar_suscripcion(usuario_id, cola)
+
+    # Sin stream_with_context: la sesión de BBDD se libera al volver de la vista
+    return Response(eventos(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: no acumular el stream
+    })
+
 @fichajes_bp.route('/fichajes/api/timeline', methods=['GET'])
 @login_required
 def api_timeline():
     """
     Devuelve los tramos horarios de un día específico para el timeline visual.
+
+    Con '?desde=YYYY-MM-DD&hasta=YYYY-MM-DD' devuelve un rango de días
+    (vista semanal/mensual) en una sola petición: ver _timeline_rango.
     """
+    if request.args.get('desde') or request.args.get('hasta'):
+        return _timeline_rango(request.args.get('desde'), request.args.get('hasta'))
+
     fecha_str = request.args.get('fecha')
     if not fecha_str:
         fecha = date.today()
@@ -501,23 +601,8 @@ def api_timeline():
     hora_actual_minutos = ahora.hour * 60 + ahora.minute
 
     for f in fichajes:
-        entrada_min = f.hora_entrada.hour * 60 + f.hora_entrada.minute
-        
-        if f.hora_salida:
-            salida_min = f.hora_salida.hour * 60 + f.hora_salida.minute
-            tipo = 'cerrado'
-        else:
-            # Si es hoy, llega hasta ahora. Si es pasado, hasta 23:59
-            if f.fecha == ahora.date():
-                salida_min = hora_actual_minutos
-            else:
-                salida_min = 1439 # Final del día
-            tipo = 'activo'
-
-        # Corregir si cruza medianoche (simple visualización corta en 23:59)
-        if salida_min < entrada_min: 
-            salida_min = 1439 
-
+        entrada_min, salida_min, activo = _minutos_bloque(f.fecha, f.hora_entrada, f.hora_salida, ahora)
+        tipo = 'activo' if activo else 'cerrado'
         duracion = salida_min - entrada_min
         
         # Calcular porcentajes para CSS
@@ -535,4 +620,76 @@ def api_timeline():
     return jsonify({
         'bloques': bloques,
         'hora_actual_pct': (hora_actual_minutos / TOTAL_MINUTOS) * 100 if fecha == ahora.date() else None
-    })
\ No newline at end of file
+    })
+
+# Máximo de días por petición de rango (un mes largo con margen)
+MAX_DIAS_TIMELINE = 62
+
+def _minutos_bloque(fecha, hora_entrada, hora_salida, ahora):
+    """
+    Minutos desde medianoche (entrada, salida) de un tramo y si sigue activo.
+    Un tramo abierto llega hasta 'ahora' si es de hoy, o hasta 23:59 si es
+    pasado; uno que cruza medianoche se corta en 23:59 (simple visualización).
+    """
+    entrada_min = hora_entrada.hour * 60 + hora_entrada.minute
+    if hora_salida:
+        salida_min = hora_salida.hour * 60 + hora_salida.minute
+    elif fecha == ahora.date():
+        salida_min = ahora.hour * 60 + ahora.minute
+    else:
+        salida_min = 1439 # Final del día
+
+    if salida_min < entrada_min:
+        salida_min = 1439
+    return entrada_min, salida_min, hora_salida is None
+
+def _timeline_rango(desde_str, hasta_str):
+    """
+    Tramos de varios días con una única query (índice idx_fichaje_usuario_fecha).
+
+    Formato compacto: {"dias": {"YYYY-MM-DD": [[entrada_min, salida_min, activo], ...]}}
+    con minutos enteros desde medianoche; los días sin fichajes se omiten.
+    Un rango totalmente pasado y sin tramos abiertos es cacheable por el navegador.
+    """
+    try:
+        desde = datetime.strptime(desde_str or '', '%Y-%m-%d').date()
+        hasta = datetime.strptime(hasta_str or '', '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': "Parámetros 'desde' y 'hasta' obligatorios (YYYY-MM-DD)"}), 400
+    if hasta < desde or (hasta - desde).days >= MAX_DIAS_TIMELINE:
+        return jsonify({'error': f'Rango inválido (máximo {MAX_DIAS_TIMELINE} días)'}), 400
+
+    filas = db.session.query(
+        Fichaje.fecha, Fichaje.hora_entrada, Fichaje.hora_salida
+    ).filter(
+        Fichaje.usuario_id == current_user.id,
+        Fichaje.es_actual == True,
+        Fichaje.fecha >= desde,
+        Fichaje.fecha <= hasta,
+        Fichaje.tipo_accion != 'eliminacion'
+    ).order_by(Fichaje.fecha, Fichaje.hora_entrada).all()
+
+    ahora = get_user_now() # Una sola vez para todo el rango
+    dias = {}
+    hay_activos = False
+    for fecha, hora_entrada, hora_salida in filas:
+        entrada_min, salida_min, activo = _minutos_bloque(fecha, hora_entrada, hora_salida, ahora)
+        hay_activos = hay_activos or activo
+        dias.setdefault(fecha.isoformat(), []).append([entrada_min, salida_min, int(activo)])
+
+    hoy = ahora.date()
+    respuesta = jsonify({
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'dias': dias,
+        'ahora_min': ahora.hour * 60 + ahora.minute if desde <= hoy <= hasta else None,
+    })
+
+    # Días pasados y cerrados apenas cambian (solo por rectificaciones):
+    # caché corta en el navegador; siempre con ETag para revalidar con 304
+    if hasta < hoy and not hay_activos:
+        respuesta.headers['Cache-Control'] = 'private, max-age=300'
+    else:
+        respuesta.headers['Cache-Control'] = 'private, no-cache'
+    respuesta.add_etag()
+    return respuesta.make_conditional(request)
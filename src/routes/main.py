@@ -3,31 +3,22 @@ from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta, date
 from src import db
-from src.models import Usuario, SolicitudVacaciones, SolicitudBaja, Aprobador, Festivo, Fichaje # <--- Añadido Fichaje
+from src.models import Usuario, SolicitudVacaciones, SolicitudBaja, Festivo, Fichaje # <--- Añadido Fichaje
 from src.utils import calcular_dias_laborables
+from src.user_cache import invalidar_cache_usuario
+from src.pending_counters import contadores_pendientes
+from src.hierarchy import esta_a_cargo
+from src.availability import MAX_DIAS, disponibilidad_equipo
 from . import main_bp
 
 @main_bp.route('/')
 @login_required
 def index():
     # --- 1. LÓGICA DE AVISOS PARA APROBADORES ---
+    # Contadores en memoria, mantenidos al crear/responder solicitudes
     solicitudes_pendientes_count = 0
     if current_user.rol in ['aprobador', 'admin']:
-        usuarios_ids = [r.usuario_id for r in Aprobador.query.filter_by(aprobador_id=current_user.id).all()]
-        
-        count_vac = SolicitudVacaciones.query.filter(
-            SolicitudVacaciones.usuario_id.in_(usuarios_ids),
-            SolicitudVacaciones.estado == 'pendiente',
-            SolicitudVacaciones.es_actual == True
-        ).count()
-        
-        count_bajas = SolicitudBaja.query.filter(
-            SolicitudBaja.usuario_id.in_(usuarios_ids),
-            SolicitudBaja.estado == 'pendiente',
-            SolicitudBaja.es_actual == True
-        ).count()
-        
-        solicitudes_pendientes_count = count_vac + count_bajas
+        solicitudes_pendientes_count = contadores_pendientes(current_user.id)['total']
 
     # --- 2. LÓGICA DE RESUMEN DE FICHAJES ---
     hoy = date.today()
@@ -92,6 +83,7 @@ def perfil():
         
         current_user.password = generate_password_hash(new_password)
         db.session.commit()
+        invalidar_cache_usuario(current_user.id)
         flash('Contraseña actualizada correctamente', 'success')
         return redirect(url_for('main.perfil'))
     
@@ -142,6 +134,32 @@ def cronograma():
     
     return render_template('cronograma.html', eventos=eventos)
 
+@main_bp.route('/api/equipos/<int:id>/disponibilidad')
+@login_required
+def disponibilidad_equipo_api(id):
+    """
+    Personas ausentes por día en el equipo del aprobador 'id' (mapa de calor).
+    Parámetros: desde, hasta (YYYY-MM-DD; por defecto, los próximos 30 días).
+    """
+    responsable = Usuario.query.get_or_404(id)
+    puede_ver = (current_user.rol == 'admin' or current_user.id == responsable.id
+                 or esta_a_cargo(current_user.id, responsable.id))
+    if not puede_ver:
+        return jsonify({'error': 'No tienes permiso para ver este equipo.'}), 403
+
+    try:
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d').date() if request.args.get('desde') else date.today()
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date() if request.args.get('hasta') else desde + timedelta(days=30)
+    except ValueError:
+        return jsonify({'error': 'Formato de fecha inválido (YYYY-MM-DD).'}), 400
+
+    if hasta < desde:
+        return jsonify({'error': 'La fecha de fin no puede ser anterior a la de inicio.'}), 400
+    if (hasta - desde).days + 1 > MAX_DIAS:
+        return jsonify({'error': f'El rango no puede superar {MAX_DIAS} días.'}), 400
+
+    return jsonify(disponibilidad_equipo(responsable.id, desde, hasta))
+
 @main_bp.route('/vacaciones/calcular-dias', methods=['POST'])
 @login_required
 def calcular_dias_ajax():
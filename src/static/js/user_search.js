@@ -2,10 +2,12 @@
  * User Search Autocomplete for Tempus Admin
  * 
  * Usage:
- * setupUserSearch(textInputId, hiddenInputId, autoSubmit = false)
+ * setupUserSearch(textInputId, hiddenInputId, autoSubmit = false, options = {})
+ *
+ * options.rol: 'aprobador' to only list approvers and admins
  */
 
-function setupUserSearch(textInputId, hiddenInputId, autoSubmit = false) {
+function setupUserSearch(textInputId, hiddenInputId, autoSubmit = false, options = {}) {
     const input = document.getElementById(textInputId);
     const hidden = document.getElementById(hiddenInputId);
 
@@ -38,43 +40,78 @@ function setupUserSearch(textInputId, hiddenInputId, autoSubmit = false) {
             return;
         }
 
-        debounceTimer = setTimeout(() => {
-            fetch(`/admin/api/usuarios/buscar?q=${encodeURIComponent(query)}`)
-                .then(response => response.json())
-                .then(data => {
-                    resultsDiv.innerHTML = '';
-                    if (data.results.length > 0) {
-                        resultsDiv.style.display = 'block';
-                        data.results.forEach(user => {
-                            const item = document.createElement('a');
-                            item.href = '#';
-                            item.className = 'list-group-item list-group-item-action';
-                            item.textContent = user.text;
-
-                            item.addEventListener('click', function (e) {
-                                e.preventDefault();
-                                input.value = user.text;
-                                hidden.value = user.id;
-                                resultsDiv.style.display = 'none';
-
-                                // Dispatch change event so external listeners can react
-                                hidden.dispatchEvent(new Event('change', { bubbles: true }));
-
-                                if (autoSubmit && input.form) {
-                                    input.form.submit();
-                                }
-                            });
-
-                            resultsDiv.appendChild(item);
-                        });
-                    } else {
-                        resultsDiv.style.display = 'none';
-                    }
-                })
-                .catch(err => console.error('Error searching users:', err));
-        }, 300); // 300ms debounce
+        debounceTimer = setTimeout(() => loadPage(query, 1), 300); // 300ms debounce
     });
 
+    function selectUser(user) {
+        input.value = user.text;
+        hidden.value = user.id;
+        resultsDiv.style.display = 'none';
+
+        // Dispatch change event so external listeners can react
+        hidden.dispatchEvent(new Event('change', { bubbles: true }));
+
+        if (autoSubmit && input.form) {
+            input.form.submit();
+        }
+    }
+
+    // Results are paginated server-side: "more" appends the next page
+    function loadPage(query, page) {
+        let url = `/admin/api/usuarios/buscar?q=${encodeURIComponent(query)}&page=${page}`;
+        if (options.rol) {
+            url += `&rol=${encodeURIComponent(options.rol)}`;
+        }
+
+        fetch(url)
+            .then(response => response.json())
+            .then(data => {
+                // Ignore stale responses if the user kept typing
+                if (input.value !== query) return;
+
+                if (page === 1) {
+                    resultsDiv.innerHTML = '';
+                } else {
+                    const moreItem = resultsDiv.querySelector('.user-search-more');
+                    if (moreItem) moreItem.remove();
+                }
+
+                if (data.results.length === 0 && page === 1) {
+                    resultsDiv.style.display = 'none';
+                    return;
+                }
+
+                resultsDiv.style.display = 'block';
+                data.results.forEach(user => {
+                    const item = document.createElement('a');
+                    item.href = '#';
+                    item.className = 'list-group-item list-group-item-action';
+                    item.textContent = user.text;
+
+                    item.addEventListener('click', function (e) {
+                        e.preventDefault();
+                        selectUser(user);
+                    });
+
+                    resultsDiv.appendChild(item);
+                });
+
+                if (data.more) {
+                    const more = document.createElement('a');
+                    more.href = '#';
+                    more.className = 'list-group-item list-group-item-action text-center text-muted user-search-more';
+                    more.textContent = 'Más resultados...';
+                    more.addEventListener('click', function (e) {
+                        e.preventDefault();
+                        e.stopPropagation();
+                        loadPage(query, page + 1);
+                    });
+                    resultsDiv.appendChild(more);
+                }
+            })
+            .catch(err => console.error('Error searching users:', err));
+    }
+
     // Hide results when clicking outside
     document.addEventListener('click', function (e) {
         if (e.target !== input && e.target !== resultsDiv) {
@@ -0,0 +1,222 @@
+"""
+Sugerencias de horario para el formulario de fichaje manual.
+
+Antes, cada apertura del formulario agrupaba TODO el histórico del usuario
+(GROUP BY hora_entrada, hora_salida, pausa), un coste que crece sin límite.
+Ahora cada usuario tiene una fila en 'sugerencias_fichaje' y el formulario
+hace una única lectura por clave primaria.
+
+Ponderación por antigüedad: cada fichaje aporta 2^(-días/VIDA_MEDIA_DIAS)
+respecto a la fecha de referencia, así que un horario nuevo desplaza pronto
+a uno que se usaba hace meses. Todos los pesos de un usuario se normalizan a
+la misma referencia: el paso del tiempo los escala por igual y no altera el
+orden, de modo que solo hay que tocarlos cuando cambian los fichajes.
+"""
+from collections import defaultdict, namedtuple
+from datetime import date, time
+from itertools import groupby
+from operator import itemgetter
+
+from sqlalchemy import select, update
+
+from src.database import insert_con_conflicto
+from src.models import db, Fichaje, SugerenciaFichaje
+
+# Sugerencias mostradas en el formulario
+TOP_N = 3
+# Candidatos guardados por usuario (margen para que el incremental no pierda turnos)
+MAX_CANDIDATOS = 20
+VIDA_MEDIA_DIAS = 90
+
+Sugerencia = namedtuple('Sugerencia', ['hora_entrada', 'hora_salida', 'pausa'])
+
+
+def _peso(fecha, referencia):
+    return 2 ** (-(referencia - fecha).days / VIDA_MEDIA_DIAS)
+
+
+def _clave(hora_entrada, hora_salida, pausa):
+    return (hora_entrada.hour * 60 + hora_entrada.minute,
+            hora_salida.hour * 60 + hora_salida.minute,
+            pausa or 0)
+
+
+def _a_hora(minutos):
+    return time(minutos // 60, minutos % 60)
+
+
+def _podar(pesos):
+    """Lista de turnos [entrada, salida, pausa, peso] con los MAX_CANDIDATOS de más peso."""
+    mejores = sorted(((k, p) for k, p in pesos.items() if p > 1e-6), key=lambda kp: -kp[1])
+    return [[*k, round(p, 6)] for k, p in mejores[:MAX_CANDIDATOS]]
+
+
+def obtener_sugerencias(usuario_id):
+    """
+    Top-N de horarios del usuario con una lectura por clave primaria.
+    Si el usuario aún no tiene fila (alta previa a esta tabla), se calcula
+    una vez desde su histórico y queda guardada. Se inserta con ON CONFLICT
+    DO NOTHING: si el job nocturno o el incremental la crearon entretanto,
+    gana la suya y se lee esa.
+    """
+    fila = db.session.get(SugerenciaFichaje, usuario_id)
+    if fila is None:
+        recalcular_sugerencias([usuario_id], sobrescribir=False)
+        db.session.commit()
+        fila = db.session.get(SugerenciaFichaje, usuario_id)
+        if fila is None:
+            return []
+
+    return [Sugerencia(_a_hora(entrada), _a_hora(salida), pausa)
+            for entrada, salida, pausa, _ in (fila.turnos or [])[:TOP_N]]
+
+
+def actualizar_sugerencias(usuario_id, nuevo=None, anterior=None):
+    """
+    Mantenimiento incremental tras crear, rectificar o eliminar un fichaje.
+    No hace commit: se confirma junto con el fichaje.
+
+    Args:
+        nuevo: Fichaje cuyo horario se suma (creación o nueva versión).
+        anterior: Fichaje cuyo horario se resta (versión rectificada o eliminada).
+    """
+    cambios = [(f, signo) for f, signo in ((nuevo, 1), (anterior, -1))
+               if f is not None and f.hora_salida is not None]
+    if not cambios:
+        return
+
+    fila = db.session.get(SugerenciaFichaje, usuario_id, with_for_update=True)
+    if fila is None:
+        # Sin histórico calculado: lo hará el primer acceso o el job nocturno
+        return
+
+    fila.referencia, fila.turnos = _aplicar(fila.referencia, fila.turnos, cambios)
+
+
+def sumar_tramos_sugerencias(tramos):
+    """
+    Versión en bloque de actualizar_sugerencias para tramos cerrados nuevos
+    (ingesta de terminales): un SELECT ... FOR UPDATE y un UPDATE masivo,
+    sea cual sea el número de usuarios. No hace commit.
+
+    Args:
+        tramos: iterable de (usuario_id, fichaje) con el horario a sumar.
+    """
+    por_usuario = defaultdict(list)
+    for usuario_id, f in tramos:
+        if f.hora_salida is not None:
+            por_usuario[usuario_id].append((f, 1))
+    if not por_usuario:
+        return
+
+    filas = db.session.execute(
+        select(SugerenciaFichaje.usuario_id, SugerenciaFichaje.referencia, SugerenciaFichaje.turnos)
+        .where(SugerenciaFichaje.usuario_id.in_(por_usuario))
+        .with_for_update()
+    ).all()
+    # Los que no tienen fila se calcularán en el primer acceso o en el job nocturno
+    actualizadas = []
+    for usuario_id, referencia, turnos in filas:
+        referencia, turnos = _aplicar(referencia, turnos, por_usuario[usuario_id])
+        actualizadas.append({'usuario_id': usuario_id, 'referencia': referencia, 'turnos': turnos})
+    if actualizadas:
+        db.session.execute(update(SugerenciaFichaje), actualizadas)
+
+
+def _aplicar(referencia, turnos, cambios):
+    """Suma/resta los horarios de 'cambios' [(fichaje, ±1)] a los turnos guardados."""
+    nueva_referencia = max([referencia] + [f.fecha for f, _ in cambios])
+    decaimiento = _peso(referencia, nueva_referencia)
+    pesos = {tuple(t[:3]): t[3] * decaimiento for t in turnos or []}
+
+    for f, signo in cambios:
+        clave = _clave(f.hora_entrada, f.hora_salida, f.pausa)
+        pesos[clave] = max(0.0, pesos.get(clave, 0.0) + signo * _peso(f.fecha, nueva_referencia))
+
+    return nueva_referencia, _podar(pesos)
+
+
+def _pesos_por_usuario(filas):
+    """
+    De filas (usuario_id, fecha, entrada, salida, pausa) ordenadas por
+    usuario y fecha descendente, produce (usuario_id, referencia, pesos) de
+    cada usuario en cuanto se acaban sus filas: en memoria solo los turnos
+    de un usuario.
+    """
+    for usuario_id, grupo in groupby(filas, key=itemgetter(0)):
+        pesos = defaultdict(float)
+        referencia = None
+        for _, fecha, entrada, salida, pausa in grupo:
+            if referencia is None:
+                # La primera fila es la más reciente: referencia del usuario
+                referencia = fecha
+            pesos[_clave(entrada, salida, pausa)] += _peso(fecha, referencia)
+        yield usuario_id, referencia, pesos
+
+
+def _guardar(filas, sobrescribir):
+    """
+    Upsert por clave primaria: una fila creada entretanto por otro camino
+    (primer acceso, job nocturno) no rompe con un error de clave duplicada.
+    """
+    if not filas:
+        return
+    tabla = SugerenciaFichaje.__table__
+    sentencia = insert_con_conflicto(db.session, tabla)
+    if sobrescribir:
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[tabla.c.usuario_id],
+            set_={'referencia': sentencia.excluded.referencia, 'turnos': sentencia.excluded.turnos})
+    else:
+        sentencia = sentencia.on_conflict_do_nothing(index_elements=[tabla.c.usuario_id])
+    db.session.execute(sentencia, filas)
+
+
+def recalcular_sugerencias(usuario_ids=None, lote=5000, sobrescribir=True):
+    """
+    Recálculo completo desde el histórico (job nocturno / CLI), en streaming.
+    Corrige cualquier deriva del incremental (fichajes del reloj o de
+    terminales, cambios hechos fuera de la web...). No hace commit.
+
+    Los fichajes se leen ordenados por usuario: los pesos de cada uno se
+    calculan al acabar sus filas y se escriben en bloques de 'lote'
+    usuarios, así que la memoria no depende del tamaño de 'fichajes'.
+
+    Args:
+        sobrescribir: si es False, no toca las filas que ya existan (relleno
+            perezoso del primer acceso).
+
+    Returns:
+        int: usuarios recalculados.
+    """
+    query = db.session.query(
+        Fichaje.usuario_id, Fichaje.fecha, Fichaje.hora_entrada, Fichaje.hora_salida, Fichaje.pausa
+    ).filter(
+        Fichaje.es_actual == True,
+        Fichaje.tipo_accion != 'eliminacion',
+        Fichaje.hora_salida.isnot(None)
+    )
+    if usuario_ids is not None:
+        query = query.filter(Fichaje.usuario_id.in_(usuario_ids))
+    query = query.order_by(Fichaje.usuario_id, Fichaje.fecha.desc())
+
+    if usuario_ids is None:
+        existentes = set(db.session.scalars(select(SugerenciaFichaje.usuario_id)))
+
+    total = 0
+    con_historico = set()
+    filas = []
+    for usuario_id, referencia, pesos in _pesos_por_usuario(query.yield_per(lote)):
+        con_historico.add(usuario_id)
+        filas.append({'usuario_id': usuario_id, 'referencia': referencia, 'turnos': _podar(pesos)})
+        if len(filas) >= lote:
+            _guardar(filas, sobrescribir)
+            total += len(filas)
+            filas = []
+
+    # Usuarios sin ningún fichaje cerrado: fila vacía (así no se recalcula en cada acceso)
+    sin_historico = (set(usuario_ids) if usuario_ids is not None else existentes) - con_historico
+    filas.extend({'usuario_id': uid, 'referencia': date.today(), 'turnos': []} for uid in sin_historico)
+    _guardar(filas, sobrescribir)
+
+    return total + len(filas)
@@ -1,6 +1,8 @@
 from datetime import datetime, time, timedelta
 from src import db
-from src.models import Fichaje
+from src.models import Fichaje, IdempotenciaFichaje
+from src.database import aplicar_rol_transaccion
+from src.clock_events import publicar_estado, estado_reloj
 
 def cerrar_fichajes_abiertos(app):
     """
@@ -8,6 +10,9 @@ def cerrar_fichajes_abiertos(app):
     Los cierra automáticamente marcándolos como incidencia.
     """
     with app.app_context():
+        # Límites de la tarea programada (comparte el pool del proceso web)
+        aplicar_rol_transaccion(db.session, 'scheduler')
+
         # Definir "hoy" y "ayer"
         ahora = datetime.now()
         hoy = ahora.date()
@@ -35,6 +40,9 @@ def cerrar_fichajes_abiertos(app):
             
             # 3. Opcional: Podríamos poner pausa=0 para no complicar cálculos
             
+            # 4. Avisar a las pestañas del reloj que sigan abiertas
+            publicar_estado(f.usuario_id, estado_reloj(), f.fecha)
+
             count += 1
             print(f"🔄 [CRON] Fichaje cerrado automáticamente para usuario {f.usuario_id} (Fecha: {f.fecha})")
 
@@ -42,4 +50,63 @@ def cerrar_fichajes_abiertos(app):
             db.session.commit()
             print(f"✅ [CRON] Se han cerrado {count} fichajes olvidados.")
         else:
-            print("💤 [CRON] No se encontraron fichajes olvidados para cerrar.")
\ No newline at end of file
+            print("💤 [CRON] No se encontraron fichajes olvidados para cerrar.")
+
+
+def purgar_claves_idempotencia(app, horas=24):
+    """
+    Elimina las claves Idempotency-Key del reloj con más de 'horas' de antigüedad.
+    Un cliente solo reintenta durante segundos; conservarlas un día es holgado.
+    """
+    with app.app_context():
+        limite = datetime.utcnow() - timedelta(hours=horas)
+        borradas = IdempotenciaFichaje.query.filter(
+            IdempotenciaFichaje.fecha_creacion < limite
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        print(f"🧹 [CRON] Claves de idempotencia purgadas: {borradas}")
+
+
+def recalcular_sugerencias_fichaje(app):
+    """Recalcula las sugerencias de horario de todos los usuarios (ver src/suggestions.py)."""
+    from src.suggestions import recalcular_sugerencias
+
+    with app.app_context():
+        aplicar_rol_transaccion(db.session, 'scheduler')
+        total = recalcular_sugerencias()
+        db.session.commit()
+        print(f"💡 [CRON] Sugerencias de horario recalculadas para {total} usuarios")
+
+
+def preparar_particiones_fichajes(app):
+    """Crea las particiones de 'fichajes' de los próximos meses (solo si está particionada)."""
+    from src.archive import crear_particiones_fichajes
+
+    with app.app_context():
+        creadas = crear_particiones_fichajes()
+        if creadas:
+            print(f"🗂️ [CRON] Particiones de fichajes creadas: {', '.join(creadas)}")
+
+
+def reconciliar_saldos(app):
+    """
+    Comprobación nocturna de consistencia de saldos del año en curso (ver
+    src/balances.py). Solo informa, salvo con SALDOS_RECONCILIACION_AUTOFIX.
+    """
+    from src.balances import descuadres_saldos, corregir_descuadres
+
+    with app.app_context():
+        aplicar_rol_transaccion(db.session, 'scheduler')
+        anio = datetime.now().year
+        descuadres = descuadres_saldos(anio)
+        if not descuadres:
+            print(f"✅ [CRON] Saldos {anio} reconciliados: sin descuadres")
+            return
+
+        for d in descuadres:
+            print(f"⚠️ [CRON] Saldo {anio} descuadrado para usuario {d.usuario_id}: "
+                  f"guardado {d.dias_guardados}, calculado {d.dias_calculados}")
+        if app.config.get('SALDOS_RECONCILIACION_AUTOFIX'):
+            corregir_descuadres(anio, descuadres, actor_label='system:cron')
+            db.session.commit()
+            print(f"✅ [CRON] {len(descuadres)} saldos corregidos")
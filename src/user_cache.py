@@ -0,0 +1,103 @@
+"""
+Cache por proceso de usuarios autenticados (Flask-Login).
+
+'load_user' se ejecuta en cada petición autenticada y, además, muchas vistas
+acceden después a 'current_user.aprobadores' / 'current_user.usuarios_a_cargo'
+(lazy loads). Aquí materializamos el usuario con sus relaciones de aprobación
+UNA vez y lo guardamos desacoplado de cualquier sesión. En cada petición se
+re-adjunta con 'merge(load=False)', que no lanza ninguna query.
+
+Invalidación:
+    - TTL (USER_CACHE_TTL, segundos): acota la desincronización entre workers
+      y réplicas, que no comparten este cache.
+    - Sello de versión global: invalidar_cache_usuarios() descarta todas las
+      entradas del proceso de golpe.
+    - invalidar_cache_usuario(*ids): descarta solo los usuarios indicados.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy.orm import Session, selectinload, joinedload
+from sqlalchemy.orm.util import identity_key
+
+from src.models import db, Usuario, Aprobador
+
+# Límite de entradas para no crecer sin control en procesos de larga vida
+MAX_ENTRADAS = 5000
+
+_cache = {}  # user_id -> (expira_en, version, usuario_desacoplado)
+_version = 0
+_lock = threading.Lock()
+
+
+def _cargar_usuario_desacoplado(user_id):
+    """
+    Carga el usuario con sus relaciones de aprobación en una sesión propia
+    y de vida corta, y lo devuelve desacoplado (detached) con todo cargado.
+    """
+    with Session(db.engine, expire_on_commit=False) as sesion:
+        usuario = sesion.get(
+            Usuario,
+            user_id,
+            options=[
+                selectinload(Usuario.aprobadores).joinedload(Aprobador.aprobador),
+                selectinload(Usuario.usuarios_a_cargo).joinedload(Aprobador.usuario),
+            ],
+        )
+        # Al cerrar la sesión los objetos quedan desacoplados con su estado cargado
+    return usuario
+
+
+def obtener_usuario(user_id):
+    """
+    Devuelve el Usuario para Flask-Login, adjunto a la sesión actual.
+    En el caso habitual (cache caliente) no hace ninguna query.
+    """
+    ttl = current_app.config.get('USER_CACHE_TTL', 60)
+    if ttl <= 0:
+        return db.session.get(Usuario, user_id)
+
+    # Si la sesión ya tiene este usuario, es la vista más actual: no la pisamos
+    existente = db.session.identity_map.get(identity_key(Usuario, user_id))
+    if existente is not None:
+        return existente
+
+    ahora = time.monotonic()
+    entrada = _cache.get(user_id)
+    if entrada is None or entrada[0] < ahora or entrada[1] != _version:
+        version = _version
+        usuario = _cargar_usuario_desacoplado(user_id)
+        if usuario is None:
+            _cache.pop(user_id, None)
+            return None
+        with _lock:
+            if len(_cache) >= MAX_ENTRADAS:
+                _cache.clear()
+            _cache[user_id] = (ahora + ttl, version, usuario)
+    else:
+        usuario = entrada[2]
+
+    return db.session.merge(usuario, load=False)
+
+
+def invalidar_cache_usuario(*user_ids):
+    """
+    Descarta del cache los usuarios indicados.
+    Llamar cuando cambien sus datos o sus relaciones de aprobación.
+    """
+    with _lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def invalidar_cache_usuarios():
+    """
+    Incrementa el sello de versión: todas las entradas quedan obsoletas.
+    Útil cuando un cambio afecta a varios usuarios (p. ej. el email de un
+    aprobador, que está materializado en el cache de sus empleados).
+    """
+    global _version
+    with _lock:
+        _version += 1
+        _cache.clear()
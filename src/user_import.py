@@ -0,0 +1,107 @@
+"""
+Importación masiva de usuarios desde CSV ('flask import-users').
+
+    - Los emails existentes se leen de una vez al empezar (en vez de una
+      query por fila).
+    - El CSV se lee en streaming y se procesa por lotes de filas.
+    - Los hashes de contraseña (KDF lento a propósito) se calculan en un
+      pool de procesos: es el paso que domina el tiempo de la importación.
+    - Cada lote inserta usuarios con INSERT ... RETURNING id y después sus
+      saldos y movimientos de apertura, en bloque, y se confirma antes de
+      pasar al siguiente.
+
+Las contraseñas generadas se devuelven al llamante para escribirlas en un
+fichero de credenciales, nunca por la salida estándar.
+"""
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+
+from src.models import db, Usuario, SaldoVacaciones, MovimientoSaldo
+from src.user_search import invalidar_indice_usuarios
+
+# Filas del CSV por transacción
+LOTE_POR_DEFECTO = 500
+# Valores de los usuarios importados (los mismos que creaba el import fila a fila)
+ROL_IMPORTADO = 'usuario'
+DIAS_VACACIONES = 25
+
+
+def _lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def importar_usuarios(filas, lote=LOTE_POR_DEFECTO, procesos=None):
+    """
+    Crea los usuarios de 'filas' (dicts con 'nombre' y 'email') que no
+    existan todavía, con su saldo del año en curso.
+
+    Args:
+        procesos: tamaño del pool de hash (por defecto, uno por CPU); 1
+            calcula los hashes en este proceso.
+
+    Yields:
+        tuple: por lote confirmado, (creados, saltados), donde creados es una
+        lista de (nombre, email, contraseña) y saltados una de emails.
+    """
+    anio_actual = datetime.now().year
+    vistos = set(db.session.scalars(select(Usuario.email)))
+
+    procesos = procesos or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=procesos) if procesos > 1 else None
+    try:
+        for filas_lote in _lotes(filas, lote):
+            nuevos, saltados = [], []
+            for fila in filas_lote:
+                email = (fila.get('email') or '').strip()
+                if not email:
+                    continue
+                # Ya existe en la base de datos o repetido en el propio CSV
+                if email in vistos:
+                    saltados.append(email)
+                    continue
+                vistos.add(email)
+                nuevos.append(((fila.get('nombre') or '').strip(), email, secrets.token_urlsafe(8)))
+
+            if nuevos:
+                contrasenas = [c for _, _, c in nuevos]
+                if pool is not None:
+                    hashes = list(pool.map(generate_password_hash, contrasenas,
+                                           chunksize=max(len(contrasenas) // (procesos * 4), 1)))
+                else:
+                    hashes = [generate_password_hash(c) for c in contrasenas]
+
+                ids = db.session.execute(
+                    insert(Usuario).returning(Usuario.id, sort_by_parameter_order=True),
+                    [{'nombre': nombre, 'email': email, 'password': hash_, 'rol': ROL_IMPORTADO,
+                      'dias_vacaciones': DIAS_VACACIONES}
+                     for (nombre, email, _), hash_ in zip(nuevos, hashes)]
+                ).scalars().all()
+                db.session.execute(insert(SaldoVacaciones), [
+                    {'usuario_id': usuario_id, 'anio': anio_actual, 'dias_totales': DIAS_VACACIONES,
+                     'dias_disfrutados': 0, 'dias_carryover': 0}
+                    for usuario_id in ids
+                ])
+                db.session.execute(insert(MovimientoSaldo), [
+                    {'usuario_id': usuario_id, 'anio': anio_actual, 'tipo': 'apertura',
+                     'delta_totales': DIAS_VACACIONES, 'delta_disfrutados': 0}
+                    for usuario_id in ids
+                ])
+                db.session.commit()
+                # El INSERT masivo no pasa por el flush que invalida el buscador
+                invalidar_indice_usuarios()
+
+            yield nuevos, saltados
+    finally:
+        if pool is not None:
+            pool.shutdown()
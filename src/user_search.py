@@ -0,0 +1,200 @@
+"""
+Búsqueda de usuarios para el typeahead de administración.
+
+Coincidencia por subcadena, insensible a mayúsculas y acentos ("jose"
+encuentra "José", "nunez" encuentra "Núñez"), con varios términos (todos
+deben aparecer) y resultados ordenados por relevancia:
+
+    0. el nombre empieza por la búsqueda
+    1. alguna palabra del nombre/email empieza por cada término
+    2. el resto de coincidencias
+    (a igualdad, por nombre)
+
+Dos motores:
+    - PostgreSQL: índice GIN pg_trgm sobre tempus_unaccent(lower(nombre || ' ' || email))
+      (migración f6c2d8e1a3b7). El LIKE '%término%' usa el índice en vez de
+      recorrer la tabla.
+    - Resto (SQLite en desarrollo y tests): índice de trigramas en memoria por
+      proceso. Se invalida tras cualquier commit que cree, modifique o borre
+      un Usuario y, como red para cambios de otros workers, por TTL
+      (USER_SEARCH_INDEX_TTL).
+"""
+import heapq
+import threading
+import time
+import unicodedata
+
+from flask import current_app
+from sqlalchemy import case, event, func, literal, text
+
+from src.models import db, Usuario
+from src.database import SesionEnrutada
+
+# Expresión indexada en PostgreSQL (debe coincidir con la de la migración)
+_EXPRESION_PG = "tempus_unaccent(lower(usuarios.nombre || ' ' || usuarios.email))"
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni espacios repetidos."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _rango(nombre_normalizado, palabras, consulta, terminos):
+    if nombre_normalizado.startswith(consulta):
+        return 0
+    if all(any(p.startswith(t) for p in palabras) for t in terminos):
+        return 1
+    return 2
+
+
+# ==========================================
+# ÍNDICE EN MEMORIA (SQLite / fallback)
+# ==========================================
+
+class _IndiceMemoria:
+    def __init__(self, filas):
+        self.usuarios = {}    # id -> (nombre, email, activo, rol, texto, nombre_norm, palabras)
+        self.trigramas = {}   # trigrama -> set(ids)
+        self.prefijos = {}    # prefijo de 1-2 letras de una palabra -> set(ids)
+        for id_, nombre, email, activo, rol in filas:
+            nombre_norm = normalizar(nombre)
+            texto = f'{nombre_norm} {normalizar(email)}'
+            palabras = texto.replace('@', ' ').replace('.', ' ').split()
+            self.usuarios[id_] = (nombre, email, activo, rol, texto, nombre_norm, palabras)
+            for trigrama in _trigramas(texto):
+                self.trigramas.setdefault(trigrama, set()).add(id_)
+            for palabra in palabras:
+                for n in (1, 2):
+                    self.prefijos.setdefault(palabra[:n], set()).add(id_)
+
+    def _candidatos(self, termino):
+        if len(termino) >= 3:
+            conjuntos = [self.trigramas.get(t, set()) for t in _trigramas(termino)]
+            return set.intersection(*conjuntos) if conjuntos else set()
+        # Términos cortos: prefijo de palabra, o recorrido completo (poco frecuente)
+        por_prefijo = self.prefijos.get(termino)
+        return set(por_prefijo) if por_prefijo else set(self.usuarios)
+
+    def buscar(self, consulta, terminos, solo_activos, roles, cuantos):
+        candidatos = None
+        for termino in sorted(terminos, key=len, reverse=True):
+            conjunto = self._candidatos(termino)
+            candidatos = conjunto if candidatos is None else candidatos & conjunto
+            if not candidatos:
+                return []
+
+        resultados = []
+        for id_ in candidatos:
+            nombre, email, activo, rol, texto, nombre_norm, palabras = self.usuarios[id_]
+            if (solo_activos and not activo) or (roles and rol not in roles):
+                continue
+            # Los trigramas solo filtran: confirmamos la subcadena
+            if all(t in texto for t in terminos):
+                resultados.append((_rango(nombre_norm, palabras, consulta, terminos),
+                                   nombre_norm, id_, nombre, email))
+        # Solo hace falta ordenar la página pedida, no todas las coincidencias
+        mejores = heapq.nsmallest(cuantos, resultados)
+        return [(id_, nombre, email) for _, _, id_, nombre, email in mejores]
+
+
+_indice = None  # (expira_en, version, _IndiceMemoria)
+_version = 0
+_lock = threading.Lock()
+
+
+def invalidar_indice_usuarios():
+    """Descarta el índice en memoria de este proceso; se reconstruye en la próxima búsqueda."""
+    global _version, _indice
+    with _lock:
+        _version += 1
+        _indice = None
+
+
+def _indice_memoria():
+    global _indice
+    ahora = time.monotonic()
+    entrada = _indice
+    if entrada is not None and entrada[0] >= ahora and entrada[1] == _version:
+        return entrada[2]
+
+    version = _version
+    filas = db.session.query(Usuario.id, Usuario.nombre, Usuario.email, Usuario.activo, Usuario.rol).all()
+    indice = _IndiceMemoria(filas)
+    ttl = current_app.config.get('USER_SEARCH_INDEX_TTL', 300)
+    with _lock:
+        # Si alguien invalidó mientras construíamos, no guardamos un índice viejo
+        if version == _version:
+            _indice = (ahora + ttl, version, indice)
+    return indice
+
+
+@event.listens_for(SesionEnrutada, 'after_flush')
+def _marcar_cambios_usuarios(sesion, contexto):
+    if any(isinstance(obj, Usuario) for obj in (*sesion.new, *sesion.dirty, *sesion.deleted)):
+        sesion.info['usuarios_modificados'] = True
+
+
+@event.listens_for(SesionEnrutada, 'after_commit')
+def _tras_commit(sesion):
+    if sesion.info.pop('usuarios_modificados', False):
+        invalidar_indice_usuarios()
+
+
+@event.listens_for(SesionEnrutada, 'after_rollback')
+def _tras_rollback(sesion):
+    sesion.info.pop('usuarios_modificados', None)
+
+
+# ==========================================
+# BÚSQUEDA
+# ==========================================
+
+def _buscar_postgres(consulta, terminos, limite, desplazamiento, solo_activos, roles):
+    expresion = text(_EXPRESION_PG)
+    nombre_norm = func.tempus_unaccent(func.lower(Usuario.nombre))
+    query = db.session.query(Usuario.id, Usuario.nombre, Usuario.email)
+    if solo_activos:
+        query = query.filter(Usuario.activo == True)
+    if roles:
+        query = query.filter(Usuario.rol.in_(roles))
+    for termino in terminos:
+        query = query.filter(expresion.op('LIKE')(literal(f'%{termino}%')))
+
+    rango = case(
+        (nombre_norm.startswith(consulta), 0),
+        else_=1,
+    )
+    return query.order_by(
+        rango,
+        func.word_similarity(consulta, expresion).desc(),
+        Usuario.nombre,
+    ).offset(desplazamiento).limit(limite).all()
+
+
+def buscar_usuarios(q, limite=20, desplazamiento=0, solo_activos=True, roles=None):
+    """
+    Usuarios que coinciden con 'q', ordenados por relevancia.
+    'roles' restringe a esos roles (p. ej. ['aprobador', 'admin']).
+
+    Returns:
+        list: tuplas (id, nombre, email).
+    """
+    # Los comodines de LIKE no deben colarse desde la búsqueda
+    terminos = normalizar(q).replace('%', ' ').replace('_', ' ').split()
+    if not terminos:
+        return []
+    consulta = ' '.join(terminos)
+
+    if db.engine.dialect.name == 'postgresql':
+        return [tuple(fila) for fila in
+                _buscar_postgres(consulta, terminos, limite, desplazamiento, solo_activos, roles)]
+
+    resultados = _indice_memoria().buscar(consulta, terminos, solo_activos, roles,
+                                          desplazamiento + limite)
+    return resultados[desplazamiento:]
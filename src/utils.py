@@ -76,6 +76,7 @@ def recalcular_vacaciones_por_festivo(fecha_festivo):
         int: Número de solicitudes de vacaciones afectadas
     """
     from src import db
+    from src.balances import registrar_movimiento
     
     # Invalidar cache ANTES de recalcular (para que calcular_dias_habiles use el nuevo estado)
     invalidar_cache_festivos()
@@ -105,18 +106,11 @@ def recalcular_vacaciones_por_festivo(fecha_festivo):
         # Actualizar la solicitud
         vac.dias_solicitados = dias_nuevos
         
-        # Actualizar el saldo del año en que se solicitó
-        anio = vac.fecha_solicitud.year
-        saldo = SaldoVacaciones.query.filter_by(
-            usuario_id=vac.usuario_id,
-            anio=anio
-        ).first()
-        
-        if saldo:
-            # Ajustar dias_disfrutados
-            # Si dias_diff > 0: se añadió un día laborable (festivo eliminado) → consumir más
-            # Si dias_diff < 0: se quitó un día laborable (festivo añadido) → devolver días
-            saldo.dias_disfrutados += dias_diff
+        # Ajustar dias_disfrutados del saldo del año en que se solicitó (si existe)
+        # Si dias_diff > 0: se añadió un día laborable (festivo eliminado) → consumir más
+        # Si dias_diff < 0: se quitó un día laborable (festivo añadido) → devolver días
+        registrar_movimiento(vac.usuario_id, vac.fecha_solicitud.year, 'festivo',
+                             delta_disfrutados=dias_diff, solicitud_id=vac.id)
         
         count_actualizadas += 1
     
@@ -334,6 +328,7 @@ def aplicar_cambio_saldo(usuario, delta, motivo, anio=None, actor=None, origen='
         ValueError: si motivo vacío, delta == 0 o el resultado quedaría < 0.
     """
     from src import db
+    from src.balances import registrar_movimiento
 
     if not motivo or not motivo.strip():
         raise ValueError("Se requiere una justificación (motivo).")
@@ -343,18 +338,7 @@ def aplicar_cambio_saldo(usuario, delta, motivo, anio=None, actor=None, origen='
         anio = datetime.now().year
 
     saldo = SaldoVacaciones.query.filter_by(usuario_id=usuario.id, anio=anio).first()
-    if saldo is None:
-        saldo = SaldoVacaciones(
-            usuario_id=usuario.id,
-            anio=anio,
-            dias_totales=usuario.dias_vacaciones,
-            dias_disfrutados=0,
-            dias_carryover=0,
-        )
-        db.session.add(saldo)
-        db.session.flush()
-
-    dias_anteriores = saldo.dias_totales
+    dias_anteriores = saldo.dias_totales if saldo else usuario.dias_vacaciones
     dias_nuevos = dias_anteriores + delta
 
     if dias_nuevos < 0:
@@ -363,7 +347,9 @@ def aplicar_cambio_saldo(usuario, delta, motivo, anio=None, actor=None, origen='
             f"(actual: {dias_anteriores}, delta: {delta:+d})."
         )
 
-    saldo.dias_totales = dias_nuevos
+    # Suma atómica sobre el total (abre el saldo con la base contractual si no existe)
+    registrar_movimiento(usuario.id, anio, 'ajuste', delta_totales=delta, motivo=motivo.strip()[:255],
+                         dias_base=usuario.dias_vacaciones)
 
     if actor is not None:
         actor_id = actor.id
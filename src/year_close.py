@@ -0,0 +1,183 @@
+"""
+Cierre de año de saldos de vacaciones ('flask cerrar-anio').
+
+En lugar de dos queries por usuario y un único commit gigante al final:
+
+    - Los usuarios activos se recorren por lotes de ids (keyset: id > último).
+    - Cada lote es un INSERT ... SELECT que calcula el traspaso en SQL
+      (sobrante recortado a max_carryover; la deuda pasa entera) y, con
+      --force, ON CONFLICT (usuario_id, anio) DO UPDATE sobre los saldos ya
+      existentes. La auditoría (CambioSaldo) y los movimientos del libro
+      (apertura, traspaso y, con --force, reversión del saldo anterior) se
+      insertan igual, en bloque.
+    - Cada lote se confirma junto con su checkpoint en 'cierres_anio': si el
+      proceso se interrumpe, la siguiente ejecución continúa tras el último
+      usuario confirmado en vez de empezar de nuevo.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, case, exists, func, literal, select, union_all
+from sqlalchemy.orm import aliased
+
+from src.models import db, Usuario, SaldoVacaciones, CambioSaldo, CierreAnio, MovimientoSaldo
+from src.database import insert_con_conflicto
+
+# Usuarios por transacción
+LOTE_POR_DEFECTO = 1000
+
+
+def _columnas_traspaso(anio_origen, max_carryover):
+    """
+    FROM usuarios LEFT JOIN saldo del año origen, con las expresiones de
+    base, traspaso y total del año nuevo. Sin saldo de origen: traspaso 0.
+    """
+    origen = aliased(SaldoVacaciones)
+    sobrante = func.coalesce(origen.dias_totales - origen.dias_disfrutados, 0)
+    traspaso = case((sobrante > max_carryover, max_carryover), else_=sobrante)
+    base = func.coalesce(Usuario.dias_vacaciones, 25)
+    desde = Usuario.__table__.outerjoin(
+        origen, and_(origen.usuario_id == Usuario.id, origen.anio == anio_origen))
+    return desde, origen, sobrante, traspaso, base
+
+
+def _saldo_nuevo_existe(anio_nuevo):
+    return exists().where(SaldoVacaciones.usuario_id == Usuario.id, SaldoVacaciones.anio == anio_nuevo)
+
+
+def estadisticas_cierre(anio_origen, max_carryover):
+    """
+    Cifras agregadas del cierre en una sola query (para el resumen y
+    --dry-run), sin escribir nada.
+    """
+    desde, origen, sobrante, traspaso, _ = _columnas_traspaso(anio_origen, max_carryover)
+    fila = db.session.execute(select(
+        func.count(),
+        func.count(origen.id),
+        func.count().filter(sobrante > 0),
+        func.coalesce(func.sum(traspaso).filter(sobrante > 0), 0),
+        func.count().filter(sobrante > max_carryover),
+        func.count().filter(sobrante < 0),
+        func.coalesce(func.sum(sobrante).filter(sobrante < 0), 0),
+        func.count().filter(_saldo_nuevo_existe(anio_origen + 1)),
+    ).select_from(desde).where(Usuario.activo == True)).one()
+
+    return dict(zip(('usuarios', 'con_saldo', 'con_sobrante', 'dias_traspasados',
+                     'recortados', 'con_deuda', 'dias_deuda', 'ya_cerrados'), fila))
+
+
+def _procesar_lote(usuario_ids, anio_origen, max_carryover, force):
+    anio_nuevo = anio_origen + 1
+    desde, _, _, traspaso, base = _columnas_traspaso(anio_origen, max_carryover)
+    del_lote = Usuario.id.in_(usuario_ids)
+    ya_existe = _saldo_nuevo_existe(anio_nuevo)
+
+    existentes = db.session.scalar(select(func.count()).select_from(SaldoVacaciones).where(
+        SaldoVacaciones.anio == anio_nuevo, SaldoVacaciones.usuario_id.in_(usuario_ids)))
+
+    # 1. Auditoría del traspaso, solo de los saldos que se van a escribir
+    #    (antes del upsert: después ya no se distinguen los que existían)
+    auditables = select(
+        Usuario.id, literal(None), literal('system:cli'), literal(anio_nuevo), base,
+        base + traspaso, traspaso, literal(f'Ajuste cierre {anio_origen}'), literal('cli'),
+        literal(datetime.utcnow())
+    ).select_from(desde).where(del_lote, traspaso != 0)
+    if not force:
+        auditables = auditables.where(~ya_existe)
+    db.session.execute(CambioSaldo.__table__.insert().from_select(
+        ['usuario_id', 'actor_id', 'actor_label', 'anio', 'dias_anteriores', 'dias_nuevos',
+         'delta', 'motivo', 'origen', 'fecha'], auditables))
+
+    # 2. Libro de movimientos: con --force se revierte el saldo que hubiera;
+    #    después, apertura con la base y el traspaso por separado
+    ahora = literal(datetime.utcnow())
+    motivo = literal(f'Cierre {anio_origen}')
+    columnas_movimiento = ['usuario_id', 'anio', 'tipo', 'delta_totales', 'delta_disfrutados', 'motivo', 'fecha']
+    movimientos = MovimientoSaldo.__table__
+    if force and existentes:
+        db.session.execute(movimientos.insert().from_select(columnas_movimiento, select(
+            SaldoVacaciones.usuario_id, SaldoVacaciones.anio, literal('reversion'),
+            -func.coalesce(SaldoVacaciones.dias_totales, 0), -func.coalesce(SaldoVacaciones.dias_disfrutados, 0),
+            motivo, ahora
+        ).where(SaldoVacaciones.anio == anio_nuevo, SaldoVacaciones.usuario_id.in_(usuario_ids))))
+    aperturas = select(Usuario.id, literal(anio_nuevo), literal('apertura'), base, literal(0), motivo, ahora
+                       ).select_from(desde).where(del_lote)
+    traspasos = select(Usuario.id, literal(anio_nuevo), literal('carryover'), traspaso, literal(0), motivo, ahora
+                       ).select_from(desde).where(del_lote, traspaso != 0)
+    if not force:
+        aperturas, traspasos = aperturas.where(~ya_existe), traspasos.where(~ya_existe)
+    db.session.execute(movimientos.insert().from_select(columnas_movimiento, union_all(aperturas, traspasos)))
+
+    # 3. Saldos del año nuevo
+    insercion = insert_con_conflicto(db.session, SaldoVacaciones.__table__).from_select(
+        ['usuario_id', 'anio', 'dias_totales', 'dias_disfrutados', 'dias_carryover'],
+        select(Usuario.id, literal(anio_nuevo), base + traspaso, literal(0), traspaso)
+        .select_from(desde).where(del_lote)
+    )
+    if force:
+        insercion = insercion.on_conflict_do_update(
+            index_elements=['usuario_id', 'anio'],
+            set_={'dias_totales': insercion.excluded.dias_totales,
+                  'dias_carryover': insercion.excluded.dias_carryover,
+                  'dias_disfrutados': 0}  # Reset
+        )
+    else:
+        insercion = insercion.on_conflict_do_nothing(index_elements=['usuario_id', 'anio'])
+    db.session.execute(insercion)
+
+    creados = len(usuario_ids) - existentes
+    return creados, (existentes if force else 0), (0 if force else existentes)
+
+
+def cerrar_saldos(anio_origen, max_carryover, force=False, lote=LOTE_POR_DEFECTO, al_confirmar_lote=None):
+    """
+    Genera (o con force, rehace) los saldos de anio_origen + 1 de todos los
+    usuarios activos, por lotes y con checkpoint.
+
+    Un cierre sin terminar del mismo año y con el mismo max_carryover se
+    reanuda; en cualquier otro caso se empieza desde el primer usuario.
+
+    Args:
+        al_confirmar_lote: callable(checkpoint, usuarios_del_lote) llamado
+            tras cada commit (progreso en el CLI).
+
+    Returns:
+        tuple: (checkpoint CierreAnio ya completado, id desde el que se
+        reanudó o None si empezó de cero)
+    """
+    checkpoint = db.session.get(CierreAnio, anio_origen)
+    reanudado_desde = None
+    if (checkpoint is not None and checkpoint.fecha_fin is None
+            and checkpoint.max_carryover == max_carryover and checkpoint.ultimo_usuario_id):
+        reanudado_desde = checkpoint.ultimo_usuario_id
+    else:
+        if checkpoint is None:
+            checkpoint = CierreAnio(anio_origen=anio_origen)
+            db.session.add(checkpoint)
+        checkpoint.max_carryover = max_carryover
+        checkpoint.ultimo_usuario_id = 0
+        checkpoint.creados = checkpoint.actualizados = checkpoint.saltados = 0
+        checkpoint.fecha_inicio = datetime.utcnow()
+        checkpoint.fecha_fin = None
+        db.session.commit()
+
+    while True:
+        usuario_ids = db.session.scalars(
+            select(Usuario.id).where(Usuario.activo == True, Usuario.id > checkpoint.ultimo_usuario_id)
+            .order_by(Usuario.id).limit(lote)
+        ).all()
+        if not usuario_ids:
+            break
+
+        creados, actualizados, saltados = _procesar_lote(usuario_ids, anio_origen, max_carryover, force)
+        checkpoint.ultimo_usuario_id = usuario_ids[-1]
+        checkpoint.creados += creados
+        checkpoint.actualizados += actualizados
+        checkpoint.saltados += saltados
+        db.session.commit()
+
+        if al_confirmar_lote:
+            al_confirmar_lote(checkpoint, len(usuario_ids))
+
+    checkpoint.fecha_fin = datetime.utcnow()
+    db.session.commit()
+    return checkpoint, reanudado_desde
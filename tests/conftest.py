@@ -1,6 +1,9 @@
 import pytest
 from src import app, db, limiter
 from src.models import Usuario, TipoAusencia, Aprobador, UserKnownIP
+from src.user_cache import invalidar_cache_usuarios
+from src.user_search import invalidar_indice_usuarios
+from src.pending_counters import invalidar_contadores_pendientes
 from werkzeug.security import generate_password_hash
 
 @pytest.fixture
@@ -20,6 +23,11 @@ def test_app():
     # Reset limiter storage to avoid rate limit carryover between tests
     limiter.reset()
 
+    # User ids are reused across tests (drop_all/create_all): start with an empty cache
+    invalidar_cache_usuarios()
+    invalidar_indice_usuarios()
+    invalidar_contadores_pendientes()
+
     # Contexto de la aplicación
     with app.app_context():
         db.create_all()
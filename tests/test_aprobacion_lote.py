@@ -0,0 +1,114 @@
+from datetime import date, datetime
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from src import db
+from src.models import Usuario, SaldoVacaciones, SolicitudVacaciones, SolicitudBaja
+
+
+@pytest.fixture
+def efectos(monkeypatch):
+    """Registra las llamadas agrupadas a Calendar y email en lugar de enviarlas."""
+    llamadas = {'calendar': [], 'emails': []}
+
+    def _sincronizar(crear=(), eliminar=()):
+        llamadas['calendar'].append((list(crear), list(eliminar)))
+        return {clave: f'evt-{solicitud.id}' for clave, solicitud, _ in crear}
+
+    def _emails(solicitudes):
+        llamadas['emails'].append([s.id for s in solicitudes])
+
+    monkeypatch.setattr('src.google_calendar.sincronizar_eventos_lote', _sincronizar)
+    monkeypatch.setattr('src.email_service.enviar_emails_respuesta', _emails)
+    return llamadas
+
+
+def _vacaciones(usuario, dias, **kwargs):
+    anio = datetime.utcnow().year
+    solicitud = SolicitudVacaciones(usuario_id=usuario.id, fecha_inicio=date(anio, 8, 1),
+                                    fecha_fin=date(anio, 8, dias), dias_solicitados=dias,
+                                    estado=kwargs.pop('estado', 'pendiente'),
+                                    fecha_solicitud=datetime.utcnow(), **kwargs)
+    db.session.add(solicitud)
+    db.session.flush()
+    return solicitud
+
+
+def test_lote_json_transaccion_unica(auth_approver_client, approver_user, employee_user,
+                                     absence_type, efectos):
+    ajeno = Usuario(nombre='Ajeno', email='ajeno@test.com', password=generate_password_hash('x'),
+                    rol='empleado')
+    db.session.add(ajeno)
+    db.session.flush()
+
+    v1 = _vacaciones(employee_user, 5)
+    v2 = _vacaciones(employee_user, 3)
+    de_otro = _vacaciones(ajeno, 2)
+    baja = SolicitudBaja(usuario_id=employee_user.id, tipo_ausencia_id=absence_type.id,
+                         fecha_inicio=date(2026, 3, 1), fecha_fin=date(2026, 3, 2),
+                         dias_solicitados=2, motivo='Médico', estado='pendiente')
+    db.session.add(baja)
+    db.session.commit()
+    ids = (v1.id, v2.id, de_otro.id, baja.id)
+
+    respuesta = auth_approver_client.post('/aprobaciones/lote', json={
+        'accion': 'aprobar', 'vacaciones': [ids[0], ids[1], ids[2], 9999], 'bajas': [ids[3]]
+    })
+    datos = respuesta.get_json()
+    assert datos['procesadas'] == 3 and datos['omitidas'] == 2
+
+    por_id = {(r['tipo'], r['id']): r for r in datos['resultados']}
+    assert por_id[('vacaciones', ids[0])]['estado'] == 'aprobada'
+    assert por_id[('baja', ids[3])]['ok']
+    assert 'permiso' in por_id[('vacaciones', ids[2])]['mensaje']
+    assert por_id[('vacaciones', 9999)]['mensaje'] == 'Solicitud no encontrada.'
+
+    # Un único saldo para el (usuario, año) con los dos descuentos
+    saldos = SaldoVacaciones.query.filter_by(usuario_id=employee_user.id).all()
+    assert len(saldos) == 1 and saldos[0].dias_disfrutados == 8
+    assert db.session.get(SolicitudVacaciones, ids[2]).estado == 'pendiente'
+
+    # Efectos secundarios: una sola llamada a Calendar y un solo envío de emails
+    assert len(efectos['calendar']) == 1 and len(efectos['calendar'][0][0]) == 3
+    assert efectos['emails'] == [[ids[0], ids[1], ids[3]]]
+    assert db.session.get(SolicitudVacaciones, ids[0]).google_event_id == f'evt-{ids[0]}'
+    assert db.session.get(SolicitudBaja, ids[3]).aprobador_id == approver_user.id
+
+
+def test_lote_modificacion_reintegra_y_no_repite(auth_approver_client, employee_user, efectos):
+    anio = datetime.utcnow().year
+    original = _vacaciones(employee_user, 5, estado='aprobada', google_event_id='viejo')
+    cambio = _vacaciones(employee_user, 3, grupo_id=original.grupo_id, version=2,
+                         tipo_accion='modificacion')
+    db.session.add(SaldoVacaciones(usuario_id=employee_user.id, anio=anio,
+                                   dias_totales=25, dias_disfrutados=5))
+    db.session.commit()
+    original_id, cambio_id = original.id, cambio.id
+
+    datos = auth_approver_client.post('/aprobaciones/lote', json={
+        'accion': 'aprobar', 'vacaciones': [cambio_id, original_id]
+    }).get_json()
+    assert [r['ok'] for r in datos['resultados']] == [True, False]
+    assert datos['resultados'][1]['mensaje'] == 'La solicitud ya está aprobada.'
+
+    assert db.session.get(SolicitudVacaciones, original_id).es_actual is False
+    assert SaldoVacaciones.query.filter_by(usuario_id=employee_user.id).one().dias_disfrutados == 3
+    assert efectos['calendar'][0][1] == ['viejo']
+
+
+def test_lote_formulario_rechaza(auth_approver_client, employee_user, efectos):
+    ids = [_vacaciones(employee_user, d).id for d in (2, 4)]
+    db.session.commit()
+
+    respuesta = auth_approver_client.post('/aprobaciones/lote', data={
+        'accion': 'rechazar', 'vacaciones': ids
+    }, follow_redirects=True)
+    assert '2 solicitudes rechazadas.' in respuesta.get_data(as_text=True)
+    assert {s.estado for s in SolicitudVacaciones.query} == {'rechazada'}
+    assert SaldoVacaciones.query.count() == 0
+    # Rechazar no crea eventos
+    assert efectos['calendar'][0] == ([], [])
+
+    respuesta = auth_approver_client.post('/aprobaciones/lote', json={'accion': 'borrar'})
+    assert respuesta.status_code == 400
@@ -0,0 +1,130 @@
+from datetime import date, datetime, time
+
+from src.archive import (archivar_fichajes, version_fichaje, versiones_archivadas_auditoria,
+                         _rangos_particion, _granularidad_particiones)
+from src.models import db, Fichaje, FichajeArchivado
+
+
+def _versiones(usuario_id, editor_id, fecha, entradas):
+    """Crea un grupo con una versión por hora de entrada; la última es la vigente."""
+    grupo_id = None
+    for numero, entrada in enumerate(entradas, start=1):
+        f = Fichaje(usuario_id=usuario_id, editor_id=editor_id, fecha=fecha,
+                    hora_entrada=entrada, hora_salida=time(17, 0), pausa=0, version=numero,
+                    es_actual=numero == len(entradas),
+                    tipo_accion='creacion' if numero == 1 else 'modificacion',
+                    motivo_rectificacion=None if numero == 1 else f'Cambio {numero}')
+        if grupo_id:
+            f.grupo_id = grupo_id
+        db.session.add(f)
+        db.session.flush()
+        grupo_id = f.grupo_id
+    db.session.commit()
+    return grupo_id
+
+
+def test_archiva_solo_versiones_sustituidas_antiguas(test_app, employee_user, admin_user):
+    antiguo = _versiones(employee_user.id, admin_user.id, date(2019, 3, 4),
+                         [time(8, 0), time(9, 0), time(10, 0)])
+    reciente = _versiones(employee_user.id, admin_user.id, date(2026, 3, 4),
+                          [time(8, 0), time(9, 0)])
+
+    assert archivar_fichajes(date(2022, 1, 1), dry_run=True) == (2, 1)
+    assert archivar_fichajes(date(2022, 1, 1), lote=1) == (2, 1)
+
+    # La versión vigente y el fichaje reciente siguen en caliente
+    assert [f.version for f in Fichaje.query.filter_by(grupo_id=antiguo)] == [3]
+    assert Fichaje.query.filter_by(grupo_id=reciente).count() == 2
+
+    archivo = db.session.get(FichajeArchivado, antiguo)
+    assert archivo.num_versiones == 2
+    assert archivo.fecha_max == date(2019, 3, 4)
+
+    # Lectura unificada: la v2 viene del archivo con los mismos atributos
+    v2 = version_fichaje(antiguo, 2)
+    assert v2.archivado and v2.hora_entrada == time(9, 0)
+    assert v2.editor.id == admin_user.id
+    assert version_fichaje(antiguo, 3).hora_entrada == time(10, 0)
+
+    # Una rectificación posterior que también caduca se añade al mismo grupo
+    vigente = Fichaje.query.filter_by(grupo_id=antiguo).one()
+    vigente.es_actual = False
+    db.session.add(Fichaje(grupo_id=antiguo, usuario_id=employee_user.id, editor_id=admin_user.id,
+                           fecha=date(2019, 3, 4), hora_entrada=time(11, 0),
+                           hora_salida=time(17, 0), version=4, tipo_accion='modificacion'))
+    db.session.commit()
+    assert archivar_fichajes(date(2022, 1, 1)) == (1, 1)
+    assert db.session.get(FichajeArchivado, antiguo).num_versiones == 3
+
+
+def test_auditoria_lee_versiones_archivadas(client, admin_user, employee_user):
+    client.post('/login', data={'email': admin_user.email, 'password': 'admin123'})
+    grupo_id = _versiones(employee_user.id, admin_user.id, date(2019, 5, 6),
+                          [time(8, 0), time(9, 30), time(10, 15)])
+    archivar_fichajes(date(2022, 1, 1))
+
+    hoy = date.today()
+    desde = datetime(hoy.year, hoy.month, hoy.day)
+    archivadas = versiones_archivadas_auditoria(desde)
+    assert [v.version for v in archivadas] == [1, 2]  # v1 creada por el admin
+    archivo = db.session.get(FichajeArchivado, grupo_id)
+    assert archivo.auditable_desde is not None
+
+    # Sin fecha de inicio la auditoría no toca el archivo
+    datos = client.get('/admin/auditoria').get_data(as_text=True)
+    assert 'Entrada: 08:00 → 09:30' not in datos
+    assert 'fichajes archivados' in datos
+
+    datos = client.get(f'/admin/auditoria?fecha_inicio={hoy.isoformat()}').get_data(as_text=True)
+    # Detalle de la v3 (en caliente) contra la v2 (archivada) y de la v2 contra la v1
+    assert 'Entrada: 09:30 → 10:15' in datos
+    assert 'Entrada: 08:00 → 09:30' in datos
+    assert 'Cambio 2' in datos
+
+    # Filtro por nombre del empleado
+    assert versiones_archivadas_auditoria(desde, usuario_nombre='nadie') == []
+    # Fuera del rango auditable no se descomprime ni devuelve nada
+    assert versiones_archivadas_auditoria(datetime(2000, 1, 1), datetime(2001, 1, 1)) == []
+
+
+def test_archivo_sin_versiones_auditables_no_entra_en_auditoria(test_app, employee_user):
+    # v1 creada por el propio empleado: sustituida, pero no auditable
+    grupo_id = _versiones(employee_user.id, employee_user.id, date(2019, 5, 6), [time(8, 0), time(9, 0)])
+    archivar_fichajes(date(2022, 1, 1))
+
+    archivo = db.session.get(FichajeArchivado, grupo_id)
+    assert archivo.creacion_desde is not None
+    assert archivo.auditable_desde is None and archivo.auditable_hasta is None
+    assert versiones_archivadas_auditoria(datetime(2000, 1, 1)) == []
+
+
+def test_cli_archivar_dry_run(runner, employee_user):
+    _versiones(employee_user.id, employee_user.id, date(2015, 1, 2), [time(8, 0), time(9, 0)])
+
+    result = runner.invoke(args=['archivar-fichajes', '--dry-run'])
+    assert result.exit_code == 0
+    assert 'A archivar: 1 versiones de 1 fichajes' in result.output
+    assert Fichaje.query.count() == 2
+
+    result = runner.invoke(args=['archivar-fichajes', '--force'])
+    assert 'Archivadas 1 versiones' in result.output
+    assert Fichaje.query.count() == 1
+
+
+def test_rangos_particion():
+    mensual = list(_rangos_particion(date(2025, 11, 20), date(2026, 1, 1), 'mensual'))
+    assert mensual == [
+        ('fichajes_p2025_11', date(2025, 11, 1), date(2025, 12, 1)),
+        ('fichajes_p2025_12', date(2025, 12, 1), date(2026, 1, 1)),
+        ('fichajes_p2026_01', date(2026, 1, 1), date(2026, 2, 1)),
+    ]
+    assert [n for n, _, _ in _rangos_particion(date(2025, 6, 1), date(2026, 3, 1), 'anual')] == [
+        'fichajes_p2025', 'fichajes_p2026'
+    ]
+
+
+def test_granularidad_desde_particiones_existentes():
+    assert _granularidad_particiones([
+        'DEFAULT', "FOR VALUES FROM ('2026-01-01') TO ('2027-01-01')"]) == 'anual'
+    assert _granularidad_particiones(["FOR VALUES FROM ('2026-02-01') TO ('2026-03-01')"]) == 'mensual'
+    assert _granularidad_particiones(['DEFAULT']) is None
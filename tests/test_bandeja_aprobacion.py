@@ -0,0 +1,93 @@
+from datetime import date, datetime
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from src import db
+from src.approvals import bandeja_pendientes
+from src.models import Usuario, Aprobador, SaldoVacaciones, SolicitudVacaciones, SolicitudBaja
+
+
+def _empleado_con_pendientes(jefe, i, tipo_ausencia, disfrutados):
+    anio = datetime.utcnow().year
+    u = Usuario(nombre=f'Empleado {i}', email=f'e{i}@test.com',
+                password=generate_password_hash('x'), rol='empleado', dias_vacaciones=22)
+    db.session.add(u)
+    db.session.flush()
+    db.session.add(Aprobador(usuario_id=u.id, aprobador_id=jefe.id))
+    if disfrutados is not None:
+        db.session.add(SaldoVacaciones(usuario_id=u.id, anio=anio, dias_totales=22,
+                                       dias_disfrutados=disfrutados))
+    db.session.add(SolicitudVacaciones(usuario_id=u.id, fecha_inicio=date(anio, 8, 1),
+                                       fecha_fin=date(anio, 8, 14), dias_solicitados=10,
+                                       estado='pendiente', fecha_solicitud=datetime.utcnow()))
+    db.session.add(SolicitudBaja(usuario_id=u.id, tipo_ausencia_id=tipo_ausencia.id,
+                                 fecha_inicio=date(anio, 3, 1), fecha_fin=date(anio, 3, 2),
+                                 dias_solicitados=2, motivo='Médico', estado='pendiente'))
+    return u
+
+
+def _contar_queries(funcion):
+    sentencias = []
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', _before)
+    try:
+        resultado = funcion()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _before)
+    return resultado, len(sentencias)
+
+
+def test_bandeja_adelantos_en_lote(approver_user, absence_type):
+    # 18 disfrutados -> quedan 4 -> 6 de adelanto; sin saldo -> 22 disponibles
+    con_saldo = _empleado_con_pendientes(approver_user, 1, absence_type, disfrutados=18)
+    sin_saldo = _empleado_con_pendientes(approver_user, 2, absence_type, disfrutados=None)
+    db.session.commit()
+    db.session.expire_all()
+
+    vacaciones, bajas = bandeja_pendientes(approver_user.id)
+    adelantos = {s.usuario_id: s.dias_adelanto for s in vacaciones}
+    assert adelantos == {con_saldo.id: 6, sin_saldo.id: 0}
+    assert {b.usuario_id for b in bajas} == {con_saldo.id, sin_saldo.id}
+
+
+def test_pagina_aprobaciones_queries_constantes(auth_approver_client, approver_user, absence_type):
+    def render():
+        db.session.expire_all()
+        respuesta = auth_approver_client.get('/aprobaciones')
+        assert respuesta.status_code == 200
+        return respuesta.get_data(as_text=True)
+
+    _empleado_con_pendientes(approver_user, 1, absence_type, disfrutados=18)
+    db.session.commit()
+    html, pocas = _contar_queries(render)
+    assert 'Adelanto: 6 días' in html
+
+    for i in range(2, 12):
+        _empleado_con_pendientes(approver_user, i, absence_type, disfrutados=i)
+    db.session.commit()
+    html, muchas = _contar_queries(render)
+
+    assert html.count('Empleado ') >= 22
+    assert muchas == pocas
+
+
+def test_gestion_ausencias_queries_constantes(auth_admin_client, approver_user, absence_type):
+    def render():
+        db.session.expire_all()
+        respuesta = auth_admin_client.get('/admin/gestion-ausencias')
+        assert respuesta.status_code == 200
+        return respuesta.get_data(as_text=True)
+
+    _empleado_con_pendientes(approver_user, 1, absence_type, disfrutados=18)
+    db.session.commit()
+    _, pocas = _contar_queries(render)
+
+    for i in range(2, 12):
+        _empleado_con_pendientes(approver_user, i, absence_type, disfrutados=i)
+    db.session.commit()
+    html, muchas = _contar_queries(render)
+
+    assert html.count('@test.com') >= 22
+    assert muchas == pocas
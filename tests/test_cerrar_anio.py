@@ -176,3 +176,66 @@ def test_cerrar_anio_deletes_old_festivos(test_app, runner, employee_user):
     # Verify: Old festivo deleted
     deleted = Festivo.query.get(old_festivo_id)
     assert deleted is None, "Festivo should be deleted"
+
+
+def _usuarios_con_saldo(anio, restantes):
+    from werkzeug.security import generate_password_hash
+    usuarios = []
+    for i, restante in enumerate(restantes):
+        u = Usuario(nombre=f'Cierre {i}', email=f'cierre{i}@test.com',
+                    password=generate_password_hash('x'), rol='empleado', dias_vacaciones=25)
+        db.session.add(u)
+        db.session.flush()
+        db.session.add(SaldoVacaciones(usuario_id=u.id, anio=anio, dias_totales=25,
+                                       dias_disfrutados=25 - restante))
+        usuarios.append(u)
+    db.session.commit()
+    return usuarios
+
+
+def test_cerrar_anio_dry_run_no_modifica(test_app, runner):
+    _usuarios_con_saldo(2030, [15, 3, -4])
+
+    result = runner.invoke(args=['cerrar-anio', '2030', '--max-carryover', '10', '--dry-run'])
+
+    assert result.exit_code == 0
+    assert 'Días traspasados: 13' in result.output
+    assert 'Con deuda: 1 (-4 días)' in result.output
+    assert '1 recortados a 10' in result.output
+    assert SaldoVacaciones.query.filter_by(anio=2031).count() == 0
+
+
+def test_cerrar_anio_por_lotes_reanuda_desde_checkpoint(test_app, runner):
+    from src.models import CierreAnio, CambioSaldo
+    primero, segundo, tercero = _usuarios_con_saldo(2030, [5, 5, 5])
+    # Cierre interrumpido tras el primer usuario
+    db.session.add(CierreAnio(anio_origen=2030, max_carryover=10, ultimo_usuario_id=primero.id, creados=1))
+    db.session.commit()
+
+    result = runner.invoke(args=['cerrar-anio', '2030', '--max-carryover', '10', '--lote', '1',
+                                 '--gestionar-festivos', 'mantener', '--force'])
+
+    assert result.exit_code == 0
+    assert f'Reanudado tras el usuario {primero.id}' in result.output
+    assert 'Total procesado: 3/3' in result.output
+    nuevos = {s.usuario_id: s.dias_totales for s in SaldoVacaciones.query.filter_by(anio=2031)}
+    assert nuevos == {segundo.id: 30, tercero.id: 30}
+    assert CambioSaldo.query.filter_by(anio=2031).count() == 2
+    assert db.session.get(CierreAnio, 2030).fecha_fin is not None
+
+
+def test_cerrar_anio_force_rehace_sin_duplicar(test_app, runner):
+    from src.models import CambioSaldo
+    usuario, = _usuarios_con_saldo(2030, [4])
+    args = ['cerrar-anio', '2030', '--gestionar-festivos', 'mantener', '--force']
+    runner.invoke(args=args)
+
+    saldo = SaldoVacaciones.query.filter_by(usuario_id=usuario.id, anio=2030).one()
+    saldo.dias_disfrutados = 19  # Ahora sobran 6
+    db.session.commit()
+    result = runner.invoke(args=args)
+
+    assert 'Actualizados: 1' in result.output
+    nuevo = SaldoVacaciones.query.filter_by(usuario_id=usuario.id, anio=2031).one()
+    assert (nuevo.dias_totales, nuevo.dias_carryover) == (31, 6)
+    assert [c.delta for c in CambioSaldo.query.filter_by(anio=2031).order_by(CambioSaldo.id)] == [4, 6]
@@ -1,6 +1,8 @@
 import csv
+import glob
 import os
-from src.models import Usuario
+from datetime import datetime
+from src.models import Usuario, SaldoVacaciones
 
 def test_import_users_command(test_app, runner):
     """Test the CLI command for importing users from CSV."""
@@ -44,6 +46,8 @@ def test_import_users_command(test_app, runner):
         # Cleanup
         if os.path.exists(csv_filename):
             os.remove(csv_filename)
+        for fichero in glob.glob('temp_users_credenciales_*.csv'):
+            os.remove(fichero)
 
 def test_import_users_invalid_csv(test_app, runner):
     """Test importing with invalid CSV format."""
@@ -60,3 +64,36 @@ def test_import_users_invalid_csv(test_app, runner):
     finally:
         if os.path.exists(csv_filename):
             os.remove(csv_filename)
+
+
+def test_import_users_credenciales_en_fichero(test_app, runner, tmp_path, employee_user):
+    """Las contraseñas van al fichero de credenciales, no a la salida."""
+    csv_path = tmp_path / 'usuarios.csv'
+    credenciales = tmp_path / 'credenciales.csv'
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Nombre', 'Email'])
+        for i in range(5):
+            writer.writerow([f'Importado {i}', f'importado{i}@example.com'])
+        writer.writerow(['Repetido', 'importado0@example.com'])
+        writer.writerow(['Existente', employee_user.email])
+
+    result = runner.invoke(args=['import-users', str(csv_path), '--credenciales', str(credenciales),
+                                 '--lote', '2', '--procesos', '2'])
+
+    assert result.exit_code == 0
+    assert 'Resumen: 5 creados, 2 saltados' in result.output
+    with open(credenciales, newline='', encoding='utf-8') as f:
+        filas = list(csv.DictReader(f))
+    assert [fila['email'] for fila in filas] == [f'importado{i}@example.com' for i in range(5)]
+    assert all(fila['password'] not in result.output for fila in filas)
+    assert oct(os.stat(credenciales).st_mode & 0o777) == '0o600'
+
+    usuario = Usuario.query.filter_by(email='importado3@example.com').one()
+    from werkzeug.security import check_password_hash
+    assert check_password_hash(usuario.password, filas[3]['password'])
+    assert SaldoVacaciones.query.filter_by(usuario_id=usuario.id, anio=datetime.now().year).one().dias_totales == 25
+
+    # No sobrescribe un fichero de credenciales existente
+    result = runner.invoke(args=['import-users', str(csv_path), '--credenciales', str(credenciales)])
+    assert 'ya existe' in result.output
@@ -0,0 +1,62 @@
+import json
+from datetime import date, time, timedelta
+
+from src import db
+from src.clock_events import suscribir, cancelar_suscripcion, publicar_estado, estado_reloj
+from src.models import Fichaje
+from src.tasks import cerrar_fichajes_abiertos
+
+
+def _leer_evento(respuesta):
+    """Lee el siguiente evento 'reloj' del stream SSE (ignora retry/pings)."""
+    for trozo in respuesta.response:
+        texto = trozo.decode() if isinstance(trozo, bytes) else trozo
+        if texto.startswith('event: reloj'):
+            return json.loads(texto.split('data: ', 1)[1])
+
+
+def test_stream_recibe_toggle_de_otra_pestana(auth_client, employee_user):
+    """Una pestaña con el stream abierto recibe el toggle hecho desde otra."""
+    stream = auth_client.get('/fichajes/stream', buffered=False)
+    assert stream.mimetype == 'text/event-stream'
+
+    auth_client.post('/fichajes/toggle')
+    evento = _leer_evento(stream)
+    assert evento['estado']['activo'] is True
+
+    auth_client.post('/fichajes/toggle')
+    evento = _leer_evento(stream)
+    assert evento['estado'] == {'activo': False, 'inicio': None, 'fecha': None}
+    stream.close()
+
+
+def test_evento_solo_tras_commit(test_app, employee_user):
+    cola = suscribir(employee_user.id)
+    try:
+        publicar_estado(employee_user.id, estado_reloj())
+        db.session.rollback()
+        assert cola.empty()
+
+        publicar_estado(employee_user.id, estado_reloj())
+        assert cola.empty()
+        db.session.commit()
+        assert cola.get_nowait()['estado']['activo'] is False
+    finally:
+        cancelar_suscripcion(employee_user.id, cola)
+
+
+def test_cierre_automatico_publica_estado(test_app, employee_user):
+    ayer = date.today() - timedelta(days=1)
+    db.session.add(Fichaje(usuario_id=employee_user.id, fecha=ayer,
+                           hora_entrada=time(9, 0), hora_salida=None))
+    db.session.commit()
+
+    cola = suscribir(employee_user.id)
+    try:
+        cerrar_fichajes_abiertos(test_app)
+        evento = cola.get_nowait()
+        assert evento['estado']['activo'] is False
+        assert evento['fecha'] == ayer.isoformat()
+        assert cola.empty()
+    finally:
+        cancelar_suscripcion(employee_user.id, cola)
@@ -0,0 +1,83 @@
+from datetime import date, datetime
+
+from sqlalchemy import event
+
+from src import db
+from src.approvals import RespuestasSolicitudes
+from src.models import Aprobador, SolicitudVacaciones, SolicitudBaja
+from src.pending_counters import contadores_pendientes
+
+
+def _contar_queries(funcion):
+    sentencias = []
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', _before)
+    try:
+        resultado = funcion()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _before)
+    return resultado, len(sentencias)
+
+
+def _pendiente(usuario, modelo=SolicitudVacaciones, **kwargs):
+    solicitud = modelo(usuario_id=usuario.id, fecha_inicio=date(2026, 8, 3), fecha_fin=date(2026, 8, 7),
+                       dias_solicitados=5, estado='pendiente', fecha_solicitud=datetime.utcnow(), **kwargs)
+    db.session.add(solicitud)
+    db.session.commit()
+    return solicitud
+
+
+def test_contadores_incrementales_sin_queries(approver_user, employee_user, absence_type):
+    jefe_id = approver_user.id
+    _pendiente(employee_user)
+    assert contadores_pendientes(jefe_id) == {'vacaciones': 1, 'bajas': 0, 'total': 1}
+
+    # Crear: el contador sube sin volver a contar
+    baja = _pendiente(employee_user, SolicitudBaja, tipo_ausencia_id=absence_type.id, motivo='Médico')
+    vacaciones = _pendiente(employee_user)
+    contadores, queries = _contar_queries(lambda: contadores_pendientes(jefe_id))
+    assert contadores == {'vacaciones': 2, 'bajas': 1, 'total': 3}
+    assert queries == 0
+
+    # Aprobar y rechazar
+    vacaciones = db.session.get(SolicitudVacaciones, vacaciones.id)
+    baja = db.session.get(SolicitudBaja, baja.id)
+    respuestas = RespuestasSolicitudes(jefe_id, vacaciones=[vacaciones], bajas=[baja])
+    respuestas.responder_vacaciones(vacaciones, 'aprobar')
+    respuestas.responder_baja(baja, 'rechazar')
+    db.session.commit()
+    contadores, queries = _contar_queries(lambda: contadores_pendientes(jefe_id))
+    assert contadores['total'] == 1 and queries == 0
+
+    # Un rollback no toca los contadores
+    _pendiente(employee_user)
+    db.session.query(SolicitudVacaciones).filter_by(estado='pendiente').first().estado = 'rechazada'
+    db.session.flush()
+    db.session.rollback()
+    assert contadores_pendientes(jefe_id)['total'] == 2
+
+
+def test_cambio_de_aprobador_recalcula(approver_user, employee_user, admin_user):
+    _pendiente(employee_user)
+    assert contadores_pendientes(admin_user.id)['total'] == 0
+
+    db.session.add(Aprobador(usuario_id=employee_user.id, aprobador_id=admin_user.id))
+    db.session.commit()
+    assert contadores_pendientes(admin_user.id)['total'] == 1
+
+
+def test_endpoint_y_portada(auth_approver_client, employee_user):
+    _pendiente(employee_user)
+    _pendiente(employee_user)
+
+    datos = auth_approver_client.get('/aprobaciones/pendientes').get_json()
+    assert datos == {'vacaciones': 2, 'bajas': 0, 'total': 2}
+
+    html = auth_approver_client.get('/').get_data(as_text=True)
+    assert 'Tienes <strong>2</strong> solicitud(es)' in html
+    assert 'badgePendientes' in html
+
+
+def test_endpoint_solo_aprobadores(auth_client):
+    assert auth_client.get('/aprobaciones/pendientes').status_code == 403
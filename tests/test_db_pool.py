@@ -0,0 +1,60 @@
+from src.database import opciones_engine, rol_proceso, statement_timeout_rol
+
+
+def test_opciones_engine_desde_entorno(monkeypatch):
+    """Las variables DB_* sobrescriben el pool y los parámetros de sesión."""
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    monkeypatch.setenv('DB_MAX_OVERFLOW', '0')
+    monkeypatch.setenv('DB_POOL_RECYCLE', '1800')
+    monkeypatch.setenv('DB_POOL_PRE_PING', 'False')
+    monkeypatch.setenv('DB_STATEMENT_TIMEOUT_WEB', '5000')
+
+    opciones = opciones_engine('postgresql://u:p@db/tempus', rol='web')
+
+    assert opciones['pool_size'] == 3
+    assert opciones['max_overflow'] == 0
+    assert opciones['pool_recycle'] == 1800
+    assert opciones['pool_pre_ping'] is False
+    assert opciones['connect_args']['options'] == (
+        '-c application_name=tempus-web -c statement_timeout=5000'
+    )
+
+
+def test_opciones_engine_por_rol(monkeypatch):
+    """La CLI no tiene statement_timeout por defecto; SQLite ignora el pool."""
+    monkeypatch.delenv('DB_STATEMENT_TIMEOUT_CLI', raising=False)
+    opciones = opciones_engine('postgresql://u:p@db/tempus', rol='cli')
+    assert opciones['connect_args']['options'] == '-c application_name=tempus-cli'
+    assert statement_timeout_rol('scheduler') == 300000
+
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    assert 'pool_size' not in opciones_engine('sqlite:///fichaje.db')
+
+
+def test_rol_proceso(monkeypatch):
+    monkeypatch.delenv('TEMPUS_ROLE', raising=False)
+    monkeypatch.setenv('FLASK_RUN_FROM_CLI', 'true')
+    monkeypatch.setattr('sys.argv', ['flask', 'cerrar-anio'])
+    assert rol_proceso() == 'cli'
+
+    monkeypatch.setattr('sys.argv', ['flask', 'run'])
+    assert rol_proceso() == 'web'
+
+    monkeypatch.setenv('TEMPUS_ROLE', 'scheduler')
+    assert rol_proceso() == 'scheduler'
+
+
+def test_metricas_pool_por_endpoint(auth_admin_client):
+    """El endpoint de métricas refleja los checkouts atribuidos a cada vista."""
+    auth_admin_client.get('/admin/usuarios')
+    respuesta = auth_admin_client.get('/admin/api/metricas/pool')
+
+    assert respuesta.status_code == 200
+    metricas = respuesta.get_json()['engines']['default']
+    assert metricas['checkouts'] > 0
+    assert 'admin.admin_usuarios' in metricas['por_endpoint']
+
+
+def test_metricas_pool_solo_admin(auth_client):
+    respuesta = auth_client.get('/admin/api/metricas/pool')
+    assert respuesta.status_code == 302
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+from src import db
+from src.availability import ocupacion_diaria
+from src.models import Festivo, SolicitudVacaciones, SolicitudBaja
+from src.utils import invalidar_cache_festivos
+
+
+def test_ocupacion_fusiona_por_persona_y_recorta():
+    intervalos = {
+        1: [(date(2026, 6, 1), date(2026, 6, 3)), (date(2026, 6, 3), date(2026, 6, 5))],
+        2: [(date(2026, 5, 20), date(2026, 6, 2))],
+    }
+    assert ocupacion_diaria(intervalos, date(2026, 6, 1), date(2026, 6, 6)) == [2, 2, 1, 1, 1, 0]
+
+
+def test_endpoint_disponibilidad(auth_approver_client, approver_user, employee_user, absence_type):
+    # Lunes 1 a miércoles 3 de junio de 2026 de vacaciones, baja el 3 y 4
+    db.session.add(SolicitudVacaciones(usuario_id=employee_user.id, fecha_inicio=date(2026, 6, 1),
+                                       fecha_fin=date(2026, 6, 3), dias_solicitados=3,
+                                       estado='aprobada', fecha_solicitud=datetime.utcnow()))
+    db.session.add(SolicitudBaja(usuario_id=employee_user.id, tipo_ausencia_id=absence_type.id,
+                                 fecha_inicio=date(2026, 6, 3), fecha_fin=date(2026, 6, 4),
+                                 dias_solicitados=2, motivo='Médico', estado='aprobada'))
+    # Pendientes no cuentan
+    db.session.add(SolicitudVacaciones(usuario_id=employee_user.id, fecha_inicio=date(2026, 6, 5),
+                                       fecha_fin=date(2026, 6, 5), dias_solicitados=1,
+                                       estado='pendiente', fecha_solicitud=datetime.utcnow()))
+    db.session.add(Festivo(fecha=date(2026, 6, 2), descripcion='Fiesta local', activo=True))
+    db.session.commit()
+    invalidar_cache_festivos()
+
+    datos = auth_approver_client.get(
+        f'/api/equipos/{approver_user.id}/disponibilidad?desde=2026-06-01&hasta=2026-06-07').get_json()
+    assert datos['miembros'] == 1
+    # Festivo el martes y fin de semana enmascarados
+    assert datos['ausentes'] == [1, None, 1, 1, 0, None, None]
+    invalidar_cache_festivos()
+
+
+def test_endpoint_disponibilidad_permisos(auth_client, approver_user):
+    url = f'/api/equipos/{approver_user.id}/disponibilidad'
+    assert auth_client.get(url).status_code == 403
+
+
+def test_endpoint_disponibilidad_rango_invalido(auth_approver_client, approver_user):
+    url = f'/api/equipos/{approver_user.id}/disponibilidad'
+    assert auth_approver_client.get(url + '?desde=2026-13-01').status_code == 400
+    assert auth_approver_client.get(url + '?desde=2026-06-10&hasta=2026-06-01').status_code == 400
+    assert auth_approver_client.get(url + '?desde=2026-01-01&hasta=2027-06-01').status_code == 400
+    assert len(auth_approver_client.get(url).get_json()['ausentes']) == 31
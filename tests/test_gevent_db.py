@@ -0,0 +1,59 @@
+import socket
+
+import gevent
+from psycopg2 import extensions
+
+from src.database import esperar_gevent, opciones_engine
+
+
+class _ConexionFalsa:
+    """Imita el protocolo poll()/fileno() de una conexión psycopg2 asíncrona."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.estados = [extensions.POLL_READ, extensions.POLL_OK]
+
+    def poll(self):
+        return self.estados.pop(0)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+def test_wait_callback_cede_a_otros_greenlets():
+    """
+    Mientras una 'query' espera respuesta del servidor, otro greenlet del mismo
+    worker debe poder ejecutarse (p.ej. un fichaje mientras corre un informe).
+    """
+    lado_cliente, lado_servidor = socket.socketpair()
+    eventos = []
+
+    def query_lenta():
+        eventos.append('informe: esperando')
+        esperar_gevent(_ConexionFalsa(lado_cliente), timeout=2)
+        eventos.append('informe: terminado')
+
+    def fichaje():
+        eventos.append('fichaje: atendido')
+        # El 'servidor' responde a la query lenta después de atender el fichaje
+        lado_servidor.send(b'x')
+
+    try:
+        hilos = [gevent.spawn(query_lenta), gevent.spawn(fichaje)]
+        gevent.joinall(hilos, timeout=5, raise_error=True)
+    finally:
+        lado_cliente.close()
+        lado_servidor.close()
+
+    assert eventos == ['informe: esperando', 'fichaje: atendido', 'informe: terminado']
+
+
+def test_opciones_engine_pool_para_gevent():
+    """Con driver cooperativo y Postgres el pool queda acotado y con pre-ping."""
+    opciones = opciones_engine('postgresql://u:p@db/tempus', cooperativo=True)
+    assert opciones['pool_size'] == 10
+    assert opciones['pool_pre_ping'] is True
+
+    # SQLite: sin parámetros de pool; workers síncronos: tamaños por defecto de SQLAlchemy
+    assert opciones_engine('sqlite:///fichaje.db', cooperativo=True) == {}
+    assert opciones_engine('postgresql://u:p@db/tempus', cooperativo=False)['pool_size'] == 5
@@ -0,0 +1,91 @@
+from datetime import date, datetime
+
+from werkzeug.security import generate_password_hash
+
+from src import db
+from src.approvals import bandeja_pendientes
+from src.hierarchy import esta_a_cargo, ids_a_cargo
+from src.models import Usuario, Aprobador, JerarquiaAprobacion, SolicitudVacaciones, UserKnownIP
+
+
+def _usuario(nombre, rol='empleado'):
+    u = Usuario(nombre=nombre, email=f'{nombre.lower()}@test.com',
+                password=generate_password_hash('x'), rol=rol)
+    db.session.add(u)
+    db.session.flush()
+    return u
+
+
+def _cierre():
+    return {(f.ancestro_id, f.descendiente_id): f.profundidad
+            for f in JerarquiaAprobacion.query}
+
+
+def test_cierre_se_mantiene_al_asignar_y_quitar(test_app):
+    director, jefe, empleado = _usuario('Director', 'aprobador'), _usuario('Jefe', 'aprobador'), _usuario('Ana')
+    db.session.add(Aprobador(usuario_id=jefe.id, aprobador_id=director.id))
+    relacion = Aprobador(usuario_id=empleado.id, aprobador_id=jefe.id)
+    db.session.add(relacion)
+    db.session.commit()
+
+    assert _cierre() == {(director.id, jefe.id): 1, (jefe.id, empleado.id): 1,
+                         (director.id, empleado.id): 2}
+    assert esta_a_cargo(jefe.id, empleado.id)
+    # Por defecto solo cuenta el aprobador directo
+    assert not esta_a_cargo(director.id, empleado.id)
+    assert esta_a_cargo(director.id, empleado.id, profundidad=2)
+    assert set(db.session.scalars(ids_a_cargo(director.id, profundidad=5))) == {jefe.id, empleado.id}
+
+    # Quitar el eslabón intermedio corta la cadena por debajo
+    db.session.delete(db.session.get(Aprobador, relacion.id))
+    db.session.commit()
+    assert _cierre() == {(director.id, jefe.id): 1}
+
+    # Un camino más corto gana; los ciclos no rompen el cálculo
+    db.session.add_all([Aprobador(usuario_id=empleado.id, aprobador_id=jefe.id),
+                        Aprobador(usuario_id=empleado.id, aprobador_id=director.id),
+                        Aprobador(usuario_id=director.id, aprobador_id=empleado.id)])
+    db.session.commit()
+    cierre = _cierre()
+    assert cierre[(director.id, empleado.id)] == 1
+    assert cierre[(empleado.id, jefe.id)] == 2
+    assert all(a != d for a, d in cierre)
+
+
+def test_profundidad_configurable_en_bandeja_y_permisos(client, monkeypatch, approver_user, employee_user):
+    director = _usuario('Director', 'aprobador')
+    db.session.add(UserKnownIP(usuario_id=director.id, ip_address='127.0.0.1'))
+    director.password = generate_password_hash('dir123')
+    db.session.add(Aprobador(usuario_id=approver_user.id, aprobador_id=director.id))
+    solicitud = SolicitudVacaciones(usuario_id=employee_user.id, fecha_inicio=date(2026, 7, 1),
+                                    fecha_fin=date(2026, 7, 3), dias_solicitados=3,
+                                    estado='pendiente', fecha_solicitud=datetime.utcnow())
+    db.session.add(solicitud)
+    db.session.commit()
+    director_id, solicitud_id = director.id, solicitud.id
+
+    assert bandeja_pendientes(director_id) == ([], [])
+
+    monkeypatch.setitem(client.application.config, 'APPROVAL_HIERARCHY_DEPTH', 2)
+    vacaciones, _ = bandeja_pendientes(director_id)
+    assert [s.id for s in vacaciones] == [solicitud_id]
+
+    client.post('/login', data={'email': 'director@test.com', 'password': 'dir123'})
+    client.post(f'/aprobaciones/vacaciones/{solicitud_id}/aprobar')
+    assert db.session.get(SolicitudVacaciones, solicitud_id).estado == 'aprobada'
+
+
+def test_archivar_usuario_recalcula(auth_admin_client, approver_user, employee_user):
+    assert esta_a_cargo(approver_user.id, employee_user.id)
+
+    auth_admin_client.post(f'/admin/usuarios/eliminar/{approver_user.id}')
+    assert _cierre() == {}
+
+
+def test_cli_reconstruir(runner, approver_user, employee_user):
+    JerarquiaAprobacion.query.delete()
+    db.session.commit()
+
+    result = runner.invoke(args=['reconstruir-jerarquia'])
+    assert 'reconstruida: 1 relaciones' in result.output
+    assert _cierre() == {(approver_user.id, employee_user.id): 1}
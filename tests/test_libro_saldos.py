@@ -0,0 +1,98 @@
+from datetime import date, datetime, timedelta
+
+from src import db
+from src.approvals import RespuestasSolicitudes
+from src.balances import registrar_movimiento, saldo_segun_movimientos
+from src.models import SaldoVacaciones, SolicitudVacaciones, MovimientoSaldo, Festivo
+from src.utils import aplicar_cambio_saldo, recalcular_vacaciones_por_festivo
+
+
+def _libro_cuadra():
+    """Cada saldo materializado coincide con la suma de su libro."""
+    for saldo in SaldoVacaciones.query:
+        assert saldo_segun_movimientos(saldo.usuario_id, saldo.anio) == \
+            (saldo.dias_totales, saldo.dias_disfrutados), saldo
+
+
+def _aprobar(solicitud, aprobador_id):
+    respuestas = RespuestasSolicitudes(aprobador_id, vacaciones=[solicitud])
+    respuestas.responder_vacaciones(solicitud, 'aprobar')
+    db.session.commit()
+
+
+def test_aprobaciones_y_modificaciones_apuntan_movimientos(test_app, employee_user, approver_user):
+    anio = datetime.now().year
+    v1 = SolicitudVacaciones(usuario_id=employee_user.id, fecha_inicio=date(anio, 8, 3),
+                             fecha_fin=date(anio, 8, 7), dias_solicitados=5, estado='pendiente',
+                             fecha_solicitud=datetime.utcnow())
+    db.session.add(v1)
+    db.session.commit()
+    _aprobar(v1, approver_user.id)
+
+    # El saldo no existía: se abre con la base contractual
+    assert [(m.tipo, m.delta_totales, m.delta_disfrutados) for m in MovimientoSaldo.query.order_by(MovimientoSaldo.id)] \
+        == [('apertura', 25, 0), ('solicitud', 0, 5)]
+
+    v2 = SolicitudVacaciones(usuario_id=employee_user.id, grupo_id=v1.grupo_id, version=2,
+                             tipo_accion='modificacion', fecha_inicio=date(anio, 8, 3),
+                             fecha_fin=date(anio, 8, 5), dias_solicitados=3, estado='pendiente',
+                             fecha_solicitud=datetime.utcnow())
+    db.session.add(v2)
+    db.session.commit()
+    _aprobar(v2, approver_user.id)
+
+    saldo = SaldoVacaciones.query.filter_by(usuario_id=employee_user.id, anio=anio).one()
+    assert saldo.dias_disfrutados == 3
+    reversion = MovimientoSaldo.query.filter_by(tipo='reversion').one()
+    assert (reversion.delta_disfrutados, reversion.solicitud_id) == (-5, v1.id)
+    _libro_cuadra()
+
+
+def test_suma_atomica_sin_pisar_valores_en_memoria(test_app, employee_user):
+    db.session.add(SaldoVacaciones(usuario_id=employee_user.id, anio=2030, dias_totales=25, dias_disfrutados=0))
+    db.session.commit()
+    saldo = SaldoVacaciones.query.filter_by(usuario_id=employee_user.id, anio=2030).one()
+    assert saldo.dias_disfrutados == 0  # Copia en memoria
+
+    registrar_movimiento(employee_user.id, 2030, 'solicitud', delta_disfrutados=2)
+    registrar_movimiento(employee_user.id, 2030, 'solicitud', delta_disfrutados=3)
+    db.session.commit()
+
+    db.session.refresh(saldo)
+    assert saldo.dias_disfrutados == 5
+    # Sin saldo ni base no se apunta nada
+    assert not registrar_movimiento(employee_user.id, 2031, 'festivo', delta_disfrutados=1)
+
+
+def test_saldo_historico_y_ajustes(test_app, employee_user):
+    anio = datetime.now().year
+    aplicar_cambio_saldo(employee_user, 3, 'Bonus', anio=anio)
+    antes = datetime.utcnow()
+    aplicar_cambio_saldo(employee_user, -1, 'Corrección', anio=anio)
+
+    assert saldo_segun_movimientos(employee_user.id, anio, hasta=antes) == (28, 0)
+    assert saldo_segun_movimientos(employee_user.id, anio) == (27, 0)
+    assert saldo_segun_movimientos(employee_user.id, anio, hasta=antes - timedelta(days=1)) == (0, 0)
+    _libro_cuadra()
+
+
+def test_festivo_y_cierre_de_anio_mantienen_el_libro(test_app, runner, employee_user):
+    anio = datetime.now().year
+    aplicar_cambio_saldo(employee_user, 1, 'Base', anio=anio)
+    vac = SolicitudVacaciones(usuario_id=employee_user.id, fecha_inicio=date(anio, 12, 14),
+                              fecha_fin=date(anio, 12, 18), dias_solicitados=5, estado='aprobada',
+                              fecha_solicitud=datetime.utcnow())
+    db.session.add(vac)
+    registrar_movimiento(employee_user.id, anio, 'solicitud', delta_disfrutados=5)
+    db.session.add(Festivo(fecha=date(anio, 12, 16), descripcion='Local', activo=True))
+    db.session.commit()
+
+    assert recalcular_vacaciones_por_festivo(date(anio, 12, 16)) == 1
+    assert MovimientoSaldo.query.filter_by(tipo='festivo').one().delta_disfrutados == -1
+
+    args = ['cerrar-anio', str(anio), '--gestionar-festivos', 'mantener', '--force']
+    runner.invoke(args=args)
+    runner.invoke(args=args)  # Rehecho: revierte el saldo anterior
+    assert MovimientoSaldo.query.filter_by(anio=anio + 1, tipo='reversion').count() == 1
+    assert MovimientoSaldo.query.filter_by(anio=anio + 1, tipo='carryover').count() == 2
+    _libro_cuadra()
@@ -0,0 +1,116 @@
+from datetime import date, datetime
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from werkzeug.security import generate_password_hash
+
+from src import db
+from src.database import SesionEnrutada
+from src.availability import dias_sobre_capacidad
+from src.models import Usuario, Aprobador, LimiteAusenciasEquipo, SolicitudVacaciones
+
+
+def _companero(aprobador):
+    u = Usuario(nombre='Luis', email='luis@test.com', password=generate_password_hash('x'), rol='empleado')
+    db.session.add(u)
+    db.session.flush()
+    db.session.add(Aprobador(usuario_id=u.id, aprobador_id=aprobador.id))
+    return u
+
+
+def _vacaciones(usuario, inicio, fin, estado='aprobada'):
+    solicitud = SolicitudVacaciones(usuario_id=usuario.id, fecha_inicio=inicio, fecha_fin=fin,
+                                    dias_solicitados=(fin - inicio).days + 1, estado=estado,
+                                    fecha_solicitud=datetime.utcnow())
+    db.session.add(solicitud)
+    return solicitud
+
+
+def test_dias_sobre_capacidad(test_app, approver_user, employee_user):
+    companero = _companero(approver_user)
+    # Lunes 3 a lunes 10 de junio de 2030
+    _vacaciones(companero, date(2030, 6, 3), date(2030, 6, 10))
+    db.session.commit()
+
+    # Sin límite no hay restricción
+    assert dias_sobre_capacidad(employee_user.id, date(2030, 6, 6), date(2030, 6, 12)) == []
+
+    db.session.add(LimiteAusenciasEquipo(aprobador_id=approver_user.id, max_ausentes=1))
+    db.session.commit()
+    excesos = dias_sobre_capacidad(employee_user.id, date(2030, 6, 6), date(2030, 6, 12))
+    # Jueves, viernes y lunes; el fin de semana no cuenta
+    assert [e['fecha'] for e in excesos] == [date(2030, 6, 6), date(2030, 6, 7), date(2030, 6, 10)]
+    assert excesos[0] == {'equipo': approver_user.id, 'nombre': approver_user.nombre,
+                          'fecha': date(2030, 6, 6), 'ausentes': 1, 'limite': 1}
+
+    # Las ausencias propias no ocupan plaza
+    assert dias_sobre_capacidad(companero.id, date(2030, 6, 3), date(2030, 6, 4)) == []
+
+
+def test_solicitar_vacaciones_rechaza_dias_completos(auth_client, approver_user, employee_user):
+    companero = _companero(approver_user)
+    _vacaciones(companero, date(2030, 6, 3), date(2030, 6, 4))
+    db.session.add(LimiteAusenciasEquipo(aprobador_id=approver_user.id, max_ausentes=1))
+    db.session.commit()
+
+    response = auth_client.post('/vacaciones/solicitar', data={
+        'fecha_inicio': '2030-06-04', 'fecha_fin': '2030-06-05', 'motivo': 'Viaje'
+    }, follow_redirects=True)
+    assert 'límite de ausencias simultáneas' in response.get_data(as_text=True)
+    assert '04/06/2030' in response.get_data(as_text=True)
+    assert SolicitudVacaciones.query.filter_by(usuario_id=employee_user.id).count() == 0
+
+
+def test_aprobacion_en_lote_respeta_el_limite(auth_approver_client, approver_user, employee_user):
+    companero = _companero(approver_user)
+    primera = _vacaciones(employee_user, date(2030, 6, 3), date(2030, 6, 4), estado='pendiente')
+    segunda = _vacaciones(companero, date(2030, 6, 4), date(2030, 6, 5), estado='pendiente')
+    db.session.add(LimiteAusenciasEquipo(aprobador_id=approver_user.id, max_ausentes=1))
+    db.session.commit()
+    ids = [primera.id, segunda.id]
+
+    datos = auth_approver_client.post('/aprobaciones/lote',
+                                      json={'accion': 'aprobar', 'vacaciones': ids}).get_json()
+    assert datos['procesadas'] == 1
+    omitida = datos['resultados'][1]
+    assert not omitida['ok'] and '04/06/2030' in omitida['mensaje']
+    assert db.session.get(SolicitudVacaciones, ids[1]).estado == 'pendiente'
+
+    # Individualmente tampoco se puede aprobar
+    auth_approver_client.post(f'/aprobaciones/vacaciones/{ids[1]}/aprobar')
+    assert db.session.get(SolicitudVacaciones, ids[1]).estado == 'pendiente'
+
+
+def test_aprobacion_bloquea_limites_antes_de_comprobar(auth_approver_client, approver_user, employee_user):
+    _companero(approver_user)
+    solicitud = _vacaciones(employee_user, date(2030, 6, 3), date(2030, 6, 4), estado='pendiente')
+    db.session.add(LimiteAusenciasEquipo(aprobador_id=approver_user.id, max_ausentes=1))
+    db.session.commit()
+
+    sentencias = []
+    def _capturar(estado):
+        if estado.is_select:
+            sentencias.append(str(estado.statement.compile(dialect=postgresql.dialect())))
+    event.listen(SesionEnrutada, 'do_orm_execute', _capturar)
+    try:
+        auth_approver_client.post(f'/aprobaciones/vacaciones/{solicitud.id}/aprobar')
+    finally:
+        event.remove(SesionEnrutada, 'do_orm_execute', _capturar)
+
+    assert db.session.get(SolicitudVacaciones, solicitud.id).estado == 'aprobada'
+    # El límite del equipo se bloquea antes de leer la ocupación
+    bloqueo = next(i for i, sql in enumerate(sentencias)
+                   if 'FROM limites_ausencias_equipo' in sql and 'FOR UPDATE' in sql)
+    ocupacion = next(i for i, sql in enumerate(sentencias) if 'UNION ALL' in sql)
+    assert bloqueo < ocupacion
+
+
+def test_admin_fija_y_quita_limite(auth_admin_client, approver_user):
+    auth_admin_client.post('/admin/aprobadores/limite',
+                           data={'aprobador_id': approver_user.id, 'max_ausentes': 2})
+    assert db.session.get(LimiteAusenciasEquipo, approver_user.id).max_ausentes == 2
+    assert 'Límite de Ausencias' in auth_admin_client.get('/admin/aprobadores').get_data(as_text=True)
+
+    auth_admin_client.post('/admin/aprobadores/limite',
+                           data={'aprobador_id': approver_user.id, 'max_ausentes': 0})
+    assert db.session.get(LimiteAusenciasEquipo, approver_user.id) is None
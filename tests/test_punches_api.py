@@ -0,0 +1,175 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from src import db
+from src.models import Fichaje, EventoTerminal, SugerenciaFichaje
+from src.suggestions import obtener_sugerencias
+
+TOKEN = 'secreto-torno'
+
+
+@pytest.fixture
+def terminal(test_app, client):
+    test_app.config['PUNCH_API_TOKENS'] = f'torno-norte:{TOKEN}'
+    yield client
+    test_app.config['PUNCH_API_TOKENS'] = ''
+
+
+def _enviar(cliente, eventos, token=TOKEN):
+    return cliente.post('/api/v1/punches', json={'events': eventos},
+                        headers={'Authorization': f'Bearer {token}'})
+
+
+def _evento(evento_id, usuario_id, momento, sentido):
+    return {'event_id': evento_id, 'usuario_id': usuario_id,
+            'timestamp': momento.isoformat(), 'direction': sentido}
+
+
+def test_token_obligatorio(terminal):
+    assert _enviar(terminal, [], token='otro').status_code == 401
+
+
+def test_lote_empareja_y_deduplica(terminal, employee_user, admin_user):
+    ayer = date.today() - timedelta(days=1)
+
+    def entrada(hora):
+        return datetime.combine(ayer, hora)
+
+    eventos = [
+        _evento('e1', employee_user.id, entrada(time(8, 0)), 'in'),
+        _evento('e2', employee_user.id, entrada(time(14, 0)), 'out'),
+        _evento('e3', employee_user.id, entrada(time(15, 0)), 'in'),
+        # Por email y desordenado: el servidor ordena por momento
+        {'event_id': 'a2', 'email': admin_user.email.upper(),
+         'timestamp': entrada(time(17, 0)).isoformat(), 'direction': 'out'},
+        _evento('a1', admin_user.id, entrada(time(9, 0)), 'in'),
+        _evento('x1', 9999, entrada(time(9, 0)), 'in'),
+    ]
+
+    respuesta = _enviar(terminal, eventos)
+    assert respuesta.status_code == 200
+    resumen = respuesta.get_json()
+    assert resumen['fichajes_creados'] == 3
+    assert resumen['rechazados'] == [{'event_id': 'x1', 'motivo': 'usuario_desconocido'}]
+
+    cerrados = Fichaje.query.filter_by(usuario_id=employee_user.id).order_by(Fichaje.hora_entrada).all()
+    assert [(f.hora_entrada, f.hora_salida) for f in cerrados] == [
+        (time(8, 0), time(14, 0)), (time(15, 0), None)
+    ]
+    assert Fichaje.query.filter_by(usuario_id=admin_user.id).one().hora_salida == time(17, 0)
+
+    # Reenvío del mismo lote + la salida pendiente: solo se procesa lo nuevo
+    eventos.append(_evento('e4', employee_user.id, entrada(time(18, 30)), 'out'))
+    resumen = _enviar(terminal, eventos).get_json()
+    assert resumen['duplicados'] == 6
+    assert resumen['fichajes_creados'] == 0
+    assert resumen['fichajes_cerrados'] == 1
+    assert Fichaje.query.filter(Fichaje.hora_salida.is_(None)).count() == 0
+    assert EventoTerminal.query.count() == 7
+
+
+def test_lote_rechaza_solapes(terminal, employee_user):
+    hoy = date.today()
+    db.session.add(Fichaje(usuario_id=employee_user.id, fecha=hoy,
+                           hora_entrada=time(9, 0), hora_salida=time(13, 0)))
+    db.session.commit()
+
+    resumen = _enviar(terminal, [
+        _evento('s1', employee_user.id, datetime.combine(hoy, time(12, 0)), 'in'),
+        _evento('s2', employee_user.id, datetime.combine(hoy, time(14, 0)), 'out'),
+        _evento('s3', employee_user.id, datetime.combine(hoy, time(20, 0)), 'out'),
+        {'event_id': 's4', 'usuario_id': employee_user.id, 'timestamp': 'ayer', 'direction': 'in'},
+    ]).get_json()
+
+    assert resumen['fichajes_creados'] == 0
+    motivos = {r['event_id']: r['motivo'] for r in resumen['rechazados']}
+    assert motivos['s1'] == motivos['s2'] == 'solapado'
+    assert motivos['s3'] == 'huerfano'
+    assert 'ISO' in motivos['s4']
+
+
+def test_salida_de_fichaje_ya_cerrado_no_se_cuenta(terminal, employee_user):
+    """Si el toggle web cierra el fichaje justo antes del UPDATE del lote, la salida no se aplica."""
+    ayer = date.today() - timedelta(days=1)
+    abierto = Fichaje(usuario_id=employee_user.id, fecha=ayer, hora_entrada=time(8, 0), hora_salida=None)
+    db.session.add(abierto)
+    db.session.commit()
+    abierto_id = abierto.id
+
+    def _cierre_web(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE fichajes'):
+            cursor.connection.execute("UPDATE fichajes SET hora_salida = '13:00:00.000000' WHERE id = ?",
+                                      (abierto_id,))
+    event.listen(db.engine, 'before_cursor_execute', _cierre_web)
+    try:
+        resumen = _enviar(terminal, [_evento('s1', employee_user.id,
+                                              datetime.combine(ayer, time(14, 0)), 'out')]).get_json()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _cierre_web)
+
+    assert resumen['fichajes_cerrados'] == 0
+    assert resumen['rechazados'] == [{'event_id': 's1', 'motivo': 'ya_cerrado'}]
+    db.session.expire_all()
+    assert db.session.get(Fichaje, abierto_id).hora_salida == time(13, 0)
+    assert EventoTerminal.query.filter_by(evento_id='s1').one().resultado == 'ya_cerrado'
+
+
+def test_salida_y_entrada_con_fichaje_abierto(terminal, employee_user):
+    """Con un fichaje abierto, 'out' y luego 'in' en el mismo lote: se cierra uno y queda otro abierto."""
+    ayer = date.today() - timedelta(days=1)
+    abierto = Fichaje(usuario_id=employee_user.id, fecha=ayer, hora_entrada=time(8, 0), hora_salida=None)
+    db.session.add(abierto)
+    db.session.commit()
+    abierto_id = abierto.id
+
+    respuesta = _enviar(terminal, [
+        _evento('o1', employee_user.id, datetime.combine(ayer, time(13, 0)), 'out'),
+        _evento('i1', employee_user.id, datetime.combine(ayer, time(14, 0)), 'in'),
+    ])
+    assert respuesta.status_code == 200
+    resumen = respuesta.get_json()
+    assert resumen['fichajes_cerrados'] == 1 and resumen['fichajes_creados'] == 1
+    assert resumen['rechazados'] == []
+
+    db.session.expire_all()
+    assert db.session.get(Fichaje, abierto_id).hora_salida == time(13, 0)
+    assert [f.hora_entrada for f in Fichaje.query.filter_by(usuario_id=employee_user.id,
+                                                             hora_salida=None)] == [time(14, 0)]
+
+
+def test_entrada_rechazada_si_la_salida_previa_no_se_aplica(terminal, employee_user):
+    """Si la salida del fichaje abierto se solapa, la nueva entrada se rechaza sin tumbar el lote."""
+    ayer = date.today() - timedelta(days=1)
+    db.session.add(Fichaje(usuario_id=employee_user.id, fecha=ayer, hora_entrada=time(10, 0),
+                           hora_salida=time(12, 0)))
+    db.session.add(Fichaje(usuario_id=employee_user.id, fecha=ayer, hora_entrada=time(8, 0), hora_salida=None))
+    db.session.commit()
+
+    respuesta = _enviar(terminal, [
+        _evento('o1', employee_user.id, datetime.combine(ayer, time(13, 0)), 'out'),
+        _evento('i1', employee_user.id, datetime.combine(ayer, time(14, 0)), 'in'),
+    ])
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['rechazados'] == [{'event_id': 'o1', 'motivo': 'solapado'},
+                                                  {'event_id': 'i1', 'motivo': 'fichaje_abierto'}]
+    assert Fichaje.query.filter_by(usuario_id=employee_user.id, hora_salida=None).count() == 1
+
+
+def test_tramos_del_lote_suman_a_las_sugerencias(terminal, employee_user):
+    obtener_sugerencias(employee_user.id)  # fila vacía inicial
+    ayer = date.today() - timedelta(days=1)
+    db.session.add(Fichaje(usuario_id=employee_user.id, fecha=ayer, hora_entrada=time(7, 0)))
+    db.session.commit()
+
+    respuesta = _enviar(terminal, [
+        _evento('o1', employee_user.id, datetime.combine(ayer, time(13, 0)), 'out'),
+        _evento('i1', employee_user.id, datetime.combine(ayer, time(14, 0)), 'in'),
+        _evento('o2', employee_user.id, datetime.combine(ayer, time(18, 0)), 'out'),
+    ])
+    assert respuesta.status_code == 200
+
+    db.session.expire_all()
+    turnos = db.session.get(SugerenciaFichaje, employee_user.id).turnos
+    assert sorted(t[:3] for t in turnos) == [[7 * 60, 13 * 60, 0], [14 * 60, 18 * 60, 0]]
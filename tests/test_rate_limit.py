@@ -0,0 +1,20 @@
+from src import app, limiter
+
+
+def test_rate_limit_estrategia_ventana_deslizante(test_app):
+    """Por defecto se usa la ventana deslizante por contadores (memoria acotada)."""
+    assert app.config['RATELIMIT_STRATEGY'] == 'sliding-window-counter'
+    assert type(limiter._limiter).__name__ == 'SlidingWindowCounterRateLimiter'
+
+
+def test_rate_limit_no_cuenta_estaticos(client):
+    """Los ficheros estáticos no consumen cuota (ni round-trips al backend)."""
+    codes = [client.get('/static/favicon.ico').status_code for _ in range(15)]
+    assert codes == [200] * 15
+
+
+def test_rate_limit_login_sigue_activo(client):
+    """El límite específico de login (5/min) se mantiene."""
+    codes = [client.get('/login').status_code for _ in range(6)]
+    assert codes[:5] == [200] * 5
+    assert codes[5] == 429
@@ -0,0 +1,82 @@
+from datetime import date, datetime
+
+from werkzeug.security import generate_password_hash
+
+from src import db
+from src.models import Usuario, SaldoVacaciones, SolicitudVacaciones, CambioSaldo
+from src.tasks import reconciliar_saldos
+
+
+def _solicitud(usuario, dias, anio, **kwargs):
+    datos = dict(estado='aprobada', tipo_accion='creacion', es_actual=True)
+    datos.update(kwargs)
+    db.session.add(SolicitudVacaciones(usuario_id=usuario.id, fecha_inicio=date(anio, 7, 1),
+                                       fecha_fin=date(anio, 7, dias), dias_solicitados=dias,
+                                       fecha_solicitud=datetime(anio, 3, 1), **datos))
+
+
+def _preparar(employee_user, admin_user):
+    # Empleado: 5 + 3 aprobados; guardados 6 (descuadre +2)
+    db.session.add(SaldoVacaciones(usuario_id=employee_user.id, anio=2030, dias_totales=25, dias_disfrutados=6))
+    _solicitud(employee_user, 5, 2030)
+    _solicitud(employee_user, 3, 2030)
+    # No cuentan: pendiente, cancelación, versión sustituida y otro año
+    _solicitud(employee_user, 4, 2030, estado='pendiente')
+    _solicitud(employee_user, 2, 2030, tipo_accion='cancelacion')
+    _solicitud(employee_user, 2, 2030, es_actual=False)
+    _solicitud(employee_user, 9, 2029)
+    # Admin: cuadra
+    db.session.add(SaldoVacaciones(usuario_id=admin_user.id, anio=2030, dias_totales=25, dias_disfrutados=1))
+    _solicitud(admin_user, 1, 2030)
+    # Sin saldo del año pero con consumo
+    sin_saldo = Usuario(nombre='Zoe', email='zoe@test.com', password=generate_password_hash('x'),
+                        rol='empleado', dias_vacaciones=22)
+    db.session.add(sin_saldo)
+    db.session.flush()
+    _solicitud(sin_saldo, 4, 2030)
+    db.session.commit()
+    return sin_saldo.id
+
+
+def test_reconciliar_informa_sin_modificar(runner, employee_user, admin_user):
+    _preparar(employee_user, admin_user)
+
+    result = runner.invoke(args=['reconciliar-saldos', '--anio', '2030'])
+
+    assert 'Descuadres encontrados: 2' in result.output
+    assert 'sin saldo' in result.output
+    assert 'Diferencia neta: +6 días' in result.output
+    assert SaldoVacaciones.query.filter_by(usuario_id=employee_user.id, anio=2030).one().dias_disfrutados == 6
+    assert CambioSaldo.query.count() == 0
+
+
+def test_reconciliar_fix_corrige_y_audita(runner, employee_user, admin_user):
+    sin_saldo_id = _preparar(employee_user, admin_user)
+
+    result = runner.invoke(args=['reconciliar-saldos', '--anio', '2030', '--fix', '--force'])
+
+    assert '2 saldos corregidos' in result.output
+    assert SaldoVacaciones.query.filter_by(usuario_id=employee_user.id, anio=2030).one().dias_disfrutados == 8
+    nuevo = SaldoVacaciones.query.filter_by(usuario_id=sin_saldo_id, anio=2030).one()
+    assert (nuevo.dias_totales, nuevo.dias_disfrutados) == (22, 4)
+    assert sorted(c.delta for c in CambioSaldo.query.filter_by(origen='reconciliacion')) == [2, 4]
+
+    result = runner.invoke(args=['reconciliar-saldos', '--anio', '2030'])
+    assert 'Todos los saldos cuadran' in result.output
+
+
+def test_job_nocturno_solo_corrige_con_autofix(test_app, monkeypatch, employee_user):
+    anio = datetime.now().year
+    db.session.add(SaldoVacaciones(usuario_id=employee_user.id, anio=anio, dias_totales=25, dias_disfrutados=0))
+    _solicitud(employee_user, 3, anio)
+    db.session.commit()
+    saldo_id = SaldoVacaciones.query.filter_by(usuario_id=employee_user.id, anio=anio).one().id
+
+    reconciliar_saldos(test_app)
+    assert db.session.get(SaldoVacaciones, saldo_id).dias_disfrutados == 0
+
+    monkeypatch.setitem(test_app.config, 'SALDOS_RECONCILIACION_AUTOFIX', True)
+    reconciliar_saldos(test_app)
+    db.session.expire_all()
+    assert db.session.get(SaldoVacaciones, saldo_id).dias_disfrutados == 3
+    assert CambioSaldo.query.one().actor_label == 'system:cron'
@@ -0,0 +1,63 @@
+from datetime import date, time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from src import db
+from src.database import invalidar_estado_replica
+from src.models import Usuario, Fichaje
+
+
+@pytest.fixture
+def replica(test_app, tmp_path):
+    """
+    Réplica simulada con un segundo fichero SQLite: contiene un fichaje que
+    no existe en el primario, así se distingue de dónde se ha leído.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    db.metadata.create_all(engine)
+    with Session(engine) as sesion:
+        sesion.add(Usuario(id=999, nombre='Solo En Replica', email='replica@test.com',
+                           password='x', rol='empleado'))
+        sesion.add(Fichaje(usuario_id=999, fecha=date.today(),
+                           hora_entrada=time(8, 0), hora_salida=time(15, 0), pausa=0))
+        sesion.commit()
+
+    db.engines['replica'] = engine
+    invalidar_estado_replica()
+    yield engine
+    del db.engines['replica']
+    invalidar_estado_replica()
+    engine.dispose()
+
+
+def test_exportacion_lee_de_replica(auth_admin_client, replica):
+    respuesta = auth_admin_client.get('/admin/fichajes/export')
+    assert respuesta.status_code == 200
+    assert 'Solo En Replica' in respuesta.get_data(as_text=True)
+
+
+def test_vistas_normales_usan_primario(auth_admin_client, replica):
+    """Fuera de @usar_replica todo sigue yendo al primario."""
+    assert db.session.get(Usuario, 999) is None
+    assert auth_admin_client.get('/admin/usuarios').status_code == 200
+
+
+def test_replica_retrasada_usa_primario(auth_admin_client, replica, test_app, monkeypatch):
+    monkeypatch.setattr('src.database._medir_retraso', lambda engine: 120.0)
+    test_app.config['REPLICA_MAX_LAG'] = 30
+
+    respuesta = auth_admin_client.get('/admin/fichajes/export')
+    assert respuesta.status_code == 200
+    assert 'Solo En Replica' not in respuesta.get_data(as_text=True)
+
+
+def test_replica_caida_usa_primario(auth_admin_client, replica, monkeypatch):
+    def _caida(engine):
+        raise ConnectionError('réplica caída')
+    monkeypatch.setattr('src.database._medir_retraso', _caida)
+
+    respuesta = auth_admin_client.get('/admin/fichajes/export')
+    assert respuesta.status_code == 200
+    assert 'Solo En Replica' not in respuesta.get_data(as_text=True)
@@ -0,0 +1,121 @@
+from datetime import date, time, timedelta
+
+from sqlalchemy import event
+
+from src import db
+from src.models import Fichaje, SugerenciaFichaje
+from src.suggestions import obtener_sugerencias, recalcular_sugerencias
+
+
+def _fichaje(usuario_id, fecha, entrada, salida, pausa=0):
+    db.session.add(Fichaje(usuario_id=usuario_id, fecha=fecha, hora_entrada=entrada,
+                           hora_salida=salida, pausa=pausa))
+
+
+def test_sugerencias_ponderadas_por_antiguedad(test_app, employee_user):
+    """Un horario reciente supera a otro más usado hace un año."""
+    hoy = date.today()
+    for i in range(4):
+        _fichaje(employee_user.id, hoy - timedelta(days=365 + i), time(7, 0), time(15, 0))
+    for i in range(2):
+        _fichaje(employee_user.id, hoy - timedelta(days=i + 1), time(9, 0), time(17, 0), pausa=30)
+    db.session.commit()
+
+    sugerencias = obtener_sugerencias(employee_user.id)
+    assert [(s.hora_entrada, s.hora_salida, s.pausa) for s in sugerencias] == [
+        (time(9, 0), time(17, 0), 30), (time(7, 0), time(15, 0), 0)
+    ]
+
+
+def test_formulario_lee_sugerencias_por_clave(auth_client, employee_user):
+    """Con la fila calculada, el formulario no agrupa el histórico de fichajes."""
+    _fichaje(employee_user.id, date.today() - timedelta(days=1), time(8, 0), time(16, 0))
+    db.session.commit()
+    obtener_sugerencias(employee_user.id)
+
+    sentencias = []
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', _before)
+    try:
+        respuesta = auth_client.get('/fichajes/crear')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _before)
+
+    assert respuesta.status_code == 200
+    assert '08:00 - 16:00' in respuesta.get_data(as_text=True)
+    assert not any('GROUP BY' in s and 'fichajes' in s for s in sentencias)
+
+
+def test_incremental_al_crear_y_rectificar(auth_client, employee_user):
+    user_id = employee_user.id
+    obtener_sugerencias(user_id)  # fila vacía inicial
+
+    dia = date.today() - timedelta(days=3)
+    auth_client.post('/fichajes/crear', data={
+        'fecha': dia.isoformat(), 'hora_entrada': '08:00', 'hora_salida': '15:00', 'pausa': '0'
+    })
+    assert [s.hora_entrada for s in obtener_sugerencias(user_id)] == [time(8, 0)]
+
+    fichaje = Fichaje.query.filter_by(usuario_id=user_id, es_actual=True).one()
+    auth_client.post(f'/fichajes/editar/{fichaje.id}', data={
+        'fecha': dia.isoformat(), 'hora_entrada': '10:00', 'hora_salida': '18:00',
+        'pausa': '0', 'motivo': 'Error al fichar'
+    })
+    db.session.expire_all()
+    assert [s.hora_entrada for s in obtener_sugerencias(user_id)] == [time(10, 0)]
+
+    # El recálculo completo da los mismos turnos (los pesos pueden estar
+    # normalizados a otra referencia, pero el orden es el mismo)
+    incremental = [t[:3] for t in db.session.get(SugerenciaFichaje, user_id).turnos]
+    recalcular_sugerencias([user_id])
+    db.session.commit()
+    db.session.expire_all()
+    assert [t[:3] for t in db.session.get(SugerenciaFichaje, user_id).turnos] == incremental
+
+
+def test_recalculo_por_usuario_en_bloques(test_app, employee_user, approver_user, admin_user):
+    """Con lotes de un usuario da lo mismo que de una vez, también para los que ya tenían fila."""
+    hoy = date.today()
+    for i in range(3):
+        _fichaje(employee_user.id, hoy - timedelta(days=i), time(8, 0), time(16, 0))
+        _fichaje(approver_user.id, hoy - timedelta(days=200 + i), time(6, 0), time(14, 0))
+    _fichaje(approver_user.id, hoy, time(10, 0), time(18, 0))
+    db.session.add(SugerenciaFichaje(usuario_id=admin_user.id, referencia=hoy, turnos=[[1, 2, 0, 1.0]]))
+    db.session.commit()
+
+    usuarios = [employee_user.id, approver_user.id, admin_user.id]
+    assert recalcular_sugerencias(usuarios, lote=1) == 3
+    db.session.commit()
+    db.session.expire_all()
+    en_bloques = {uid: db.session.get(SugerenciaFichaje, uid).turnos for uid in usuarios}
+    assert en_bloques[admin_user.id] == []
+    assert [t[:3] for t in en_bloques[approver_user.id]] == [[600, 1080, 0], [360, 840, 0]]
+
+    recalcular_sugerencias(usuarios)
+    db.session.commit()
+    db.session.expire_all()
+    assert {uid: db.session.get(SugerenciaFichaje, uid).turnos for uid in usuarios} == en_bloques
+
+
+def test_toggle_suma_el_tramo_cerrado(auth_client, employee_user):
+    obtener_sugerencias(employee_user.id)  # fila vacía inicial
+
+    auth_client.post('/fichajes/toggle')
+    auth_client.post('/fichajes/toggle')
+
+    db.session.expire_all()
+    assert len(db.session.get(SugerenciaFichaje, employee_user.id).turnos) == 1
+
+
+def test_relleno_perezoso_no_pisa_fila_creada_entretanto(test_app, employee_user):
+    """Si otro camino creó la fila, el relleno del primer acceso no falla ni la sobrescribe."""
+    _fichaje(employee_user.id, date.today() - timedelta(days=1), time(8, 0), time(16, 0))
+    db.session.add(SugerenciaFichaje(usuario_id=employee_user.id, referencia=date.today(),
+                                     turnos=[[540, 1020, 0, 1.0]]))
+    db.session.commit()
+
+    recalcular_sugerencias([employee_user.id], sobrescribir=False)
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(SugerenciaFichaje, employee_user.id).turnos == [[540, 1020, 0, 1.0]]
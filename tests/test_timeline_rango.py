@@ -0,0 +1,55 @@
+from datetime import date, time, timedelta
+
+from src import db
+from src.models import Fichaje
+
+
+def _fichaje(usuario_id, fecha, entrada, salida, **kwargs):
+    db.session.add(Fichaje(usuario_id=usuario_id, fecha=fecha,
+                           hora_entrada=entrada, hora_salida=salida, **kwargs))
+
+
+def test_timeline_rango_compacto(auth_client, employee_user):
+    lunes = date.today() - timedelta(days=14)
+    _fichaje(employee_user.id, lunes, time(8, 0), time(14, 30))
+    _fichaje(employee_user.id, lunes, time(15, 0), time(17, 0))
+    _fichaje(employee_user.id, lunes + timedelta(days=2), time(22, 0), time(6, 0))
+    _fichaje(employee_user.id, lunes + timedelta(days=3), time(9, 0), time(10, 0),
+             tipo_accion='eliminacion')
+    db.session.commit()
+
+    respuesta = auth_client.get(
+        f'/fichajes/api/timeline?desde={lunes}&hasta={lunes + timedelta(days=6)}'
+    )
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    assert datos['dias'] == {
+        lunes.isoformat(): [[480, 870, 0], [900, 1020, 0]],
+        # Cruza medianoche: se corta en 23:59
+        (lunes + timedelta(days=2)).isoformat(): [[1320, 1439, 0]],
+    }
+    assert datos['ahora_min'] is None
+
+    # Rango pasado y cerrado: cacheable y revalidable con ETag
+    assert 'max-age=300' in respuesta.headers['Cache-Control']
+    revalidacion = auth_client.get(
+        f'/fichajes/api/timeline?desde={lunes}&hasta={lunes + timedelta(days=6)}',
+        headers={'If-None-Match': respuesta.headers['ETag']}
+    )
+    assert revalidacion.status_code == 304
+
+
+def test_timeline_rango_con_hoy_no_cacheable(auth_client, employee_user):
+    hoy = date.today()
+    respuesta = auth_client.get(f'/fichajes/api/timeline?desde={hoy - timedelta(days=6)}&hasta={hoy}')
+    assert respuesta.status_code == 200
+    assert 'no-cache' in respuesta.headers['Cache-Control']
+    assert respuesta.get_json()['ahora_min'] is not None
+
+
+def test_timeline_rango_invalido(auth_client):
+    hoy = date.today()
+    assert auth_client.get(f'/fichajes/api/timeline?desde={hoy}').status_code == 400
+    assert auth_client.get(
+        f'/fichajes/api/timeline?desde={hoy - timedelta(days=90)}&hasta={hoy}'
+    ).status_code == 400
@@ -0,0 +1,102 @@
+from datetime import date, time, timedelta
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+from src import db
+from src.models import Fichaje, IdempotenciaFichaje
+
+
+def _abiertos(usuario_id):
+    return Fichaje.query.filter(
+        Fichaje.usuario_id == usuario_id,
+        Fichaje.es_actual == True,
+        Fichaje.hora_salida.is_(None)
+    ).count()
+
+
+def test_toggle_inicia_y_detiene(auth_client, employee_user):
+    user_id = employee_user.id
+
+    respuesta = auth_client.post('/fichajes/toggle')
+    assert respuesta.get_json()['status'] == 'started'
+    assert _abiertos(user_id) == 1
+
+    respuesta = auth_client.post('/fichajes/toggle')
+    assert respuesta.get_json()['status'] == 'stopped'
+    assert _abiertos(user_id) == 0
+    assert Fichaje.query.filter_by(usuario_id=user_id).count() == 1
+
+
+def test_toggle_stop_en_una_sentencia(auth_client, employee_user):
+    """Detener no hace SELECT previo: un único UPDATE ... RETURNING sobre fichajes."""
+    auth_client.post('/fichajes/toggle')
+
+    sentencias = []
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if 'fichajes' in statement:
+            sentencias.append(statement.split()[0].upper())
+    event.listen(db.engine, 'before_cursor_execute', _before)
+    try:
+        assert auth_client.post('/fichajes/toggle').get_json()['status'] == 'stopped'
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _before)
+
+    assert sentencias == ['UPDATE']
+
+
+def test_toggle_idempotency_key(auth_client, employee_user):
+    """Un reintento con la misma clave devuelve la respuesta original sin alternar."""
+    user_id = employee_user.id
+    cabeceras = {'Idempotency-Key': 'clave-reintento-1'}
+
+    primera = auth_client.post('/fichajes/toggle', headers=cabeceras).get_json()
+    reintento = auth_client.post('/fichajes/toggle', headers=cabeceras).get_json()
+
+    assert primera == reintento
+    assert primera['status'] == 'started'
+    assert _abiertos(user_id) == 1
+    assert IdempotenciaFichaje.query.filter_by(usuario_id=user_id).count() == 1
+
+    # Una clave nueva sí alterna
+    nueva = auth_client.post('/fichajes/toggle', headers={'Idempotency-Key': 'clave-2'})
+    assert nueva.get_json()['status'] == 'stopped'
+
+
+def test_indice_unico_fichaje_abierto(test_app, employee_user):
+    """La BBDD impide dos fichajes abiertos del mismo usuario."""
+    for hora in (time(8, 0), time(9, 0)):
+        db.session.add(Fichaje(usuario_id=employee_user.id, fecha=date.today(),
+                               hora_entrada=hora, hora_salida=None))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+    # Cerrados o eliminados no cuentan
+    db.session.add(Fichaje(usuario_id=employee_user.id, fecha=date.today(),
+                           hora_entrada=time(8, 0), hora_salida=None))
+    db.session.add(Fichaje(usuario_id=employee_user.id, fecha=date.today(),
+                           hora_entrada=time(9, 0), hora_salida=None, tipo_accion='eliminacion'))
+    db.session.commit()
+
+
+def test_toggle_con_varios_abiertos_cierra_los_antiguos_como_incidencia(auth_client, employee_user):
+    """Con el índice por usuario y día (tabla particionada) puede haber dos abiertos en fechas distintas."""
+    db.session.execute(text('DROP INDEX uq_fichaje_abierto_usuario'))
+    hoy = date.today()
+    antiguo = Fichaje(usuario_id=employee_user.id, fecha=hoy - timedelta(days=2),
+                      hora_entrada=time(9, 0), hora_salida=None)
+    reciente = Fichaje(usuario_id=employee_user.id, fecha=hoy - timedelta(days=1),
+                       hora_entrada=time(22, 0), hora_salida=None)
+    db.session.add_all([antiguo, reciente])
+    db.session.commit()
+
+    respuesta = auth_client.post('/fichajes/toggle')
+    assert respuesta.get_json()['status'] == 'stopped'
+    assert _abiertos(employee_user.id) == 0
+
+    db.session.expire_all()
+    assert antiguo.hora_salida == time(23, 59, 59)
+    assert 'CIERRE AUTOMÁTICO' in antiguo.motivo_rectificacion
+    assert reciente.hora_salida != time(23, 59, 59) and reciente.motivo_rectificacion is None
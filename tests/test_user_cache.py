@@ -0,0 +1,70 @@
+from sqlalchemy import event
+
+from src import db
+from src.models import Usuario
+from src.user_cache import obtener_usuario, invalidar_cache_usuario
+
+
+def _contar_queries(test_app):
+    """Registra las sentencias ejecutadas contra el engine principal."""
+    sentencias = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', _before)
+    return sentencias, lambda: event.remove(db.engine, 'before_cursor_execute', _before)
+
+
+def test_cache_sin_queries_en_caliente(test_app, approver_user, employee_user):
+    """Con el cache caliente, cargar el usuario y sus relaciones no toca la BBDD."""
+    approver_id, employee_id, employee_nombre = approver_user.id, employee_user.id, employee_user.nombre
+
+    # Calentar cache en una sesión limpia (como al inicio de cada petición)
+    db.session.expunge_all()
+    obtener_usuario(approver_id)
+    db.session.expunge_all()
+
+    sentencias, detener = _contar_queries(test_app)
+    try:
+        usuario = obtener_usuario(approver_id)
+        ids_a_cargo = [r.usuario_id for r in usuario.usuarios_a_cargo]
+        nombres = [r.usuario.nombre for r in usuario.usuarios_a_cargo]
+        rol = usuario.rol
+    finally:
+        detener()
+
+    assert sentencias == []
+    assert ids_a_cargo == [employee_id]
+    assert nombres == [employee_nombre]
+    assert rol == 'aprobador'
+
+
+def test_cache_invalidado_por_asignacion_aprobador(auth_admin_client, admin_user, employee_user):
+    """Asignar un aprobador desde el panel invalida el cache de ambos usuarios."""
+    admin_id, employee_id = admin_user.id, employee_user.id
+    db.session.expunge_all()
+    assert obtener_usuario(employee_id).aprobadores == []
+    db.session.expunge_all()
+
+    auth_admin_client.post('/admin/aprobadores/asignar', data={
+        'usuario_id': employee_id,
+        'aprobador_id': admin_id
+    }, follow_redirects=True)
+
+    db.session.expunge_all()
+    usuario = obtener_usuario(employee_id)
+    assert [r.aprobador_id for r in usuario.aprobadores] == [admin_id]
+
+
+def test_cache_cambios_persisten_tras_merge(test_app, employee_user):
+    """El usuario devuelto está adjunto a la sesión: sus cambios se guardan."""
+    user_id = employee_user.id
+    db.session.expunge_all()
+    usuario = obtener_usuario(user_id)
+    usuario.nombre = 'Nombre Cambiado'
+    db.session.commit()
+    invalidar_cache_usuario(user_id)
+
+    db.session.expunge_all()
+    assert db.session.get(Usuario, user_id).nombre == 'Nombre Cambiado'
@@ -0,0 +1,56 @@
+from werkzeug.security import generate_password_hash
+
+from src import db
+from src.models import Usuario, Aprobador
+
+
+def _usuarios(n, prefijo='Persona', rol='empleado'):
+    usuarios = [Usuario(nombre=f'{prefijo} {i:03d}', email=f'{prefijo.lower()}{i}@test.com',
+                        password=generate_password_hash('x'), rol=rol) for i in range(n)]
+    db.session.add_all(usuarios)
+    db.session.commit()
+    return usuarios
+
+
+def test_buscar_paginado_y_por_rol(auth_admin_client):
+    _usuarios(25)
+    _usuarios(2, prefijo='Personal Jefe', rol='aprobador')
+
+    primera = auth_admin_client.get('/admin/api/usuarios/buscar?q=persona').get_json()
+    segunda = auth_admin_client.get('/admin/api/usuarios/buscar?q=persona&page=2').get_json()
+    assert len(primera['results']) == 20 and primera['more'] is True
+    assert len(segunda['results']) == 7 and segunda['more'] is False
+    assert not {r['id'] for r in primera['results']} & {r['id'] for r in segunda['results']}
+
+    jefes = auth_admin_client.get('/admin/api/usuarios/buscar?q=persona&rol=aprobador').get_json()
+    assert [r['text'] for r in jefes['results']] == [
+        'Personal Jefe 000 (personal jefe0@test.com)', 'Personal Jefe 001 (personal jefe1@test.com)'
+    ]
+
+
+def test_formularios_no_cargan_usuarios(auth_admin_client, absence_type):
+    _usuarios(3, prefijo='Oculto')
+    for url in ('/vacaciones/solicitar', '/bajas/solicitar'):
+        html = auth_admin_client.get(url).get_data(as_text=True)
+        assert 'usuario_search_input' in html
+        assert 'Oculto 001' not in html
+
+
+def test_aprobadores_paginado_y_filtrado(auth_admin_client, admin_user):
+    empleados = _usuarios(60, prefijo='Empleado')
+    jefe, = _usuarios(1, prefijo='Jefe', rol='aprobador')
+    db.session.add_all(Aprobador(usuario_id=e.id, aprobador_id=jefe.id) for e in empleados)
+    db.session.commit()
+
+    html = auth_admin_client.get('/admin/aprobadores').get_data(as_text=True)
+    assert 'Empleado 049' in html and 'Empleado 050' not in html
+    assert 'de 60 relaciones' in html
+    assert 'Empleado 050' in auth_admin_client.get('/admin/aprobadores?page=2').get_data(as_text=True)
+
+    html = auth_admin_client.get(f'/admin/aprobadores?usuario_id={empleados[7].id}').get_data(as_text=True)
+    assert 'Empleado 007' in html and 'Empleado 008' not in html
+
+    # Sin elegir de la lista no hay id: aviso en vez de error
+    respuesta = auth_admin_client.post('/admin/aprobadores/asignar',
+                                       data={'usuario_id': '', 'aprobador_id': str(jefe.id)})
+    assert respuesta.status_code == 302
@@ -0,0 +1,55 @@
+from werkzeug.security import generate_password_hash
+
+from src import db
+from src.models import Usuario
+from src.user_search import buscar_usuarios, normalizar
+
+
+def _usuario(nombre, email, activo=True):
+    u = Usuario(nombre=nombre, email=email, password=generate_password_hash('x'),
+                rol='empleado', activo=activo)
+    db.session.add(u)
+    return u
+
+
+def test_normalizar_quita_acentos():
+    assert normalizar('  José  NÚÑEZ ') == 'jose nunez'
+
+
+def test_busqueda_sin_acentos_y_ordenada(test_app):
+    _usuario('Ángela Martín', 'amartin@test.com')
+    _usuario('María Ángeles Ruiz', 'mruiz@test.com')
+    _usuario('Pedro Sanángel', 'psan@test.com')
+    _usuario('Ángel Baja', 'abaja@test.com', activo=False)
+    db.session.commit()
+
+    nombres = [nombre for _, nombre, _ in buscar_usuarios('angel')]
+    # Prefijo del nombre > prefijo de palabra > subcadena; inactivos fuera
+    assert nombres == ['Ángela Martín', 'María Ángeles Ruiz', 'Pedro Sanángel']
+
+    # Varios términos (en cualquier orden) y búsqueda por email
+    assert [n for _, n, _ in buscar_usuarios('ruiz maria')] == ['María Ángeles Ruiz']
+    assert [n for _, n, _ in buscar_usuarios('psan@')] == ['Pedro Sanángel']
+    assert buscar_usuarios('100%') == []
+
+
+def test_indice_se_invalida_al_cambiar_usuarios(test_app):
+    usuario = _usuario('Lucía Gómez', 'lucia@test.com')
+    db.session.commit()
+    assert [n for _, n, _ in buscar_usuarios('gomez')] == ['Lucía Gómez']
+
+    usuario.nombre = 'Lucía Pérez'
+    db.session.commit()
+    assert buscar_usuarios('gomez') == []
+    assert [n for _, n, _ in buscar_usuarios('perez')] == ['Lucía Pérez']
+
+    _usuario('Raúl Pérez', 'rperez@test.com')
+    db.session.commit()
+    assert len(buscar_usuarios('perez')) == 2
+
+
+def test_endpoint_buscar(auth_admin_client, employee_user):
+    datos = auth_admin_client.get('/admin/api/usuarios/buscar?q=emplo').get_json()
+    assert datos['results'] == [{'id': employee_user.id, 'text': 'Employee Test (employee@test.com)'}]
+    assert datos['more'] is False
+    assert auth_admin_client.get('/admin/api/usuarios/buscar?q=e').get_json()['results'] == []